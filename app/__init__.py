@@ -37,13 +37,76 @@ MONGO_USERNAME = config.get('mongo', 'username')
 MONGO_PASSWORD = config.get('mongo', 'password')
 MONGO_DB_NAME = config.get('mongo', 'db_name', fallback='firefly_sms_parser')
 MONGO_DB_AUTH_SOURCE = config.get('mongo', 'auth_source')
+MONGO_MAX_POOL_SIZE = config.getint('mongo', 'max_pool_size', fallback=20)
+MONGO_MIN_POOL_SIZE = config.getint('mongo', 'min_pool_size', fallback=0)
+MONGO_MAX_IDLE_TIME_MS = config.getint('mongo', 'max_idle_time_ms', fallback=300000)
+MONGO_EXECUTOR_WORKERS = config.getint('mongo', 'executor_workers', fallback=8)
 
 # Firefly Config
 FIREFLY_BASE_URL = config.get('firefly', 'url')
 FIREFLY_API_KEY = config.get('firefly', 'api_key')
 FIREFLY_DEFAULT_ACCOUNT_ID = config.getint('firefly', 'default_account_id')
+FIREFLY_POOL_SIZE = config.getint('firefly', 'pool_size', fallback=10)
+FIREFLY_CONNECT_TIMEOUT = config.getfloat('firefly', 'connect_timeout', fallback=5)
+FIREFLY_READ_TIMEOUT = config.getfloat('firefly', 'read_timeout', fallback=30)
+FIREFLY_MAX_RETRIES = config.getint('firefly', 'max_retries', fallback=2)
+FIREFLY_PAGE_SIZE = config.getint('firefly', 'page_size', fallback=50)
+FIREFLY_PAGE_CONCURRENCY = config.getint('firefly', 'page_concurrency', fallback=4)
+REFERENCE_CACHE_ENABLED = config.getboolean('firefly', 'reference_cache_enabled', fallback=True)
+REFERENCE_CACHE_STALE_SECONDS = config.getfloat('firefly', 'reference_cache_stale_seconds', fallback=3600)
+REFERENCE_TTL_BUDGETS = config.getfloat('firefly', 'reference_ttl_budgets', fallback=600)
+REFERENCE_TTL_CATEGORIES = config.getfloat('firefly', 'reference_ttl_categories', fallback=600)
+REFERENCE_TTL_BILLS = config.getfloat('firefly', 'reference_ttl_bills', fallback=600)
+REFERENCE_TTL_ACCOUNTS = config.getfloat('firefly', 'reference_ttl_accounts', fallback=300)
+TRANSACTION_CACHE_TTL_SECONDS = config.getfloat('firefly', 'transaction_cache_ttl_seconds', fallback=120)
+TRANSACTION_CACHE_MAX_ENTRIES = config.getint('firefly', 'transaction_cache_max_entries', fallback=256)
+
+# Transaction mirror Config
+MIRROR_ENABLED = config.getboolean('mirror', 'enabled', fallback=True)
+MIRROR_SYNC_INTERVAL_MINUTES = config.getfloat('mirror', 'sync_interval_minutes', fallback=10)
+MIRROR_FULL_SYNC_HOURS = config.getfloat('mirror', 'full_sync_hours', fallback=24)
+
+# Ingestion queue Config
+QUEUE_ENABLED = config.getboolean('queue', 'enabled', fallback=True)
+QUEUE_WORKERS = config.getint('queue', 'workers', fallback=10)
+QUEUE_MAX_ATTEMPTS = config.getint('queue', 'max_attempts', fallback=5)
+QUEUE_RETRY_BASE_SECONDS = config.getfloat('queue', 'retry_base_seconds', fallback=30)
+QUEUE_RETRY_MAX_SECONDS = config.getfloat('queue', 'retry_max_seconds', fallback=1800)
+QUEUE_LEASE_SECONDS = config.getfloat('queue', 'lease_seconds', fallback=300)
+QUEUE_POLL_SECONDS = config.getfloat('queue', 'poll_seconds', fallback=5)
+QUEUE_DONE_RETENTION_DAYS = config.getfloat('queue', 'done_retention_days', fallback=7)
+
+# SMS parser Config
+LEARNED_TEMPLATES_ENABLED = config.getboolean('parser', 'learned_templates_enabled', fallback=True)
+LEARNED_TEMPLATE_PROMOTE_AFTER = config.getint('parser', 'learned_template_promote_after', fallback=2)
+LEARNED_TEMPLATE_EVICT_AFTER = config.getint('parser', 'learned_template_evict_after', fallback=2)
+LEARNED_TEMPLATE_TTL_DAYS = config.getint('parser', 'learned_template_ttl_days', fallback=90)
+LEARNED_TEMPLATE_VERIFY_RATE = config.getfloat('parser', 'learned_template_verify_rate', fallback=0.05)
+VENDOR_FUZZY_MATCH_ENABLED = config.getboolean('parser', 'vendor_fuzzy_match_enabled', fallback=True)
+VENDOR_FUZZY_AUTO_ACCEPT_SCORE = config.getfloat('parser', 'vendor_fuzzy_auto_accept_score', fallback=0.85)
+VENDOR_FUZZY_SUGGEST_SCORE = config.getfloat('parser', 'vendor_fuzzy_suggest_score', fallback=0.4)
+VENDOR_PROFILE_AUTO_BUDGET = config.getboolean('parser', 'vendor_profile_auto_budget', fallback=False)
 
 GROQ_API_KEY = config.get('ai', 'groq_api_key')
+GROQ_POOL_SIZE = config.getint('ai', 'groq_pool_size', fallback=4)
+GROQ_MAX_CONCURRENCY = config.getint('ai', 'groq_max_concurrency', fallback=4)
+GROQ_CONNECT_TIMEOUT = config.getfloat('ai', 'groq_connect_timeout', fallback=5)
+GROQ_READ_TIMEOUT = config.getfloat('ai', 'groq_read_timeout', fallback=60)
+GROQ_MAX_RETRIES = config.getint('ai', 'groq_max_retries', fallback=2)
+RECEIPT_PREPROCESSING_ENABLED = config.getboolean('ai', 'receipt_preprocessing_enabled', fallback=True)
+RECEIPT_MAX_DIMENSION = config.getint('ai', 'receipt_max_dimension', fallback=1600)
+RECEIPT_JPEG_QUALITY = config.getint('ai', 'receipt_jpeg_quality', fallback=80)
+RECEIPT_GRAYSCALE = config.getboolean('ai', 'receipt_grayscale', fallback=True)
+RECEIPT_IMAGE_DETAIL = config.get('ai', 'receipt_image_detail', fallback='high')
+RECEIPT_KEEP_ON_DISK = config.getboolean('ai', 'receipt_keep_on_disk', fallback=False)
+RECEIPT_DIRECTORY = config.get('ai', 'receipt_directory', fallback='downloads/receipts')
+RECEIPT_RETENTION_DAYS = config.getfloat('ai', 'receipt_retention_days', fallback=7)
+SMS_BATCH_ENABLED = config.getboolean('ai', 'sms_batch_enabled', fallback=True)
+SMS_BATCH_WINDOW_SECONDS = config.getfloat('ai', 'sms_batch_window_seconds', fallback=1.5)
+SMS_BATCH_MAX_SIZE = config.getint('ai', 'sms_batch_max_size', fallback=10)
+EXTRACTION_CACHE_ENABLED = config.getboolean('ai', 'extraction_cache_enabled', fallback=True)
+EXTRACTION_CACHE_TTL_DAYS = config.getint('ai', 'extraction_cache_ttl_days', fallback=30)
+EXTRACTION_CACHE_MAX_ENTRIES = config.getint('ai', 'extraction_cache_max_entries', fallback=5000)
 
 FireflyParserBot = FireflyParserBot(__version__, api_id=TELEGRAM_API_ID, api_hash=TELEGRAM_API_HASH,
                                     bot_token=TELEGRAM_BOT_TOKEN)
@@ -1,14 +1,50 @@
+import threading
+
 import pymongo
 
-from app import MONGO_URL, MONGO_USERNAME, MONGO_PASSWORD, MONGO_DB_NAME
+from app import (
+    MONGO_URL,
+    MONGO_USERNAME,
+    MONGO_PASSWORD,
+    MONGO_DB_NAME,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_MAX_IDLE_TIME_MS,
+)
+
+_client: pymongo.MongoClient | None = None
+_client_lock = threading.Lock()
+
+
+def client() -> pymongo.MongoClient:
+    """Lazily created, process-wide MongoDB client with a shared connection pool"""
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = pymongo.MongoClient(
+                    MONGO_URL,
+                    username=MONGO_USERNAME,
+                    password=MONGO_PASSWORD,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                )
+
+    return _client
 
 
 def database():
-    """Created Database connection"""
-    client = pymongo.MongoClient(
-        MONGO_URL,
-        username=MONGO_USERNAME,
-        password=MONGO_PASSWORD
-    )
-    db = client[MONGO_DB_NAME]
-    return db
+    """Database handle on the shared MongoDB client"""
+    return client()[MONGO_DB_NAME]
+
+
+def close_database():
+    """Close the shared MongoDB client and its connection pool"""
+    global _client
+
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
@@ -0,0 +1,78 @@
+from datetime import datetime, timezone
+from typing import Union
+import logging
+
+from pymongo import ASCENDING
+
+from app import EXTRACTION_CACHE_TTL_DAYS, EXTRACTION_CACHE_MAX_ENTRIES
+from app.database import database
+
+LOGS = logging.getLogger(__name__)
+
+
+class ExtractionCacheDB:
+    """
+    Content-addressed cache of LLM extraction results.
+
+    Entries are keyed by a hash of the normalized input and the prompt version, expire
+    through a TTL index on created_at and are trimmed to EXTRACTION_CACHE_MAX_ENTRIES,
+    least recently used first.
+    """
+
+    def __init__(self):
+        self.cache = database()["extraction_cache"]
+
+    def ensure_indexes(self):
+        """
+        Creates the TTL and recency indexes. Safe to call on every startup.
+        """
+        self.cache.create_index(
+            [("created_at", ASCENDING)],
+            expireAfterSeconds=EXTRACTION_CACHE_TTL_DAYS * 24 * 60 * 60
+        )
+        self.cache.create_index([("last_used_at", ASCENDING)])
+
+    def get(self, key: str) -> Union[dict, None]:
+        """
+        Returns the cached entry for a key and marks it as used.
+        """
+        return self.cache.find_one_and_update(
+            {"_id": key},
+            {"$inc": {"hits": 1}, "$set": {"last_used_at": datetime.now(timezone.utc)}}
+        )
+
+    def put(self, key: str, kind: str, details: dict, completion_data: Union[str, None]):
+        """
+        Stores an extraction result, then trims the cache to its size bound.
+        """
+        now = datetime.now(timezone.utc)
+        self.cache.replace_one(
+            {"_id": key},
+            {
+                "kind": kind,
+                "details": details,
+                "completion_data": completion_data,
+                "hits": 0,
+                "created_at": now,
+                "last_used_at": now,
+            },
+            upsert=True
+        )
+        self.trim(EXTRACTION_CACHE_MAX_ENTRIES)
+
+    def trim(self, max_entries: int) -> int:
+        """
+        Deletes the least recently used entries beyond max_entries.
+
+        Returns:
+            The number of deleted entries
+        """
+        excess = self.cache.estimated_document_count() - max_entries
+        if excess <= 0:
+            return 0
+
+        stale_ids = [
+            document["_id"]
+            for document in self.cache.find({}, {"_id": 1}).sort("last_used_at", ASCENDING).limit(excess)
+        ]
+        return self.cache.delete_many({"_id": {"$in": stale_ids}}).deleted_count
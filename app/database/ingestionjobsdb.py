@@ -0,0 +1,165 @@
+from datetime import datetime, timedelta, timezone
+from typing import Union
+import logging
+
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+
+from app import QUEUE_DONE_RETENTION_DAYS
+from app.database import database
+
+LOGS = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+DEAD = "dead"
+
+
+class IngestionJobsDB:
+    """
+    Durable queue of incoming messages waiting to become Firefly transactions.
+
+    A job is claimed by setting it to running with a lease; a worker that dies mid-job lets
+    the lease expire so the job is picked up again. Finished jobs are removed through a TTL
+    index, while dead-lettered jobs are kept for inspection.
+    """
+
+    def __init__(self):
+        self.jobs = database()["ingestion_jobs"]
+
+    def ensure_indexes(self):
+        """
+        Creates the claim and TTL indexes. Safe to call on every startup.
+        """
+        self.jobs.create_index([("status", ASCENDING), ("next_attempt_at", ASCENDING)])
+        self.jobs.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+
+    def enqueue(self, kind: str, payload: dict, chat_id: int, message_id: int,
+                ack_message_id: Union[int, None] = None) -> ObjectId:
+        """
+        Adds a job that is due immediately.
+
+        Returns:
+            The job ID
+        """
+        now = datetime.now(timezone.utc)
+        return self.jobs.insert_one({
+            "kind": kind,
+            "payload": payload,
+            "chat_id": chat_id,
+            "message_id": message_id,
+            "ack_message_id": ack_message_id,
+            "status": QUEUED,
+            "attempts": 0,
+            "next_attempt_at": now,
+            "locked_until": None,
+            "last_error": None,
+            "created_at": now,
+            "updated_at": now,
+        }).inserted_id
+
+    def claim(self, lease_seconds: float, max_attempts: int) -> Union[dict, None]:
+        """
+        Takes the oldest due job, or a running job whose lease has expired, and leases it.
+        A job whose lease expired on its last allowed attempt is left for dead_letter_abandoned.
+
+        Returns:
+            The claimed job with its attempts already incremented, or None if nothing is due
+        """
+        now = datetime.now(timezone.utc)
+        return self.jobs.find_one_and_update(
+            {"$or": [
+                {"status": QUEUED, "next_attempt_at": {"$lte": now}},
+                {"status": RUNNING, "locked_until": {"$lt": now}, "attempts": {"$lt": max_attempts}},
+            ]},
+            {
+                "$set": {
+                    "status": RUNNING,
+                    "locked_until": now + timedelta(seconds=lease_seconds),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("next_attempt_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def dead_letter_abandoned(self, max_attempts: int) -> Union[dict, None]:
+        """
+        Dead-letters a job whose lease expired on its last allowed attempt, i.e. the worker died
+        or hung every time it ran it, so a job that crashes its worker is not claimed forever.
+
+        Returns:
+            The dead-lettered job, or None if there is none
+        """
+        now = datetime.now(timezone.utc)
+        return self.jobs.find_one_and_update(
+            {"status": RUNNING, "locked_until": {"$lt": now}, "attempts": {"$gte": max_attempts}},
+            {"$set": {
+                "status": DEAD,
+                "last_error": f"Lease expired on attempt {max_attempts}; the worker died or hung",
+                "locked_until": None,
+                "updated_at": now,
+            }},
+            return_document=ReturnDocument.AFTER
+        )
+
+    def renew_lease(self, job_id: ObjectId, attempts: int, lease_seconds: float) -> bool:
+        """
+        Extends the lease of a job that is still running the given attempt.
+
+        Returns:
+            False if the job is no longer held by that attempt (finished, or claimed again after its lease expired)
+        """
+        now = datetime.now(timezone.utc)
+        result = self.jobs.update_one(
+            {"_id": job_id, "status": RUNNING, "attempts": attempts},
+            {"$set": {"locked_until": now + timedelta(seconds=lease_seconds), "updated_at": now}}
+        )
+        return result.matched_count == 1
+
+    def complete(self, job_id: ObjectId, result: Union[dict, None] = None):
+        now = datetime.now(timezone.utc)
+        self.jobs.update_one(
+            {"_id": job_id},
+            {"$set": {
+                "status": DONE,
+                "result": result,
+                "locked_until": None,
+                "updated_at": now,
+                "expires_at": now + timedelta(days=QUEUE_DONE_RETENTION_DAYS),
+            }}
+        )
+
+    def retry(self, job_id: ObjectId, error: str, next_attempt_at: datetime):
+        self.jobs.update_one(
+            {"_id": job_id},
+            {"$set": {
+                "status": QUEUED,
+                "last_error": error,
+                "next_attempt_at": next_attempt_at,
+                "locked_until": None,
+                "updated_at": datetime.now(timezone.utc),
+            }}
+        )
+
+    def dead_letter(self, job_id: ObjectId, error: str):
+        self.jobs.update_one(
+            {"_id": job_id},
+            {"$set": {
+                "status": DEAD,
+                "last_error": error,
+                "locked_until": None,
+                "updated_at": datetime.now(timezone.utc),
+            }}
+        )
+
+    def count_by_status(self) -> dict:
+        """
+        Returns the number of jobs per status.
+        """
+        return {
+            document["_id"]: document["count"]
+            for document in self.jobs.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}])
+        }
@@ -0,0 +1,30 @@
+from app.database import database
+
+
+class ParserStatsDB:
+    """
+    Counters for how SMS messages were parsed (local template hits, misses and LLM fallbacks).
+    """
+
+    def __init__(self):
+        self.stats = database()["parser_stats"]
+
+    def increment(self, *counters: str):
+        """
+        Increments one or more named counters by one.
+        """
+        if not counters:
+            return
+        self.stats.update_one(
+            {"_id": "sms"},
+            {"$inc": {counter: 1 for counter in counters}},
+            upsert=True
+        )
+
+    def get_stats(self) -> dict:
+        """
+        Returns all counters.
+        """
+        stats = self.stats.find_one({"_id": "sms"}) or {}
+        stats.pop("_id", None)
+        return stats
@@ -0,0 +1,118 @@
+from datetime import datetime, timezone
+from typing import Union
+import logging
+
+from pymongo import ASCENDING, ReturnDocument
+
+from app import LEARNED_TEMPLATE_TTL_DAYS
+from app.database import database
+
+LOGS = logging.getLogger(__name__)
+
+CANDIDATE = "candidate"
+ACTIVE = "active"
+
+
+class SmsTemplatesDB:
+    """
+    SMS templates learned from successful LLM extractions.
+
+    A template starts as a candidate and only becomes active, i.e. used to skip the LLM,
+    once later LLM extractions have confirmed its output. Templates that disagree with the
+    LLM or produce unusable values are evicted, and unused ones expire through a TTL index.
+    """
+
+    def __init__(self):
+        self.templates = database()["sms_templates"]
+
+    def ensure_indexes(self):
+        """
+        Creates the status index and the TTL index on last_seen_at. Safe to call on every startup.
+        """
+        self.templates.create_index([("status", ASCENDING)])
+        self.templates.create_index(
+            [("last_seen_at", ASCENDING)],
+            expireAfterSeconds=LEARNED_TEMPLATE_TTL_DAYS * 24 * 60 * 60
+        )
+
+    def add_candidate(self, template_id: str, pattern: str, example: str) -> bool:
+        """
+        Stores a newly induced pattern as a candidate, unless it is already known.
+
+        Returns:
+            True if the pattern was new
+        """
+        now = datetime.now(timezone.utc)
+        result = self.templates.update_one(
+            {"_id": template_id},
+            {
+                "$setOnInsert": {
+                    "pattern": pattern,
+                    "status": CANDIDATE,
+                    "example": example,
+                    "hits": 0,
+                    "confirmations": 0,
+                    "rejections": 0,
+                    "failures": 0,
+                    "created_at": now,
+                },
+                "$set": {"last_seen_at": now},
+            },
+            upsert=True
+        )
+        return result.upserted_id is not None
+
+    def get_templates(self, status: Union[str, None] = None) -> list[dict]:
+        """
+        Returns learned templates, optionally filtered by status, most used first.
+        """
+        filter_ = {"status": status} if status else {}
+        return list(self.templates.find(filter_).sort("hits", -1))
+
+    def record_hit(self, template_id: str):
+        self.templates.update_one(
+            {"_id": template_id},
+            {"$inc": {"hits": 1}, "$set": {"last_seen_at": datetime.now(timezone.utc)}}
+        )
+
+    def record_confirmation(self, template_id: str) -> dict:
+        """
+        Counts an LLM extraction that agreed with the template.
+
+        Returns:
+            The updated template document
+        """
+        return self.templates.find_one_and_update(
+            {"_id": template_id},
+            {"$inc": {"confirmations": 1}, "$set": {"last_seen_at": datetime.now(timezone.utc)}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    def record_rejection(self, template_id: str) -> dict:
+        """
+        Counts an LLM extraction that disagreed with the template.
+        """
+        return self.templates.find_one_and_update(
+            {"_id": template_id},
+            {"$inc": {"rejections": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    def record_failure(self, template_id: str) -> dict:
+        """
+        Counts a match whose values could not be used.
+        """
+        return self.templates.find_one_and_update(
+            {"_id": template_id},
+            {"$inc": {"failures": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    def promote(self, template_id: str):
+        self.templates.update_one(
+            {"_id": template_id},
+            {"$set": {"status": ACTIVE, "promoted_at": datetime.now(timezone.utc)}}
+        )
+
+    def evict(self, template_id: str):
+        return self.templates.delete_one({"_id": template_id})
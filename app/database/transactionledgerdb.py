@@ -0,0 +1,171 @@
+from datetime import datetime, timedelta, timezone
+from typing import Union
+import hashlib
+import logging
+
+from bson import ObjectId
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+from app.database import database
+
+LOGS = logging.getLogger(__name__)
+
+PENDING = "pending"
+CREATED = "created"
+
+# A reservation not completed within this time is assumed abandoned (e.g. the bot crashed mid-POST)
+PENDING_TIMEOUT = timedelta(minutes=10)
+
+
+class TransactionLedgerDB:
+    """
+    Idempotency ledger of transactions created by the bot.
+
+    Every transaction is reserved under its (reference_no, approval_code, amount, date) key
+    and a hash of the raw message before it is posted to Firefly, so a forwarded duplicate or
+    a retry finds the existing transaction instead of creating a second one.
+
+    A reservation whose POST may have reached Firefly (e.g. a read timeout) is marked uncertain
+    rather than released. Whoever takes it over next must look the transaction up by its
+    external ID before posting again.
+    """
+
+    def __init__(self):
+        self.ledger = database()["transaction_ledger"]
+
+    def ensure_indexes(self):
+        """
+        Creates the unique idempotency indexes. Safe to call on every startup.
+        """
+        self.ledger.create_index(
+            [("reference_no", ASCENDING), ("approval_code", ASCENDING), ("amount", ASCENDING), ("date", ASCENDING)],
+            unique=True
+        )
+        self.ledger.create_index(
+            [("raw_hash", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"raw_hash": {"$type": "string"}}
+        )
+
+    @staticmethod
+    def raw_hash(raw: Union[str, bytes]) -> str:
+        """
+        Hashes a raw message (whitespace-normalized text or image bytes).
+        """
+        if isinstance(raw, str):
+            raw = ' '.join(raw.split()).encode('utf-8')
+        return hashlib.sha256(raw).hexdigest()
+
+    @staticmethod
+    def key_fields(reference_no, approval_code, amount, date) -> dict:
+        """
+        Normalizes the idempotency key so the same transaction always produces the same key.
+        """
+        return {
+            "reference_no": str(reference_no or '').strip().upper(),
+            "approval_code": str(approval_code or '').strip().upper(),
+            "amount": round(float(str(amount).replace(',', '')), 2),
+            "date": str(date or '').strip(),
+        }
+
+    @staticmethod
+    def external_id(reservation_id: ObjectId) -> str:
+        """
+        The external ID a reserved transaction is created with in Firefly, so a later attempt
+        can find it when it is unknown whether an earlier POST succeeded.
+        """
+        return f"ledger-{reservation_id}"
+
+    @staticmethod
+    def can_take_over(entry: dict, now: Union[datetime, None] = None) -> bool:
+        """
+        Whether a ledger entry is a reservation that the next attempt may take over: an uncertain
+        one, or one whose owner never completed or released it within PENDING_TIMEOUT.
+        """
+        if entry["status"] != PENDING:
+            return False
+        updated_at = entry["updated_at"]
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        return bool(entry.get("uncertain")) or (now or datetime.now(timezone.utc)) - updated_at > PENDING_TIMEOUT
+
+    def find_by_raw_hash(self, raw_hash: str) -> Union[dict, None]:
+        return self.ledger.find_one({"raw_hash": raw_hash})
+
+    def reserve(self, key: dict, raw_hash: Union[str, None] = None) -> tuple[bool, dict]:
+        """
+        Reserves a transaction before it is posted to Firefly.
+
+        Returns:
+            (True, reservation) if the caller may create the transaction, or (False, existing entry)
+            if it was already created or is being created
+        """
+        now = datetime.now(timezone.utc)
+        document = {**key, "status": PENDING, "transaction_id": None, "created_at": now, "updated_at": now}
+        if raw_hash:
+            document["raw_hash"] = raw_hash
+
+        try:
+            document["_id"] = self.ledger.insert_one(document).inserted_id
+            return True, document
+        except DuplicateKeyError:
+            pass
+
+        existing_filter = {"$or": [key, {"raw_hash": raw_hash}]} if raw_hash else key
+        existing = self.ledger.find_one(existing_filter)
+        if existing is None:
+            # The conflicting entry was released in the meantime
+            return self.reserve(key, raw_hash)
+
+        # Take over a reservation whose owner gave up on it or never completed or released it
+        if self.can_take_over(existing, now):
+            taken_over = self.ledger.find_one_and_update(
+                {"_id": existing["_id"], "status": PENDING, "updated_at": existing["updated_at"]},
+                {"$set": {"updated_at": now, "uncertain": False}}
+            )
+            if taken_over is not None:
+                LOGS.warning(f"Taking over ledger reservation {existing['_id']}")
+                # The previous owner may have created the transaction before it stopped
+                taken_over["taken_over"] = True
+                return True, taken_over
+
+        return False, existing
+
+    def complete(self, reservation_id: ObjectId, transaction_id: Union[str, None]):
+        """
+        Marks a reservation as created. The transaction ID is None when Firefly created the
+        transaction but its ID could not be read; the entry still blocks a second creation.
+        """
+        if transaction_id is not None:
+            transaction_id = str(transaction_id)
+        self.ledger.update_one(
+            {"_id": reservation_id},
+            {"$set": {"status": CREATED, "transaction_id": transaction_id, "updated_at": datetime.now(timezone.utc)}}
+        )
+
+    def mark_uncertain(self, reservation_id: ObjectId):
+        """
+        Keeps a reservation whose POST may or may not have reached Firefly, and lets the next
+        attempt take it over at once to look the transaction up before posting again.
+        """
+        self.ledger.update_one(
+            {"_id": reservation_id, "status": PENDING},
+            {"$set": {"uncertain": True, "updated_at": datetime.now(timezone.utc)}}
+        )
+
+    def drop_created(self, entry_id: ObjectId) -> bool:
+        """
+        Drops a created entry whose transaction no longer exists in Firefly (e.g. it was deleted
+        in the UI), so the same message can be recorded again.
+
+        Returns:
+            Whether the entry was dropped
+        """
+        return self.ledger.delete_one({"_id": entry_id, "status": CREATED}).deleted_count == 1
+
+    def release(self, reservation_id: ObjectId):
+        """
+        Drops a reservation whose transaction could not be created, so a retry can reserve it again.
+        """
+        self.ledger.delete_one({"_id": reservation_id, "status": PENDING})
@@ -0,0 +1,181 @@
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, Union
+import itertools
+import logging
+
+from pymongo import ASCENDING, DESCENDING, DeleteMany, ReplaceOne
+
+from app.database import database
+
+LOGS = logging.getLogger(__name__)
+
+MIRROR_STATE_ID = "transactions"
+
+
+class TransactionsDB:
+    """
+    Local mirror of Firefly transactions.
+
+    Every split (journal) of a Firefly transaction group is stored as its own document,
+    keyed by "<group_id>:<journal_id>", so date, destination and currency queries are
+    plain indexed reads.
+    """
+
+    def __init__(self):
+        db = database()
+        self.transactions = db["transactions"]
+        self.mirror_state = db["mirror_state"]
+
+    def ensure_indexes(self):
+        """
+        Creates the indexes used by mirror reads. Safe to call on every startup.
+        """
+        self.transactions.create_index([("day", DESCENDING)])
+        self.transactions.create_index([("destination_id", ASCENDING), ("date", DESCENDING)])
+        self.transactions.create_index([("foreign_currency_code", ASCENDING), ("day", DESCENDING)])
+        self.transactions.create_index([("group_id", ASCENDING)])
+        self.transactions.create_index([("synced_at", ASCENDING)])
+
+    @staticmethod
+    def split_documents(group: dict, synced_at: datetime) -> list[dict]:
+        """
+        Flattens a Firefly transaction group into one mirror document per split.
+        """
+        group_id = str(group['id'])
+        attributes = group.get('attributes', {})
+        documents = []
+
+        for split in attributes.get('transactions', []):
+            journal_id = str(split.get('transaction_journal_id'))
+            date = split.get('date') or ''
+            documents.append({
+                "_id": f"{group_id}:{journal_id}",
+                "group_id": group_id,
+                "journal_id": journal_id,
+                "type": split.get('type'),
+                "date": date,
+                "day": date[:10],
+                "description": split.get('description'),
+                "amount": _to_float(split.get('amount')),
+                "currency_code": split.get('currency_code'),
+                "foreign_amount": _to_float(split.get('foreign_amount')),
+                "foreign_currency_code": split.get('foreign_currency_code'),
+                "source_id": _to_str(split.get('source_id')),
+                "source_name": split.get('source_name'),
+                "destination_id": _to_str(split.get('destination_id')),
+                "destination_name": split.get('destination_name'),
+                "category_id": _to_str(split.get('category_id')),
+                "budget_id": _to_str(split.get('budget_id')),
+                "bill_id": _to_str(split.get('bill_id')),
+                "tags": split.get('tags') or [],
+                "updated_at": attributes.get('updated_at'),
+                "synced_at": synced_at,
+            })
+
+        return documents
+
+    def upsert_groups(self, groups: Iterable[dict], synced_at: Union[datetime, None] = None) -> int:
+        """
+        Writes Firefly transaction groups to the mirror, replacing any previous version and
+        dropping splits that no longer exist in a group.
+
+        Returns:
+            The number of groups written
+        """
+        synced_at = synced_at or datetime.now(timezone.utc)
+        operations = []
+        group_count = 0
+
+        for group in groups:
+            documents = self.split_documents(group, synced_at)
+            group_count += 1
+            for document in documents:
+                operations.append(ReplaceOne({"_id": document["_id"]}, document, upsert=True))
+            operations.append(DeleteMany({
+                "group_id": str(group['id']),
+                "_id": {"$nin": [document["_id"] for document in documents]}
+            }))
+
+        if operations:
+            self.transactions.bulk_write(operations, ordered=False)
+
+        return group_count
+
+    def delete_group(self, group_id: str):
+        """
+        Removes a transaction group from the mirror.
+        """
+        return self.transactions.delete_many({"group_id": str(group_id)})
+
+    def prune_not_synced_since(self, synced_at: datetime) -> list[str]:
+        """
+        Deletes splits that were not seen by a full sync, i.e. transactions deleted in Firefly.
+
+        Returns:
+            The IDs ("<group id>:<journal id>") of the deleted splits
+        """
+        filter_ = {"synced_at": {"$lt": synced_at}}
+        split_ids = [document["_id"] for document in self.transactions.find(filter_, {"_id": 1})]
+        if split_ids:
+            self.transactions.delete_many({"_id": {"$in": split_ids}, **filter_})
+        return split_ids
+
+    def find_foreign_transactions(self, start_day: str, end_day: str,
+                                  currency: Union[str, None] = None) -> Iterator[dict]:
+        """
+        Streams splits with a foreign amount between two days (YYYY-MM-DD, inclusive), newest first.
+        """
+        filter_ = {
+            "day": {"$gte": start_day, "$lte": end_day},
+            "foreign_currency_code": currency if currency else {"$nin": [None, ""]},
+            "foreign_amount": {"$nin": [None, 0]},
+        }
+        return self.transactions.find(filter_).sort("date", DESCENDING)
+
+    @staticmethod
+    def next_batch(cursor: Iterator[dict], size: int) -> list[dict]:
+        """
+        Reads up to size documents from a cursor. Meant to be run in a worker thread, so async
+        callers can stream a large result without blocking the event loop on each fetch.
+        """
+        return list(itertools.islice(cursor, size))
+
+    def find_by_destination(self, account_id, limit: int = 0) -> list[dict]:
+        """
+        Returns the splits paid to a destination account, newest first.
+        """
+        cursor = self.transactions.find({"destination_id": str(account_id)}).sort("date", DESCENDING)
+        if limit:
+            cursor = cursor.limit(limit)
+        return list(cursor)
+
+    def get_state(self) -> dict:
+        """
+        Returns the mirror sync state ('last_full_sync_at', 'last_sync_at').
+        """
+        return self.mirror_state.find_one({"_id": MIRROR_STATE_ID}) or {}
+
+    def set_state(self, **fields):
+        """
+        Updates the mirror sync state.
+        """
+        self.mirror_state.update_one({"_id": MIRROR_STATE_ID}, {"$set": fields}, upsert=True)
+
+    def is_ready(self) -> bool:
+        """
+        True once a full sync has completed, meaning the mirror can answer reads on its own.
+        """
+        return bool(self.get_state().get("last_full_sync_at"))
+
+
+def _to_float(value) -> Union[float, None]:
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_str(value) -> Union[str, None]:
+    return None if value is None else str(value)
@@ -0,0 +1,215 @@
+from collections import Counter
+import copy
+import re
+import threading
+from typing import Iterable, Union
+
+
+def clean_string_for_match(input_string: str) -> str:
+    """
+    Cleans a string for comparison by converting to lowercase and removing non-alphanumeric characters.
+    """
+    if not isinstance(input_string, str):
+        return ""
+    # Convert to lowercase and remove non-alphanumeric characters
+    return re.sub(r'[^a-z0-9]', '', input_string.lower())
+
+
+def trigrams(input_string: str) -> frozenset[str]:
+    """
+    Splits a string into the trigrams of its lowercase alphanumeric words, each word padded with
+    two leading spaces and one trailing space (as PostgreSQL's pg_trgm does), so short words and
+    word starts still contribute.
+    """
+    if not isinstance(input_string, str):
+        return frozenset()
+
+    result = set()
+    for word in re.findall(r'[a-z0-9]+', input_string.lower()):
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(result)
+
+
+class VendorIndex:
+    """
+    In-memory lookup table from vendor names and aliases to vendor documents.
+
+    Every name and alias is keyed twice: by its lowercase form (case-insensitive exact match)
+    and by its cleaned form (see clean_string_for_match). Lookups are dictionary hits, so
+    matching an SMS location no longer scans the vendors collection.
+
+    Names and aliases are also indexed by trigram (see trigrams), so similar() can rank vendors
+    by similarity to a location that has no exact match by only visiting the keys that share
+    a trigram with it.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._vendors: dict = {}
+        self._by_lower: dict[str, list] = {}
+        self._by_cleaned: dict[str, list] = {}
+        self._by_trigram_key: dict[str, list] = {}
+        self._key_trigrams: dict[str, frozenset[str]] = {}
+        self._by_trigram: dict[str, set[str]] = {}
+        self.loaded = False
+
+    def load(self, vendors: Iterable[dict]):
+        """
+        Replaces the index contents with the given vendor documents.
+        :param vendors: Vendor documents, as stored in the vendors collection
+        """
+        with self._lock:
+            self._vendors = {}
+            self._by_lower = {}
+            self._by_cleaned = {}
+            self._by_trigram_key = {}
+            self._key_trigrams = {}
+            self._by_trigram = {}
+            for vendor in vendors:
+                self._add(vendor)
+            self.loaded = True
+
+    def upsert(self, vendor: Union[dict, None]):
+        """
+        Adds a vendor document to the index, replacing any previous version of it.
+        :param vendor: Vendor document including its _id
+        """
+        if not vendor or '_id' not in vendor:
+            return
+
+        with self._lock:
+            self._remove(vendor['_id'])
+            self._add(vendor)
+
+    def remove(self, vendor_id):
+        """
+        Removes a vendor from the index.
+        :param vendor_id: The _id of the vendor document
+        """
+        with self._lock:
+            self._remove(vendor_id)
+
+    def find(self, search_str: str) -> Union[dict, None]:
+        """
+        Finds a vendor whose name or alias matches the search string, preferring a
+        case-insensitive exact match over a cleaned match.
+        :param search_str: The search string (vendor name or alias)
+        :return: A copy of the matching vendor document or None if not found
+        """
+        if not search_str:
+            return None
+
+        with self._lock:
+            vendor_ids = self._by_lower.get(search_str.lower())
+            if not vendor_ids:
+                cleaned_search = clean_string_for_match(search_str)
+                if not cleaned_search:
+                    return None
+                vendor_ids = self._by_cleaned.get(cleaned_search)
+            if not vendor_ids:
+                return None
+            return copy.deepcopy(self._vendors[vendor_ids[0]])
+
+    def similar(self, search_str: str, limit: int = 3, min_score: float = 0.0) -> list[tuple[dict, float]]:
+        """
+        Ranks vendors by the trigram similarity of their best matching name or alias to the
+        search string. The score is the Jaccard similarity of the two trigram sets, from 0 to 1.
+        :param search_str: The search string, e.g. an SMS location without an exact match
+        :param limit: Maximum number of vendors to return
+        :param min_score: Minimum score of a returned vendor
+        :return: (copy of the vendor document, score) pairs, best first
+        """
+        search_trigrams = trigrams(search_str)
+        if not search_trigrams:
+            return []
+
+        with self._lock:
+            shared = Counter()
+            for trigram in search_trigrams:
+                shared.update(self._by_trigram.get(trigram, ()))
+
+            best_scores = {}
+            for key, shared_count in shared.items():
+                score = shared_count / (len(search_trigrams) + len(self._key_trigrams[key]) - shared_count)
+                if score < min_score:
+                    continue
+                for vendor_id in self._by_trigram_key[key]:
+                    if score > best_scores.get(vendor_id, -1):
+                        best_scores[vendor_id] = score
+
+            ranked = sorted(best_scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+            return [(copy.deepcopy(self._vendors[vendor_id]), score) for vendor_id, score in ranked]
+
+    def __len__(self):
+        return len(self._vendors)
+
+    @staticmethod
+    def _keys(vendor: dict) -> list[str]:
+        keys = [vendor.get('name') or '']
+        keys += [alias for alias in vendor.get('aliases') or [] if isinstance(alias, str)]
+        return keys
+
+    def _add(self, vendor: dict):
+        vendor_id = vendor['_id']
+        self._vendors[vendor_id] = copy.deepcopy(vendor)
+
+        for key in self._keys(vendor):
+            lower_key = key.lower()
+            cleaned_key = clean_string_for_match(key)
+            if lower_key:
+                ids = self._by_lower.setdefault(lower_key, [])
+                if vendor_id not in ids:
+                    ids.append(vendor_id)
+            if cleaned_key:
+                ids = self._by_cleaned.setdefault(cleaned_key, [])
+                if vendor_id not in ids:
+                    ids.append(vendor_id)
+            self._add_trigram_key(lower_key, vendor_id)
+
+    def _add_trigram_key(self, key: str, vendor_id):
+        if key not in self._key_trigrams:
+            key_trigrams = trigrams(key)
+            if not key_trigrams:
+                return
+            self._key_trigrams[key] = key_trigrams
+            for trigram in key_trigrams:
+                self._by_trigram.setdefault(trigram, set()).add(key)
+
+        ids = self._by_trigram_key.setdefault(key, [])
+        if vendor_id not in ids:
+            ids.append(vendor_id)
+
+    def _remove_trigram_key(self, key: str, vendor_id):
+        ids = self._by_trigram_key.get(key)
+        if not ids:
+            return
+        if vendor_id in ids:
+            ids.remove(vendor_id)
+        if ids:
+            return
+
+        del self._by_trigram_key[key]
+        for trigram in self._key_trigrams.pop(key, ()):
+            keys = self._by_trigram.get(trigram)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if not keys:
+                del self._by_trigram[trigram]
+
+    def _remove(self, vendor_id):
+        vendor = self._vendors.pop(vendor_id, None)
+        if vendor is None:
+            return
+
+        for key in self._keys(vendor):
+            for table, table_key in ((self._by_lower, key.lower()), (self._by_cleaned, clean_string_for_match(key))):
+                ids = table.get(table_key)
+                if not ids:
+                    continue
+                if vendor_id in ids:
+                    ids.remove(vendor_id)
+                if not ids:
+                    del table[table_key]
+            self._remove_trigram_key(key.lower(), vendor_id)
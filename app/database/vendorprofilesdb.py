@@ -0,0 +1,198 @@
+from datetime import datetime, timezone
+from typing import Iterable, Union
+import hashlib
+import logging
+import re
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from app.database import database
+
+LOGS = logging.getLogger(__name__)
+
+
+class VendorProfilesDB:
+    """
+    Materialized per-vendor profiles: how often each description, category, budget and tag
+    was used for withdrawals to a vendor's Firefly account.
+
+    What every transaction split contributed is remembered in vendor_profile_contributions,
+    so a create or an edit only moves the counts that changed and applying the same
+    transaction twice is a no-op. Deleted transactions take their contribution back.
+    """
+
+    def __init__(self):
+        db = database()
+        self.profiles = db["vendor_profiles"]
+        self.contributions = db["vendor_profile_contributions"]
+
+    @staticmethod
+    def value_key(value: str) -> str:
+        # Free-text values can contain '.' or start with '$', so they are stored under a hash
+        return hashlib.sha1(value.encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def contribution(split: dict) -> Union[dict, None]:
+        """
+        What a split counts towards its vendor's profile, or None if it is not a withdrawal to a vendor.
+        """
+        if split.get('type') != 'withdrawal' or not split.get('destination_id'):
+            return None
+
+        return {
+            "account_id": str(split['destination_id']),
+            "description": split.get('description') or None,
+            "category_id": str(split['category_id']) if split.get('category_id') else None,
+            "budget_id": str(split['budget_id']) if split.get('budget_id') else None,
+            "tags": sorted(split.get('tags') or []),
+        }
+
+    def _profile_update(self, contribution: dict, weight: int, now: datetime) -> UpdateOne:
+        increments = {"transactions": weight}
+        values = {"updated_at": now}
+
+        if contribution["description"]:
+            key = self.value_key(contribution["description"])
+            increments[f"descriptions.{key}.count"] = weight
+            values[f"descriptions.{key}.value"] = contribution["description"]
+        if contribution["category_id"]:
+            increments[f"categories.{contribution['category_id']}"] = weight
+        if contribution["budget_id"]:
+            increments[f"budgets.{contribution['budget_id']}"] = weight
+        for tag in contribution["tags"]:
+            key = self.value_key(tag)
+            increments[f"tags.{key}.count"] = weight
+            values[f"tags.{key}.value"] = tag
+
+        return UpdateOne({"_id": contribution["account_id"]}, {"$inc": increments, "$set": values}, upsert=True)
+
+    def apply_groups(self, groups: Iterable[dict]) -> int:
+        """
+        Brings the profiles in line with the given Firefly transaction groups, as returned by
+        a create, an update or a listing. Splits no longer in a group take their contribution back.
+
+        Returns:
+            The number of splits whose contribution changed
+        """
+        new_contributions = {}
+        group_ids = []
+        for group in groups:
+            group_ids.append(str(group['id']))
+            for split in group.get('attributes', {}).get('transactions', []):
+                split_id = f"{group['id']}:{split.get('transaction_journal_id')}"
+                new_contributions[split_id] = self.contribution(split)
+
+        if not group_ids:
+            return 0
+
+        old_contributions = self._find_contributions(self._groups_filter(group_ids))
+        for split_id in old_contributions:
+            new_contributions.setdefault(split_id, None)
+
+        return self._apply_changes(old_contributions, new_contributions)
+
+    def remove_groups(self, group_ids: Iterable[str]) -> int:
+        """
+        Takes back what the splits of deleted transaction groups contributed.
+
+        Returns:
+            The number of splits whose contribution was removed
+        """
+        group_ids = [str(group_id) for group_id in group_ids]
+        if not group_ids:
+            return 0
+
+        old_contributions = self._find_contributions(self._groups_filter(group_ids))
+        return self._apply_changes(old_contributions, dict.fromkeys(old_contributions))
+
+    def remove_splits(self, split_ids: Iterable[str]) -> int:
+        """
+        Takes back what deleted splits (as "<group id>:<journal id>") contributed, e.g. the
+        splits a full mirror sync pruned because Firefly no longer has them.
+
+        Returns:
+            The number of splits whose contribution was removed
+        """
+        split_ids = list(split_ids)
+        if not split_ids:
+            return 0
+
+        old_contributions = self._find_contributions({"_id": {"$in": split_ids}})
+        return self._apply_changes(old_contributions, dict.fromkeys(old_contributions))
+
+    @staticmethod
+    def _groups_filter(group_ids: list[str]) -> dict:
+        # Contribution IDs start with the group ID, so an anchored prefix walks the _id index
+        return {"$or": [{"_id": {"$regex": f"^{re.escape(group_id)}:"}} for group_id in group_ids]}
+
+    def _find_contributions(self, filter_: dict) -> dict[str, dict]:
+        return {document.pop("_id"): document for document in self.contributions.find(filter_)}
+
+    def _apply_changes(self, old_contributions: dict, new_contributions: dict) -> int:
+        """
+        Moves the profile counts from the old to the new contribution of each split.
+
+        A split's contribution document is swapped first, conditioned on the contribution the
+        profile change is computed from, and the profile counts only move for swaps that
+        succeeded. Concurrent or repeated applications of the same change therefore count it
+        once, and a crash in between can at worst leave a change uncounted.
+        """
+        now = datetime.now(timezone.utc)
+        profile_operations = []
+        changed = 0
+        for split_id, new in new_contributions.items():
+            old = old_contributions.get(split_id)
+            if old == new or not self._swap_contribution(split_id, old, new):
+                continue
+
+            changed += 1
+            if old:
+                profile_operations.append(self._profile_update(old, -1, now))
+            if new:
+                profile_operations.append(self._profile_update(new, 1, now))
+
+        if profile_operations:
+            self.profiles.bulk_write(profile_operations)
+
+        return changed
+
+    def _swap_contribution(self, split_id: str, old: Union[dict, None], new: Union[dict, None]) -> bool:
+        """
+        Replaces a split's stored contribution, provided it is still old.
+
+        Returns:
+            Whether this call made the change
+        """
+        if old is None:
+            try:
+                self.contributions.insert_one({"_id": split_id, **new})
+                return True
+            except DuplicateKeyError:
+                return False
+
+        current = {"_id": split_id, **old}
+        if new is None:
+            return self.contributions.delete_one(current).deleted_count == 1
+        return self.contributions.replace_one(current, new).matched_count == 1
+
+    def get_profile(self, account_id) -> Union[dict, None]:
+        return self.profiles.find_one({"_id": str(account_id)})
+
+    @staticmethod
+    def most_frequent_value(entries: Union[dict, None]) -> Union[str, None]:
+        """
+        The most used value of a {key: {"value", "count"}} profile field (descriptions, tags).
+        """
+        best = max((entry for entry in (entries or {}).values() if entry.get("count", 0) > 0),
+                   key=lambda entry: entry["count"], default=None)
+        return best["value"] if best else None
+
+    @staticmethod
+    def most_frequent_id(counts: Union[dict, None]) -> Union[str, None]:
+        """
+        The most used ID of a {id: count} profile field (categories, budgets).
+        """
+        best = max(((key, count) for key, count in (counts or {}).items() if count > 0),
+                   key=lambda item: item[1], default=None)
+        return best[0] if best else None
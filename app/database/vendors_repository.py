@@ -0,0 +1,122 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar, Union
+import asyncio
+import functools
+import logging
+import threading
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from app import MONGO_EXECUTOR_WORKERS
+from app.database.vendorsdb import VendorsDB, VendorSyncResult
+
+LOGS = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_executor: Union[ThreadPoolExecutor, None] = None
+_executor_lock = threading.Lock()
+
+
+def executor() -> ThreadPoolExecutor:
+    """Lazily created, process-wide thread pool for blocking vendor queries"""
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MONGO_EXECUTOR_WORKERS, thread_name_prefix="vendors-db")
+
+    return _executor
+
+
+def close_executor():
+    """Shut the vendor query thread pool down, waiting for running queries"""
+    global _executor
+
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+class VendorsRepository:
+    """
+    Async facade over VendorsDB for use inside Pyrogram handlers.
+
+    Every operation runs the blocking pymongo call on a dedicated, bounded thread pool, so a
+    slow Mongo response only ties up one of its MONGO_EXECUTOR_WORKERS threads instead of the
+    event loop, and a burst of vendor commands cannot exhaust the default executor that the
+    rest of the bot shares.
+    """
+
+    def __init__(self, db: Union[VendorsDB, None] = None):
+        self.db = db or VendorsDB()
+
+    @staticmethod
+    async def _run(function: Callable[..., T], *args) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor(), functools.partial(function, *args))
+
+    @staticmethod
+    def object_id(vendor_id) -> Union[ObjectId, None]:
+        """
+        Parses a vendor ID taken from callback data, or None if it is not a valid ObjectId.
+        """
+        if isinstance(vendor_id, ObjectId):
+            return vendor_id
+        try:
+            return ObjectId(vendor_id)
+        except (InvalidId, TypeError):
+            return None
+
+    async def get_vendor(self, vendor_id) -> Union[dict, None]:
+        object_id = self.object_id(vendor_id)
+        if object_id is None:
+            return None
+        return await self._run(self.db.find_vendor_by_id, object_id)
+
+    async def page_vendors(self, query: str, limit: int, cursor_id=None,
+                           backward: bool = False) -> tuple[list[dict], bool, bool]:
+        return await self._run(self.db.page_vendors, query, limit, self.object_id(cursor_id), backward)
+
+    async def count_search(self, query: str) -> int:
+        return await self._run(self.db.count_search, query)
+
+    async def find_vendor_by_name_or_alias(self, search_str: str) -> Union[dict, None]:
+        return await self._run(self.db.find_vendor_by_name_or_alias, search_str)
+
+    async def find_similar_vendors(self, search_str: str, limit: int = 3,
+                                   min_score: float = 0.0) -> list[tuple[dict, float]]:
+        return await self._run(self.db.find_similar_vendors, search_str, limit, min_score)
+
+    async def find_vendor_by_firefly_account_id(self, account_id) -> Union[dict, None]:
+        return await self._run(self.db.find_vendor_by_firefly_account_id, account_id)
+
+    async def delete_vendor_by_firefly_account_id(self, account_id) -> Union[dict, None]:
+        return await self._run(self.db.delete_vendor_by_firefly_account_id, account_id)
+
+    async def exists(self, title: str) -> bool:
+        return await self._run(self.db.exists, title)
+
+    async def vendor_has_alias(self, vendor_name: str, alias: str) -> bool:
+        return await self._run(self.db.vendor_has_alias, vendor_name, alias)
+
+    async def add_alias_to_vendor(self, vendor_name: str, alias: str) -> Union[dict, None]:
+        return await self._run(self.db.add_alias_to_vendor, vendor_name, alias)
+
+    async def remove_alias_from_vendor(self, vendor_id, alias: str) -> Union[dict, None]:
+        return await self._run(self.db.remove_alias_from_vendor, self.object_id(vendor_id), alias)
+
+    async def rename_vendor(self, old_name: str, new_name: str) -> Union[dict, None]:
+        return await self._run(self.db.rename_vendor, old_name, new_name)
+
+    async def sync_vendors(self, firefly_vendors: list[dict], firefly_account_ids: set) -> VendorSyncResult:
+        return await self._run(self.db.sync_vendors, firefly_vendors, firefly_account_ids)
+
+    async def count_vendors(self) -> int:
+        return await self._run(self.db.count_vendors)
+
+    async def count_aliases(self) -> int:
+        return await self._run(self.db.count_aliases)
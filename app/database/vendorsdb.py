@@ -1,14 +1,189 @@
+from dataclasses import dataclass
 from typing import Union
+import logging
 import re
-from pymongo import ReturnDocument
+import threading
+import time
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, DeleteMany, InsertOne, ReturnDocument, UpdateOne
 
 from app.database import database
+from app.database.vendor_index import VendorIndex, clean_string_for_match
+
+LOGS = logging.getLogger(__name__)
+
+# Distinct search queries whose result counts are kept in memory
+SEARCH_COUNTS_MAX_ENTRIES = 128
+# Writes from other processes do not clear this process's counts, so they also expire
+SEARCH_COUNTS_TTL_SECONDS = 60
+
+
+@dataclass
+class VendorSyncResult:
+    new_vendors: int = 0
+    new_aliases: int = 0
+    deleted_vendors: int = 0
 
 
 class VendorsDB:
+    # Process-wide in-memory match index, shared by every VendorsDB instance
+    index = VendorIndex()
+    # Process-wide (count, expiry on the monotonic clock) by search query, cleared on every vendor write
+    search_counts: dict[str, tuple[int, float]] = {}
+    _search_counts_generation = 0
+    _search_counts_lock = threading.Lock()
+
     def __init__(self):
         self.vendors = database()["vendors"]
 
+    def load_index(self):
+        """
+        (Re)builds the in-memory vendor match index from the vendors collection.
+        """
+        VendorsDB.index.load(self.vendors.find({}))
+        LOGS.info(f"Vendor index loaded with {len(VendorsDB.index)} vendors")
+
+    def ensure_indexes(self):
+        """
+        Creates the indexes used by vendor lookups. Safe to call on every startup.
+        """
+        self.vendors.create_index([("normalized_name", ASCENDING)])
+        self.vendors.create_index([("normalized_aliases", ASCENDING)])
+        self.vendors.create_index([("firefly_account_id", ASCENDING)])
+        # Serves name lookups as well as the (name, _id) keyset pagination of /vendors
+        self.vendors.create_index([("name", ASCENDING), ("_id", ASCENDING)])
+
+    def backfill_normalized_fields(self) -> int:
+        """
+        Stores 'normalized_name' and 'normalized_aliases' on vendors that were saved before these fields existed.
+
+        Returns:
+            The number of vendors updated
+        """
+        operations = []
+        for vendor in self.vendors.find({"normalized_name": {"$exists": False}}, {"name": 1, "aliases": 1}):
+            operations.append(UpdateOne(
+                {"_id": vendor["_id"]},
+                {"$set": self.normalized_fields(vendor.get("name"), vendor.get("aliases"))}
+            ))
+
+        if not operations:
+            return 0
+
+        result = self.vendors.bulk_write(operations, ordered=False)
+        LOGS.info(f"Backfilled normalized fields on {result.modified_count} vendors")
+        return result.modified_count
+
+    @staticmethod
+    def normalized_fields(name: Union[str, None], aliases: Union[list, None] = None) -> dict:
+        """
+        Builds the normalized lookup fields stored alongside a vendor's name and aliases.
+        """
+        return {
+            "normalized_name": clean_string_for_match(name),
+            "normalized_aliases": list(dict.fromkeys(clean_string_for_match(alias) for alias in aliases or [])),
+        }
+
+    def search_filter(self, query: str) -> dict:
+        """
+        Builds the filter for a free-text vendor search: vendors whose name or an alias starts
+        with the query. The match is an anchored, case-sensitive prefix regex on the normalized
+        fields, which Mongo answers as a range scan of their indexes instead of a collection scan.
+        """
+        if not query:
+            return {}
+
+        cleaned_query = clean_string_for_match(query)
+        if not cleaned_query:
+            # Nothing alphanumeric to normalize, so match the raw name prefix through its index
+            return {"name": {"$regex": f"^{re.escape(query)}"}}
+
+        prefix = f"^{re.escape(cleaned_query)}"
+        return {
+            "$or": [
+                {"normalized_name": {"$regex": prefix}},
+                {"normalized_aliases": {"$regex": prefix}}
+            ]
+        }
+
+    def page_vendors(self, query: str, limit: int, cursor_id: Union[ObjectId, None] = None,
+                     backward: bool = False) -> tuple[list[dict], bool, bool]:
+        """
+        Returns one page of the vendors matching a free-text search, in (name, _id) order.
+
+        Pages are addressed by keyset rather than offset: the page starts right after (or, going
+        backward, ends right before) the vendor with ID cursor_id, so each page walks the
+        (name, _id) index from the cursor instead of skipping over every earlier vendor. That
+        makes every page of the unfiltered listing cost the same; a search page costs in
+        proportion to the vendors matching the prefix search, which its indexes find directly.
+
+        Args:
+            query: The search query, empty for all vendors
+            limit: The page size
+            cursor_id: The _id of the last vendor of the previous page (first vendor of the next
+                page when going backward), or None for the first page
+            backward: Whether to return the page before the cursor
+
+        Returns:
+            (vendors in ascending order, whether a previous page exists, whether a next page exists).
+            An unknown cursor, e.g. a vendor deleted since, returns the first page.
+        """
+        filter_ = self.search_filter(query)
+        if cursor_id is not None:
+            cursor = self.vendors.find_one({"_id": cursor_id}, {"name": 1})
+            if cursor is None:
+                return self.page_vendors(query, limit)
+
+            operator = "$lt" if backward else "$gt"
+            keyset_filter = {"$or": [
+                {"name": {operator: cursor.get("name")}},
+                {"name": cursor.get("name"), "_id": {operator: cursor_id}},
+            ]}
+            filter_ = {"$and": [filter_, keyset_filter]} if filter_ else keyset_filter
+
+        direction = DESCENDING if backward else ASCENDING
+        # One extra vendor tells whether another page follows in the paging direction
+        vendors = list(self.vendors.find(filter_).sort([("name", direction), ("_id", direction)]).limit(limit + 1))
+        has_more = len(vendors) > limit
+        vendors = vendors[:limit]
+
+        if backward:
+            vendors.reverse()
+            return vendors, has_more, True
+        return vendors, cursor_id is not None, has_more
+
+    def count_search(self, query: str) -> int:
+        """
+        Returns the number of vendors matching a free-text search.
+        Counts are cached per query until this process writes a vendor, and for at most
+        SEARCH_COUNTS_TTL_SECONDS so writes from other processes show up too.
+        """
+        now = time.monotonic()
+        with VendorsDB._search_counts_lock:
+            cached = VendorsDB.search_counts.get(query)
+            generation = VendorsDB._search_counts_generation
+        if cached is not None and cached[1] > now:
+            return cached[0]
+
+        count = self.vendors.count_documents(self.search_filter(query))
+        with VendorsDB._search_counts_lock:
+            # A write that happened while counting wins over the possibly outdated count
+            if generation == VendorsDB._search_counts_generation:
+                VendorsDB.search_counts.pop(query, None)
+                if len(VendorsDB.search_counts) >= SEARCH_COUNTS_MAX_ENTRIES:
+                    VendorsDB.search_counts.pop(next(iter(VendorsDB.search_counts)))
+                VendorsDB.search_counts[query] = (count, now + SEARCH_COUNTS_TTL_SECONDS)
+        return count
+
+    @staticmethod
+    def invalidate_search_counts():
+        with VendorsDB._search_counts_lock:
+            VendorsDB._search_counts_generation += 1
+            VendorsDB.search_counts.clear()
+
+    def find_vendor_by_id(self, vendor_id) -> Union[dict, None]:
+        return self.vendors.find_one({"_id": vendor_id})
+
     def find_vendor_by_title(self, title: str):
         return self.vendors.find_one({"name": title})
 
@@ -21,13 +196,16 @@ class VendorsDB:
             description: Union[str, None] = None,
             firefly_account_id: Union[int, None] = None,
     ):
-        return self.vendors.insert_one(
-            {
-                "name": name,
-                "description": description,
-                "firefly_account_id": firefly_account_id,
-            }
-        )
+        vendor = {
+            "name": name,
+            "description": description,
+            "firefly_account_id": firefly_account_id,
+            **self.normalized_fields(name),
+        }
+        result = self.vendors.insert_one(vendor)
+        VendorsDB.index.upsert(vendor)
+        self.invalidate_search_counts()
+        return result
 
     def add_alias_to_vendor(self, vendor_name: str, alias: str):
         """
@@ -48,11 +226,59 @@ class VendorsDB:
             return self.vendors.find_one({"name": vendor_name})
         
         # $addToSet ensures no duplicates are added to the array
-        return self.vendors.find_one_and_update(
+        vendor = self.vendors.find_one_and_update(
             {"name": vendor_name},
-            {"$addToSet": {"aliases": alias}},
+            {"$addToSet": {"aliases": alias, "normalized_aliases": clean_string_for_match(alias)}},
             return_document=ReturnDocument.AFTER
         )
+        VendorsDB.index.upsert(vendor)
+        self.invalidate_search_counts()
+        return vendor
+
+    def remove_alias_from_vendor(self, vendor_id, alias: str):
+        """
+        Removes an alias from the vendor's 'aliases' list.
+
+        Args:
+            vendor_id: The _id of the vendor
+            alias: The alias to remove
+
+        Returns:
+            The updated vendor document
+        """
+        vendor = self.vendors.find_one_and_update(
+            {"_id": vendor_id},
+            {"$pull": {"aliases": alias}},
+            return_document=ReturnDocument.AFTER
+        )
+        if vendor:
+            # Another alias may share the removed alias's normalized form, so recompute the whole list
+            normalized_aliases = self.normalized_fields(None, vendor.get("aliases"))["normalized_aliases"]
+            self.vendors.update_one({"_id": vendor["_id"]}, {"$set": {"normalized_aliases": normalized_aliases}})
+            vendor["normalized_aliases"] = normalized_aliases
+        VendorsDB.index.upsert(vendor)
+        self.invalidate_search_counts()
+        return vendor
+
+    def rename_vendor(self, old_name: str, new_name: str):
+        """
+        Renames a vendor.
+
+        Args:
+            old_name: The current name of the vendor
+            new_name: The new name of the vendor
+
+        Returns:
+            The updated vendor document
+        """
+        vendor = self.vendors.find_one_and_update(
+            {"name": old_name},
+            {"$set": {"name": new_name, "normalized_name": clean_string_for_match(new_name)}},
+            return_document=ReturnDocument.AFTER
+        )
+        VendorsDB.index.upsert(vendor)
+        self.invalidate_search_counts()
+        return vendor
 
     # def find_vendor_by_name_or_alias(self, search_str: str):
     #     """
@@ -68,7 +294,9 @@ class VendorsDB:
     def find_vendor_by_name_or_alias(self, search_str: str):
         """
         Finds a vendor by matching the input string against the 'name' field or any value in the 'aliases' array.
-        Uses both regex and string cleaning approaches to handle special characters.
+        Lookups are served from the in-memory vendor index, which matches case-insensitively and on
+        cleaned strings to handle special characters. Falls back to querying the database if the
+        index cannot be loaded.
         
         Args:
             search_str: The search string (vendor name or alias)
@@ -78,38 +306,58 @@ class VendorsDB:
         """
         if not search_str:
             return None
-            
-        # Try 1: Exact match with case insensitivity (using regex)
-        vendor = self.vendors.find_one({
-            "$or": [
-                {"name": {"$regex": f"^{re.escape(search_str)}$", "$options": "i"}},
-                {"aliases": {"$regex": f"^{re.escape(search_str)}$", "$options": "i"}}
-            ]
-        })
-        
-        if vendor:
-            return vendor
-        
-        # Try 2: Compare cleaned strings to handle special characters
+
+        if not VendorsDB.index.loaded:
+            try:
+                self.load_index()
+            except Exception as e:
+                LOGS.warning(f"Could not load the vendor index, falling back to database lookup: {e}")
+
+        if VendorsDB.index.loaded:
+            return VendorsDB.index.find(search_str)
+
         cleaned_search = self.clean_string_for_match(search_str)
         if not cleaned_search:  # If cleaning removed everything meaningful
             return None
-            
-        # Get all vendors to compare cleaned strings
-        all_vendors = list(self.vendors.find({}))
-        
-        for vendor in all_vendors:
-            # Compare cleaned name
-            vendor_name = vendor.get('name', '')
-            if self.clean_string_for_match(vendor_name) == cleaned_search:
+
+        # Indexed point query on the normalized fields
+        candidates = list(self.vendors.find({
+            "$or": [
+                {"normalized_name": cleaned_search},
+                {"normalized_aliases": cleaned_search}
+            ]
+        }))
+
+        # Prefer a case-insensitive exact match over a cleaned match
+        lowered_search = search_str.lower()
+        for vendor in candidates:
+            names = [vendor.get('name') or ''] + (vendor.get('aliases') or [])
+            if any(isinstance(name, str) and name.lower() == lowered_search for name in names):
                 return vendor
-                
-            # Compare cleaned aliases
-            for alias in vendor.get('aliases', []):
-                if self.clean_string_for_match(alias) == cleaned_search:
-                    return vendor
-                    
-        return None
+
+        return candidates[0] if candidates else None
+
+    def find_similar_vendors(self, search_str: str, limit: int = 3, min_score: float = 0.0) -> list[tuple[dict, float]]:
+        """
+        Ranks vendors by the trigram similarity of their names and aliases to the search string,
+        for locations that have no exact or cleaned match.
+
+        Args:
+            search_str: The search string, e.g. an SMS location
+            limit: Maximum number of vendors to return
+            min_score: Minimum similarity (0 to 1) of a returned vendor
+
+        Returns:
+            (vendor document, score) pairs, best first. Empty if the vendor index cannot be loaded.
+        """
+        if not VendorsDB.index.loaded:
+            try:
+                self.load_index()
+            except Exception as e:
+                LOGS.warning(f"Could not load the vendor index for a similarity search: {e}")
+                return []
+
+        return VendorsDB.index.similar(search_str, limit, min_score)
 
     def find_vendor_by_firefly_account_id(self, account_id):
         return self.vendors.find_one({
@@ -120,11 +368,7 @@ class VendorsDB:
         """
         Cleans a string for comparison by converting to lowercase and removing non-alphanumeric characters.
         """
-        if not isinstance(input_string, str):
-            return ""
-        # Convert to lowercase and remove non-alphanumeric characters
-        cleaned_string = re.sub(r'[^a-z0-9]', '', input_string.lower())
-        return cleaned_string
+        return clean_string_for_match(input_string)
 
     def get_all_firefly_account_ids(self) -> list:
         """
@@ -152,7 +396,92 @@ class VendorsDB:
         """
         Deletes a vendor by its Firefly account ID.
         """
-        return self.vendors.delete_one({"firefly_account_id": account_id})
+        vendor = self.vendors.find_one_and_delete({"firefly_account_id": account_id})
+        if vendor:
+            VendorsDB.index.remove(vendor['_id'])
+            self.invalidate_search_counts()
+        return vendor
+
+    def sync_vendors(self, firefly_vendors: list[dict], firefly_account_ids: set) -> VendorSyncResult:
+        """
+        Brings the vendors collection in line with Firefly in a single bulk write.
+
+        The current vendors are loaded once, inserts, alias additions and deletions are computed
+        in memory, and all changes are applied with one unordered bulk_write.
+
+        Args:
+            firefly_vendors: Dicts with 'firefly_account_id', 'name', 'description' and 'aliases'
+                for every Firefly account that should exist as a vendor
+            firefly_account_ids: Every account ID present in Firefly, including skipped accounts.
+                Vendors whose account ID is not in this set are deleted.
+
+        Returns:
+            Counts of the changes that were applied
+        """
+        result = VendorSyncResult()
+        existing = {
+            vendor.get("firefly_account_id"): vendor
+            for vendor in self.vendors.find({}, {"name": 1, "firefly_account_id": 1, "aliases": 1})
+        }
+        operations = []
+
+        for firefly_vendor in firefly_vendors:
+            account_id = firefly_vendor["firefly_account_id"]
+            vendor = existing.get(account_id)
+            known_aliases = set(vendor.get("aliases") or []) if vendor else set()
+            known_cleaned = {clean_string_for_match(alias) for alias in known_aliases}
+
+            # Avoid duplicate aliases (exact or normalized match)
+            new_aliases = []
+            for alias in firefly_vendor.get("aliases") or []:
+                cleaned_alias = clean_string_for_match(alias)
+                if alias in known_aliases or cleaned_alias in known_cleaned:
+                    continue
+                known_aliases.add(alias)
+                known_cleaned.add(cleaned_alias)
+                new_aliases.append(alias)
+
+            if vendor is None:
+                operations.append(InsertOne({
+                    "name": firefly_vendor["name"],
+                    "description": firefly_vendor.get("description"),
+                    "firefly_account_id": account_id,
+                    "aliases": new_aliases,
+                    **self.normalized_fields(firefly_vendor["name"], new_aliases),
+                }))
+                LOGS.info(f"New vendor added: {firefly_vendor['name']}")
+                result.new_vendors += 1
+            elif new_aliases:
+                operations.append(UpdateOne(
+                    {"_id": vendor["_id"]},
+                    {"$addToSet": {
+                        "aliases": {"$each": new_aliases},
+                        "normalized_aliases": {"$each": [clean_string_for_match(alias) for alias in new_aliases]},
+                    }}
+                ))
+
+            for alias in new_aliases:
+                LOGS.info(f"New alias added: {alias} to vendor {firefly_vendor['name']}")
+            result.new_aliases += len(new_aliases)
+
+        # Delete vendors that are in the database but not in Firefly
+        stale_account_ids = [
+            account_id for account_id in existing
+            if account_id is not None and account_id not in firefly_account_ids
+        ]
+        if stale_account_ids:
+            for account_id in stale_account_ids:
+                LOGS.info(f"Deleting vendor no longer in Firefly: {existing[account_id].get('name', 'Unknown')}")
+            operations.append(DeleteMany({"firefly_account_id": {"$in": stale_account_ids}}))
+            result.deleted_vendors = len(stale_account_ids)
+
+        if operations:
+            self.vendors.bulk_write(operations, ordered=False)
+            self.invalidate_search_counts()
+
+        # Rebuild the in-memory match index from the synced collection
+        self.load_index()
+        return result
 
     def count_vendors(self) -> int:
         """
@@ -0,0 +1,617 @@
+import asyncio
+import itertools
+import logging
+from collections import deque
+from typing import AsyncIterator
+
+import httpx
+
+from app import (
+    FIREFLY_BASE_URL,
+    FIREFLY_API_KEY,
+    FIREFLY_POOL_SIZE,
+    FIREFLY_CONNECT_TIMEOUT,
+    FIREFLY_READ_TIMEOUT,
+    FIREFLY_MAX_RETRIES,
+    FIREFLY_PAGE_SIZE,
+    FIREFLY_PAGE_CONCURRENCY,
+    MIRROR_ENABLED,
+    REFERENCE_TTL_BUDGETS,
+    REFERENCE_TTL_CATEGORIES,
+    REFERENCE_TTL_BILLS,
+    REFERENCE_TTL_ACCOUNTS,
+)
+from app.database.transactionsdb import TransactionsDB
+from app.firefly.cache import reference_cache, transaction_cache
+from app.database.vendorprofilesdb import VendorProfilesDB
+from app.firefly.firefly import FireflyApi
+from app.models.transaction_models import Account, Budget, Category, Bill
+
+LOGS = logging.getLogger(__name__)
+
+_client: httpx.AsyncClient | None = None
+
+# Endpoints whose listings are kept in the reference data cache
+REFERENCE_ENTITIES = ('budgets', 'categories', 'bills', 'accounts')
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Get the process-wide asynchronous HTTP client used for all Firefly API calls.
+    The client is created lazily and keeps a pool of keep-alive connections to Firefly.
+    :return: Shared httpx async client
+    """
+    global _client
+
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            headers={'Authorization': f'Bearer {FIREFLY_API_KEY}'},
+            timeout=httpx.Timeout(FIREFLY_READ_TIMEOUT, connect=FIREFLY_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=FIREFLY_POOL_SIZE,
+                max_keepalive_connections=FIREFLY_POOL_SIZE,
+            ),
+            transport=httpx.AsyncHTTPTransport(retries=FIREFLY_MAX_RETRIES),
+        )
+
+    return _client
+
+
+async def mirror_transaction_group(response: dict):
+    """
+    Writes a transaction group returned by a Firefly write to the local transaction mirror,
+    so mirror reads see the bot's own changes without waiting for the next sync.
+    :param response: Firefly response JSON containing the group under 'data'
+    """
+    if not MIRROR_ENABLED:
+        return
+
+    try:
+        group = response.get('data') if isinstance(response, dict) else None
+        if group and group.get('id'):
+            await asyncio.to_thread(TransactionsDB().upsert_groups, [group])
+    except Exception as e:
+        LOGS.warning(f"Failed to update the transaction mirror: {e}")
+
+
+async def update_vendor_profiles(response: dict):
+    """
+    Applies a transaction group returned by a Firefly write to the vendor profiles used for
+    description, category and budget guessing.
+    :param response: Firefly response JSON containing the group under 'data'
+    """
+    try:
+        group = response.get('data') if isinstance(response, dict) else None
+        if group and group.get('id'):
+            await asyncio.to_thread(VendorProfilesDB().apply_groups, [group])
+    except Exception as e:
+        LOGS.warning(f"Failed to update vendor profiles: {e}")
+
+
+async def forget_transaction_group(group_id: str):
+    """
+    Drops a transaction group that was deleted in Firefly from the transaction cache, the
+    mirror and the vendor profiles.
+    :param group_id: The ID of the deleted transaction group
+    """
+    transaction_cache.invalidate(group_id)
+    try:
+        if MIRROR_ENABLED:
+            await asyncio.to_thread(TransactionsDB().delete_group, group_id)
+        await asyncio.to_thread(VendorProfilesDB().remove_groups, [group_id])
+    except Exception as e:
+        LOGS.warning(f"Failed to forget deleted transaction group {group_id}: {e}")
+
+
+async def close_async_client():
+    """
+    Close the shared asynchronous HTTP client and release its pooled connections.
+    """
+    global _client
+
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+class AsyncFireflyApi:
+    """
+    Non-blocking counterpart of FireflyApi for use inside Pyrogram handlers.
+    Exposes the same methods as FireflyApi, as coroutines.
+    """
+
+    def __init__(self):
+        self.base_url = FIREFLY_BASE_URL
+        self.api_url = self.base_url + '/api/v1'
+        self.api_key = FIREFLY_API_KEY
+        self.client = get_async_client()
+
+    def construct_url(self, endpoint: str):
+        """
+        Construct the full URL for the API endpoint
+        :param endpoint: API endpoint
+        :return: Full URL
+        """
+        return f"{self.api_url}/{endpoint}"
+
+    def transaction_show_url(self, transaction_id: str):
+        """
+        Get the URL to show a transaction in Firefly.
+        :param transaction_id: The ID of the transaction.
+        :return: The URL to show the transaction.
+        """
+        return f"{self.base_url}/transactions/show/{transaction_id}"
+
+    async def get_json(self, endpoint: str, params: dict = None):
+        """
+        Get JSON data from Firefly API
+        :param endpoint: API endpoint
+        :param params: Query parameters
+        :return: JSON data
+        """
+        headers = {
+            'Content-Type': 'application/json'
+        }
+
+        response = await self.client.get(self.construct_url(endpoint), headers=headers, params=params)
+
+        if response.status_code == 200:
+            try:
+                return response.json()
+            except ValueError:
+                raise Exception(f"Error: 200 OK but invalid JSON - {response.text}") from None
+        else:
+            raise Exception(f"Error: {response.status_code} - {response.text}")
+
+    @staticmethod
+    def invalidate_reference_data(endpoint: str):
+        """
+        Drops cached reference data written to through endpoint (e.g. 'accounts/12' drops the
+        cached account lists), so menus show the change immediately.
+        :param endpoint: API endpoint that was written to
+        """
+        entity = endpoint.strip('/').split('/')[0]
+        if entity in REFERENCE_ENTITIES:
+            reference_cache.invalidate(entity)
+
+    async def post_json(self, endpoint: str, payload: dict, debug: bool = False):
+        """
+        Send a POST request to the Firefly API.
+        :param debug: Return the raw response instead of the decoded JSON
+        :param endpoint: API endpoint
+        :param payload: JSON payload
+        :return: Response JSON or raises an exception on failure.
+        """
+        headers = {
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+
+        response = await self.client.post(self.construct_url(endpoint), headers=headers, json=payload)
+
+        if response.status_code in (200, 201):
+            self.invalidate_reference_data(endpoint)
+
+        if debug:
+            return response
+
+        if response.status_code in (200, 201):
+            return response.json()
+        else:
+            raise Exception(f"POST request failed: {response.status_code} - {response.text}")
+
+    async def put_json(self, endpoint: str, payload: dict):
+        """
+        Send a PUT request to the Firefly API.
+        :param endpoint: API endpoint
+        :param payload: JSON payload
+        :return: Response JSON or raises an exception on failure.
+        """
+        headers = {
+            'Content-Type': 'application/json'
+        }
+        response = await self.client.put(self.construct_url(endpoint), headers=headers, json=payload)
+
+        if response.status_code in (200, 204):
+            self.invalidate_reference_data(endpoint)
+            return response.json() if response.status_code == 200 else {"message": "Request successful"}
+        else:
+            raise Exception(f"PUT request failed: {response.status_code} - {response.text}")
+
+    async def delete(self, endpoint: str):
+        """
+        Send a DELETE request to the Firefly API.
+        :param endpoint: API endpoint
+        :return: None or raises an exception on failure.
+        """
+        response = await self.client.delete(self.construct_url(endpoint))
+
+        if response.status_code in (200, 204):
+            self.invalidate_reference_data(endpoint)
+        else:
+            raise Exception(f"DELETE request failed: {response.status_code} - {response.text}")
+
+    async def post_bytes(self, endpoint: str, content: bytes):
+        """
+        Send a POST request with in-memory file content to the Firefly API.
+        :param endpoint: API endpoint
+        :param content: File content to upload
+        :return: Response JSON or raises an exception on failure.
+        """
+        response = await self.client.post(self.construct_url(endpoint), files={'file': content})
+
+        if response.status_code in (200, 201, 204):
+            return response.json() if response.status_code in (200, 201) else {"message": "Request successful"}
+        else:
+            raise Exception(f"POST file request failed: {response.status_code} - {response.text}")
+
+    async def create_attachment(self, transaction_id: str, filename: str):
+        """
+        Create an attachment object for a transaction.
+        :param transaction_id: The ID of the transaction to attach the file to.
+        :param filename: The name of the file to attach.
+        :return: Response JSON with the created attachment details.
+        """
+        payload = {
+            "filename": filename,
+            "attachable_type": "Transaction",
+            "attachable_id": transaction_id
+        }
+        return await self.post_json('attachments', payload)
+
+    async def upload_attachment_content(self, attachment_id: str, content: bytes):
+        """
+        Upload in-memory file content for an attachment.
+        :param attachment_id: The ID of the attachment.
+        :param content: The file content to upload.
+        :return: Response JSON or raises an exception on failure.
+        """
+        return await self.post_bytes(f"attachments/{attachment_id}/upload", content)
+
+    async def about(self):
+        """
+        Get information about the Firefly API
+        :return: JSON data
+        """
+        return await self.get_json('about')
+
+    async def about_user(self):
+        """
+        Get information about the user
+        :return: JSON data
+        """
+        return await self.get_json('about/user')
+
+    async def transactions(self):
+        """
+        Get transactions
+        :return: JSON data
+        """
+        return await self.get_json('transactions')
+
+    async def accounts_autocomplete(self, query: str):
+        """
+        Get account autocomplete
+        :param query: Query string
+        :return: JSON data
+        """
+        params = {
+            'query': query,
+            'limit': 20
+        }
+
+        return await self.get_json('autocomplete/accounts', params)
+
+    async def transactions_from_account(self, account_id: str):
+        """
+        Get transactions from a specific account
+        :param account_id: The Firefly account ID.
+        :return: JSON data
+        """
+        return await self.get_transactions_from_account(account_id)
+
+    async def iter_pages(self, endpoint: str, params: dict = None) -> AsyncIterator[list[dict]]:
+        """
+        Iterate over every page of a paginated endpoint, in page order.
+        The first page reveals the page count; the remaining pages are then fetched through a
+        sliding window of FIREFLY_PAGE_CONCURRENCY requests, and the next page is only requested
+        once one has been yielded. A slow consumer therefore holds at most that many pages in
+        memory, and stopping early cancels the pages still in flight.
+        :param endpoint: API endpoint
+        :param params: Query parameters
+        :return: Async iterator over the 'data' list of each page
+        """
+        params = dict(params or {})
+        params.setdefault('limit', FIREFLY_PAGE_SIZE)
+        params['page'] = 1
+
+        response = await self.get_json(endpoint, params)
+        yield response.get('data', [])
+
+        total_pages = response.get('meta', {}).get('pagination', {}).get('total_pages') or 1
+        if total_pages <= 1:
+            return
+
+        async def fetch_page(page: int) -> list[dict]:
+            page_response = await self.get_json(endpoint, {**params, 'page': page})
+            return page_response.get('data', [])
+
+        pages = iter(range(2, total_pages + 1))
+        window: deque[asyncio.Task] = deque(
+            asyncio.create_task(fetch_page(page)) for page in itertools.islice(pages, FIREFLY_PAGE_CONCURRENCY)
+        )
+        try:
+            while window:
+                data = await window.popleft()
+                yield data
+                next_page = next(pages, None)
+                if next_page is not None:
+                    window.append(asyncio.create_task(fetch_page(next_page)))
+        finally:
+            for task in window:
+                task.cancel()
+
+    async def iter_accounts(self, account_type: str) -> AsyncIterator[dict]:
+        """
+        Stream all accounts of a type, in Firefly's order.
+        :param account_type: Firefly account type (asset, expense, revenue, ...)
+        :return: Async iterator over account objects
+        """
+        async for page in self.iter_pages('accounts', {'type': account_type}):
+            for account in page:
+                yield account
+
+    async def iter_transactions(self, start: str, end: str, transaction_type: str = None) -> AsyncIterator[dict]:
+        """
+        Stream every transaction group in a date range across all result pages.
+        :param start: Start date (YYYY-MM-DD), inclusive
+        :param end: End date (YYYY-MM-DD), inclusive
+        :param transaction_type: Optional Firefly transaction type filter
+        :return: Async iterator over transaction group objects
+        """
+        params = {
+            'start': start,
+            'end': end
+        }
+        if transaction_type:
+            params['type'] = transaction_type
+
+        async for page in self.iter_pages('transactions', params):
+            for transaction in page:
+                yield transaction
+
+    async def accounts(self, account_type: str, get_all: bool = False):
+        if not get_all:
+            params = {
+                'type': account_type,
+                'limit': 20
+            }
+            response = await self.get_json(endpoint='accounts', params=params)
+            try:
+                return response['data']
+            except KeyError:
+                return []
+
+        return [account async for account in self.iter_accounts(account_type)]
+
+    async def update_account_name(self, account_id: int, new_name: str):
+        """
+        Update the name of an account in Firefly.
+        :param account_id: The Firefly account ID.
+        :param new_name: The new name for the account.
+        :return: Response JSON or raises an exception on failure.
+        """
+        payload = {"name": new_name}
+        return await self.put_json(f"accounts/{account_id}", payload)
+
+    async def update_account_aliases(self, account_id: int, aliases: list[str]):
+        """
+        Update the aliases of an account in Firefly.
+        :param account_id: The Firefly account ID.
+        :param aliases: The list of aliases to set for the account.
+        :return: Response JSON or raises an exception on failure.
+        """
+        payload = {"notes": FireflyApi._generate_alias_notes(aliases)}
+        return await self.put_json(f"accounts/{account_id}", payload)
+
+    async def delete_account(self, account_id: str):
+        """
+        Delete an account in Firefly.
+        :param account_id: The Firefly account ID.
+        :return: None or raises an exception on failure.
+        """
+        await self.delete(f"accounts/{account_id}")
+
+    async def get_transactions_from_account(self, account_id: str):
+        """
+        Get transactions from a specific account
+        :param account_id: The Firefly account ID.
+        :return: JSON data
+        """
+        return await self.get_json(f"accounts/{account_id}/transactions")
+
+    async def get_budgets(self) -> list[Budget]:
+        """
+        Get all budgets
+        :return: List of Budget objects
+        """
+        async def load():
+            response = await self.get_json('budgets')
+            return [Budget(id=budget['id'], name=budget['attributes']['name']) for budget in response['data']]
+
+        return list(await reference_cache.get('budgets', load, REFERENCE_TTL_BUDGETS))
+
+    async def get_categories(self) -> list[Category]:
+        """
+        Get all categories
+        :return: List of Category objects
+        """
+        async def load():
+            response = await self.get_json('categories')
+            return [Category(id=category['id'], name=category['attributes']['name']) for category in response['data']]
+
+        return list(await reference_cache.get('categories', load, REFERENCE_TTL_CATEGORIES))
+
+    async def get_bills(self) -> list[Bill]:
+        """
+        Get all bills
+        :return: List of Bill objects
+        """
+        async def load():
+            response = await self.get_json('bills')
+            return [Bill(id=bill['id'], name=bill['attributes']['name']) for bill in response['data']]
+
+        return list(await reference_cache.get('bills', load, REFERENCE_TTL_BILLS))
+
+    async def get_asset_accounts(self) -> list[Account]:
+        """
+        Get all asset accounts
+        :return: List of Account objects
+        """
+        return await self._cached_accounts('asset')
+
+    async def get_revenue_accounts(self) -> list[Account]:
+        """
+        Get all revenue accounts
+        :return: List of Account objects
+        """
+        return await self._cached_accounts('revenue')
+
+    async def _cached_accounts(self, account_type: str) -> list[Account]:
+        async def load():
+            return self._to_accounts(await self.accounts(account_type=account_type, get_all=True))
+
+        return list(await reference_cache.get(f'accounts:{account_type}', load, REFERENCE_TTL_ACCOUNTS))
+
+    @staticmethod
+    def _to_accounts(accounts_data: list[dict]) -> list[Account]:
+        accounts = []
+        for account in accounts_data:
+            try:
+                accounts.append(Account(
+                    id=account['id'],
+                    name=account['attributes']['name']
+                ))
+            except KeyError:
+                continue
+        return accounts
+
+    async def create_incoming_transaction(
+            self,
+            revenue_account_id: str,
+            asset_account_id: str,
+            amount: str,
+            description: str,
+            date: str
+    ) -> dict:
+        """
+        Create an incoming money transaction.
+
+        Args:
+            revenue_account_id: Firefly revenue account ID to use as source.
+            asset_account_id: Firefly asset account ID to use as destination.
+            amount: Amount being received.
+            description: Short transaction description.
+            date: ISO formatted transaction date.
+
+        Returns:
+            Firefly API response JSON.
+        """
+        payload = {
+            "transactions": [
+                {
+                    "type": "deposit",
+                    "date": date,
+                    "amount": amount,
+                    "description": description,
+                    "source_id": revenue_account_id,
+                    "destination_id": asset_account_id
+                }
+            ],
+            "apply_rules": True,
+            "fire_webhooks": False,
+            "error_if_duplicate_hash": False
+        }
+
+        response = await self.post_json('transactions', payload=payload)
+        await mirror_transaction_group(response)
+        transaction_cache.put(response.get('data', {}).get('id'), response)
+        return response
+
+    async def update_transaction(self, transaction_id: str, payload: dict):
+        """
+        Update a transaction
+        :param transaction_id: The ID of the transaction to update.
+        :param payload: JSON payload with the fields to update.
+        :return: Response JSON or raises an exception on failure.
+        """
+        try:
+            response = await self.put_json(f"transactions/{transaction_id}", payload)
+        except Exception:
+            transaction_cache.invalidate(transaction_id)
+            raise
+
+        if isinstance(response, dict) and 'data' in response:
+            transaction_cache.put(transaction_id, response)
+        else:
+            transaction_cache.invalidate(transaction_id)
+        await mirror_transaction_group(response)
+        await update_vendor_profiles(response)
+        return response
+
+    async def get_transaction(self, transaction_id: str, fresh: bool = False) -> dict:
+        """
+        Get a single transaction group, served from the transaction cache when it was recently
+        fetched, created or updated. The cache only sees the bot's own writes, so it is for
+        display; a read that an update is built from must pass fresh=True.
+        :param transaction_id: The ID of the transaction.
+        :param fresh: Always read from Firefly, e.g. before a read-modify-write, so edits made
+            in the Firefly UI are not overwritten with a stale copy
+        :return: Response JSON with the transaction group under 'data'
+        """
+        if not fresh:
+            cached = transaction_cache.get(transaction_id)
+            if cached is not None:
+                return cached
+
+        response = await self.get_json(f"transactions/{transaction_id}")
+        transaction_cache.put(transaction_id, response)
+        return response
+
+    async def transaction_exists(self, transaction_id: str) -> bool:
+        """
+        Check whether a transaction still exists in Firefly, e.g. after it may have been deleted in the UI.
+        :param transaction_id: The ID of the transaction.
+        :return: False if Firefly answers 404, True if it returns the transaction
+        """
+        response = await self.client.get(self.construct_url(f"transactions/{transaction_id}"),
+                                         headers={'Accept': 'application/json'})
+        if response.status_code == 404:
+            await forget_transaction_group(transaction_id)
+            return False
+        if response.status_code == 200:
+            return True
+        raise Exception(f"Error: {response.status_code} - {response.text}")
+
+    async def find_transaction_by_external_id(self, external_id: str) -> dict | None:
+        """
+        Find the transaction group created with the given external ID.
+        :param external_id: The external ID the transaction was created with.
+        :return: The transaction group, or None if there is none
+        """
+        response = await self.get_json('search/transactions', {'query': f'external_id_is:"{external_id}"'})
+        groups = response.get('data') or []
+        return groups[0] if groups else None
+
+    async def get_recent_transactions(self, limit: int = 10):
+        """
+        Get recent transactions
+        :param limit: The number of recent transactions to retrieve.
+        :return: JSON data
+        """
+        params = {
+            'limit': limit,
+            'sort': 'date',
+            'order': 'desc'
+        }
+        return await self.get_json('transactions', params)
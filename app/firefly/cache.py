@@ -0,0 +1,147 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Union
+import asyncio
+import copy
+import logging
+import time
+
+from app import (
+    REFERENCE_CACHE_ENABLED,
+    REFERENCE_CACHE_STALE_SECONDS,
+    TRANSACTION_CACHE_TTL_SECONDS,
+    TRANSACTION_CACHE_MAX_ENTRIES,
+)
+
+LOGS = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    fetched_at: float
+
+
+class ReferenceDataCache:
+    """
+    Process-wide cache of slow-changing Firefly reference data (budgets, categories, bills, accounts).
+
+    An entry younger than its TTL is served as is. Once past its TTL, and for up to
+    REFERENCE_CACHE_STALE_SECONDS after that, the stale value is served while one background
+    refresh runs (stale-while-revalidate). Older entries are reloaded before returning.
+    Concurrent misses for the same key share a single Firefly request.
+    """
+
+    def __init__(self, stale_seconds: float = REFERENCE_CACHE_STALE_SECONDS):
+        self.stale_seconds = stale_seconds
+        self._entries: dict[str, CacheEntry] = {}
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._generation = 0
+
+    async def get(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: float):
+        """
+        Returns the cached value for key, loading it with loader when needed.
+        :param key: Cache key, e.g. 'budgets' or 'accounts:asset'
+        :param loader: Coroutine function fetching the value from Firefly
+        :param ttl: Seconds the value is considered fresh
+        """
+        if not REFERENCE_CACHE_ENABLED or ttl <= 0:
+            return await loader()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.fetched_at
+            if age < ttl:
+                return entry.value
+            if age < ttl + self.stale_seconds:
+                self._refresh(key, loader)
+                return entry.value
+
+        return await asyncio.shield(self._refresh(key, loader))
+
+    def _refresh(self, key: str, loader: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key, loader))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return task
+
+    def _finish(self, key: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        # Retrieve the exception so a failed background refresh is not reported as unhandled
+        if not task.cancelled():
+            task.exception()
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]]):
+        generation = self._generation
+        try:
+            value = await loader()
+        except Exception as e:
+            LOGS.warning(f"Failed to load reference data '{key}': {e}")
+            raise
+
+        # An invalidation that happened while loading wins over the possibly outdated value
+        if generation == self._generation:
+            self._entries[key] = CacheEntry(value=value, fetched_at=time.monotonic())
+        return value
+
+    def invalidate(self, *prefixes: str):
+        """
+        Drops every entry whose key starts with one of the prefixes, e.g. 'accounts' drops
+        'accounts:asset' and 'accounts:revenue'. Without prefixes, drops everything.
+        """
+        self._generation += 1
+        for key in list(self._entries):
+            if not prefixes or key.startswith(prefixes):
+                del self._entries[key]
+
+
+reference_cache = ReferenceDataCache()
+
+
+class TransactionCache:
+    """
+    Short-lived cache of single Firefly transaction groups, keyed by transaction ID.
+
+    Entries are seeded from create and update responses and dropped on failed writes, so a
+    customization action followed by a refresh of the transaction details costs one request.
+    Values are copied on the way in and out, because callers edit the returned JSON to build
+    their update payloads.
+    """
+
+    def __init__(self, ttl: float = TRANSACTION_CACHE_TTL_SECONDS, max_entries: int = TRANSACTION_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+
+    def get(self, transaction_id) -> Union[dict, None]:
+        key = str(transaction_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.fetched_at >= self.ttl:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return copy.deepcopy(entry.value)
+
+    def put(self, transaction_id, response: dict):
+        """
+        Stores a Firefly response holding the transaction group under 'data'.
+        """
+        if self.ttl <= 0 or transaction_id is None or not isinstance(response, dict) or 'data' not in response:
+            return
+
+        key = str(transaction_id)
+        self._entries[key] = CacheEntry(value=copy.deepcopy(response), fetched_at=time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, transaction_id):
+        self._entries.pop(str(transaction_id), None)
+
+
+transaction_cache = TransactionCache()
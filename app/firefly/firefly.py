@@ -1,15 +1,84 @@
-import requests
-import os
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
 
-from app import FIREFLY_BASE_URL, FIREFLY_API_KEY
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app import (
+    FIREFLY_BASE_URL,
+    FIREFLY_API_KEY,
+    FIREFLY_POOL_SIZE,
+    FIREFLY_CONNECT_TIMEOUT,
+    FIREFLY_READ_TIMEOUT,
+    FIREFLY_MAX_RETRIES,
+    FIREFLY_PAGE_SIZE,
+    FIREFLY_PAGE_CONCURRENCY,
+)
 from app.models.transaction_models import Account, Budget, Category, Bill
 
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Get the process-wide HTTP session used for all Firefly API calls.
+    The session keeps connections to Firefly alive and pools them, so repeated
+    calls reuse an open TCP/TLS connection instead of performing a new handshake.
+    :return: Shared requests session
+    """
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retries = Retry(
+                    total=FIREFLY_MAX_RETRIES,
+                    backoff_factor=0.3,
+                    status_forcelist=(502, 503, 504),
+                    allowed_methods=frozenset({'GET', 'PUT'}),
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=FIREFLY_POOL_SIZE,
+                    max_retries=retries,
+                )
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update({
+                    'Authorization': f'Bearer {FIREFLY_API_KEY}',
+                    'Connection': 'keep-alive',
+                })
+                _session = session
+
+    return _session
+
+
+def close_session():
+    """
+    Close the shared HTTP session and release its pooled connections.
+    """
+    global _session
+
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
 
 class FireflyApi:
     def __init__(self):
         self.base_url = FIREFLY_BASE_URL
         self.api_url = self.base_url + '/api/v1'
         self.api_key = FIREFLY_API_KEY
+        self.session = get_session()
+        self.timeout = (FIREFLY_CONNECT_TIMEOUT, FIREFLY_READ_TIMEOUT)
 
     def construct_url(self, endpoint: str):
         """
@@ -32,9 +101,10 @@ class FireflyApi:
         }
 
         if params:
-            response = requests.get(self.construct_url(endpoint), headers=headers, params=params)
+            response = self.session.get(self.construct_url(endpoint), headers=headers, params=params,
+                                        timeout=self.timeout)
         else:
-            response = requests.get(self.construct_url(endpoint), headers=headers)
+            response = self.session.get(self.construct_url(endpoint), headers=headers, timeout=self.timeout)
 
         if response.status_code == 200:
             try:
@@ -68,7 +138,7 @@ class FireflyApi:
             'Authorization': f'Bearer {self.api_key}'
         }
 
-        response = requests.post(url, headers=headers, json=payload)
+        response = self.session.post(url, headers=headers, json=payload, timeout=self.timeout)
 
         if debug:
             return response
@@ -90,7 +160,7 @@ class FireflyApi:
             'Authorization': f'Bearer {self.api_key}',
             'Content-Type': 'application/json'
         }
-        response = requests.put(url, headers=headers, json=payload)
+        response = self.session.put(url, headers=headers, json=payload, timeout=self.timeout)
 
         if response.status_code in (200, 204):
             return response.json() if response.status_code == 200 else {"message": "Request successful"}
@@ -111,7 +181,7 @@ class FireflyApi:
         
         with open(file_path, 'rb') as file:
             files = {'file': file}
-            response = requests.post(url, headers=headers, files=files)
+            response = self.session.post(url, headers=headers, files=files, timeout=self.timeout)
 
         if response.status_code in (200, 201, 204):
             return response.json() if response.status_code in (200, 201) else {"message": "Request successful"}
@@ -184,32 +254,66 @@ class FireflyApi:
         """
         return self.get_json(f"/accounts/{account_id}/transactions")
 
-    def accounts(self, account_type: str, get_all: bool = False):
-        params = {
-            'type': account_type,
-            'limit': 20
-        }
+    def iter_pages(self, endpoint: str, params: dict = None) -> Iterator[list[dict]]:
+        """
+        Iterate over every page of a paginated endpoint, in page order.
+        The first page reveals the page count; the remaining pages are then fetched
+        through a sliding window of FIREFLY_PAGE_CONCURRENCY requests and yielded in order, so
+        at most that many pages are held in memory while the caller processes one.
+        :param endpoint: API endpoint
+        :param params: Query parameters
+        :return: Iterator over the 'data' list of each page
+        """
+        params = dict(params or {})
+        params.setdefault('limit', FIREFLY_PAGE_SIZE)
+        params['page'] = 1
+
+        response = self.get_json(endpoint, params)
+        yield response.get('data', [])
 
-        response = self.get_json(endpoint='accounts', params=params)
+        total_pages = response.get('meta', {}).get('pagination', {}).get('total_pages') or 1
+        if total_pages <= 1:
+            return
 
+        def fetch_page(page: int) -> list[dict]:
+            return self.get_json(endpoint, {**params, 'page': page}).get('data', [])
+
+        pages = iter(range(2, total_pages + 1))
+        with ThreadPoolExecutor(max_workers=FIREFLY_PAGE_CONCURRENCY) as executor:
+            window = deque(executor.submit(fetch_page, page)
+                           for page in itertools.islice(pages, FIREFLY_PAGE_CONCURRENCY))
+            try:
+                while window:
+                    yield window.popleft().result()
+                    next_page = next(pages, None)
+                    if next_page is not None:
+                        window.append(executor.submit(fetch_page, next_page))
+            finally:
+                for future in window:
+                    future.cancel()
+
+    def iter_accounts(self, account_type: str) -> Iterator[dict]:
+        """
+        Stream all accounts of a type, in Firefly's order.
+        :param account_type: Firefly account type (asset, expense, revenue, ...)
+        :return: Iterator over account objects
+        """
+        for page in self.iter_pages('accounts', {'type': account_type}):
+            yield from page
+
+    def accounts(self, account_type: str, get_all: bool = False):
         if not get_all:
+            params = {
+                'type': account_type,
+                'limit': 20
+            }
+            response = self.get_json(endpoint='accounts', params=params)
             try:
                 return response['data']
             except KeyError:
                 return []
 
-        accounts = response['data']
-        current_page = response['meta']['pagination']['current_page'] or 1
-        total_pages = response['meta']['pagination']['total_pages'] or 1
-
-        while current_page < total_pages:
-            current_page += 1
-            params['page'] = current_page
-
-            response = self.get_json(endpoint='accounts', params=params)
-            accounts += response['data']
-
-        return accounts
+        return list(self.iter_accounts(account_type))
 
     def update_account_name(self, account_id: int, new_name: str):
         """
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+import asyncio
+import logging
+
+from app import MIRROR_SYNC_INTERVAL_MINUTES, MIRROR_FULL_SYNC_HOURS
+from app.database.transactionsdb import TransactionsDB
+from app.database.vendorprofilesdb import VendorProfilesDB
+from app.firefly.async_firefly import AsyncFireflyApi
+
+LOGS = logging.getLogger(__name__)
+
+
+def _as_utc(value: datetime | None) -> datetime | None:
+    # pymongo returns naive UTC datetimes
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class TransactionMirror:
+    """
+    Keeps the local transaction mirror (TransactionsDB) in step with Firefly.
+
+    A full sync pages through every transaction and prunes anything Firefly no longer has.
+    Between full syncs, only transactions updated since the previous sync are fetched.
+    Every synced page is also applied to the vendor profiles, which backfills them and
+    picks up edits made outside the bot.
+    """
+
+    def __init__(self):
+        self.db = TransactionsDB()
+        self.profiles = VendorProfilesDB()
+        self.api = AsyncFireflyApi()
+
+    async def sync(self):
+        """
+        Runs a full sync if one is due, otherwise an incremental sync.
+        """
+        state = await asyncio.to_thread(self.db.get_state)
+        started_at = datetime.now(timezone.utc)
+        last_full_sync_at = _as_utc(state.get('last_full_sync_at'))
+        last_sync_at = _as_utc(state.get('last_sync_at'))
+
+        if not last_full_sync_at or not last_sync_at \
+                or started_at - last_full_sync_at >= timedelta(hours=MIRROR_FULL_SYNC_HOURS):
+            await self.full_sync(started_at)
+        else:
+            await self.incremental_sync(last_sync_at, started_at)
+
+    async def full_sync(self, started_at: datetime):
+        groups = 0
+        async for page in self.api.iter_pages('transactions'):
+            groups += await asyncio.to_thread(self.db.upsert_groups, page, started_at)
+            await asyncio.to_thread(self.profiles.apply_groups, page)
+
+        pruned = await asyncio.to_thread(self.db.prune_not_synced_since, started_at)
+        # Transactions deleted in Firefly no longer count towards their vendor's profile
+        await asyncio.to_thread(self.profiles.remove_splits, pruned)
+        await asyncio.to_thread(self.db.set_state, last_full_sync_at=started_at, last_sync_at=started_at)
+        LOGS.info(f"Transaction mirror full sync complete: {groups} groups, {len(pruned)} stale splits pruned")
+
+    async def incremental_sync(self, since: datetime, started_at: datetime):
+        # Firefly's updated_at search operators work on whole days, so re-read from the day before
+        since_day = (since - timedelta(days=1)).strftime('%Y-%m-%d')
+        params = {'query': f'updated_at_after:{since_day}'}
+
+        groups = 0
+        async for page in self.api.iter_pages('search/transactions', params):
+            groups += await asyncio.to_thread(self.db.upsert_groups, page, started_at)
+            await asyncio.to_thread(self.profiles.apply_groups, page)
+
+        await asyncio.to_thread(self.db.set_state, last_sync_at=started_at)
+        LOGS.info(f"Transaction mirror incremental sync complete: {groups} groups updated since {since_day}")
+
+    async def run(self):
+        """
+        Syncs forever, every MIRROR_SYNC_INTERVAL_MINUTES. Meant to run as a background task.
+        """
+        try:
+            await asyncio.to_thread(self.db.ensure_indexes)
+        except Exception as e:
+            LOGS.error(f"Failed to create transaction mirror indexes: {e}")
+
+        while True:
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOGS.error(f"Transaction mirror sync failed: {e}")
+
+            await asyncio.sleep(MIRROR_SYNC_INTERVAL_MINUTES * 60)
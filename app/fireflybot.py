@@ -1,6 +1,7 @@
 from pyrogram import Client
 from pyrogram.raw.all import layer
 from pyrogram.types import BotCommand, BotCommandScopeChat
+import asyncio
 import logging
 import app
 
@@ -10,6 +11,7 @@ LOGS = logging.getLogger(__name__)
 class FireflyParserBot(Client):
     def __init__(self, version='0.0.0', **kwargs):
         self.version = version
+        self.background_tasks: list[asyncio.Task] = []
 
         super().__init__(
             'firefly_parser_bot',
@@ -40,10 +42,48 @@ class FireflyParserBot(Client):
                     BotCommand('syncvendors', 'Fetch all vendors from Firefly'),
                     BotCommand('foreignsum', 'Show foreign transaction summary'),
                     BotCommand('foreignsum_help', 'Show usage instructions for /foreignsum'),
+                    BotCommand('parserstats', 'Show how SMS messages were parsed'),
                 ],
                 scope=BotCommandScopeChat(chat_id=chat)
             )
 
+        from app.database.vendorsdb import VendorsDB
+        try:
+            vendors_db = VendorsDB()
+            vendors_db.ensure_indexes()
+            vendors_db.backfill_normalized_fields()
+            vendors_db.load_index()
+        except Exception as e:
+            LOGS.error(f"Failed to prepare the vendors collection: {e}")
+
+        from app.database.transactionledgerdb import TransactionLedgerDB
+        try:
+            TransactionLedgerDB().ensure_indexes()
+        except Exception as e:
+            LOGS.error(f"Failed to prepare the transaction ledger collection: {e}")
+
+        if app.LEARNED_TEMPLATES_ENABLED:
+            from app.database.smstemplatesdb import SmsTemplatesDB
+            try:
+                SmsTemplatesDB().ensure_indexes()
+            except Exception as e:
+                LOGS.error(f"Failed to prepare the SMS templates collection: {e}")
+
+        if app.EXTRACTION_CACHE_ENABLED:
+            from app.database.extractioncachedb import ExtractionCacheDB
+            try:
+                ExtractionCacheDB().ensure_indexes()
+            except Exception as e:
+                LOGS.error(f"Failed to prepare the extraction cache collection: {e}")
+
+        if app.MIRROR_ENABLED:
+            from app.firefly.mirror import TransactionMirror
+            self.background_tasks.append(asyncio.create_task(TransactionMirror().run()))
+
+        if app.QUEUE_ENABLED:
+            from app.ingestion import ingestion_queue
+            self.background_tasks.append(asyncio.create_task(ingestion_queue.run(self)))
+
         me = await self.get_me()
         LOGS.info(f"{self.__class__.__name__} v{self.version} (Layer {layer}) started on @{me.username}.\n"
                   f"Firefly Parser Bot is ready to serve.")
@@ -53,5 +93,22 @@ class FireflyParserBot(Client):
         Stop function
         :param args:
         """
+        for task in self.background_tasks:
+            task.cancel()
+        await asyncio.gather(*self.background_tasks, return_exceptions=True)
+        self.background_tasks = []
+
         await super().stop()
+
+        from app.database import close_database
+        from app.database.vendors_repository import close_executor
+        from app.firefly.async_firefly import close_async_client
+        from app.firefly.firefly import close_session
+        from app.plugins.transaction_utils import close_groq_client
+        await close_async_client()
+        await close_groq_client()
+        close_session()
+        close_executor()
+        close_database()
+
         LOGS.info(f"{self.__class__.__name__} stopped. Bye.")
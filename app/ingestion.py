@@ -0,0 +1,182 @@
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+import asyncio
+import logging
+
+from app import (
+    QUEUE_WORKERS,
+    QUEUE_MAX_ATTEMPTS,
+    QUEUE_RETRY_BASE_SECONDS,
+    QUEUE_RETRY_MAX_SECONDS,
+    QUEUE_LEASE_SECONDS,
+    QUEUE_POLL_SECONDS,
+)
+from app.database.ingestionjobsdb import IngestionJobsDB
+
+LOGS = logging.getLogger(__name__)
+
+# Renew a running job's lease this often, as a fraction of the lease
+LEASE_RENEWAL_FRACTION = 1 / 3
+
+JobHandler = Callable[[object, dict], Awaitable[Optional[dict]]]
+DeadLetterHandler = Callable[[object, dict, str], Awaitable[None]]
+
+
+class RetryableIngestionError(Exception):
+    """
+    A transient failure (Groq or Firefly unavailable) after which the job should be retried.
+    """
+
+
+class IngestionQueue:
+    """
+    Mongo-backed job queue processed by a pool of async workers.
+
+    Handlers are registered per job kind. A handler that raises RetryableIngestionError is
+    retried with exponential backoff; after QUEUE_MAX_ATTEMPTS, or on any other exception, the
+    job is dead-lettered and the kind's dead-letter handler is told about it. While a handler
+    runs, the job's lease is renewed so no other worker claims it. A job whose lease keeps
+    expiring (the worker dies or hangs on it) is dead-lettered once it has used its attempts.
+    """
+
+    def __init__(self):
+        self._handlers: dict[str, tuple[JobHandler, Optional[DeadLetterHandler]]] = {}
+        self._wakeup = asyncio.Event()
+
+    @property
+    def db(self) -> IngestionJobsDB:
+        return IngestionJobsDB()
+
+    def register(self, kind: str, handler: JobHandler, on_dead_letter: Optional[DeadLetterHandler] = None):
+        self._handlers[kind] = (handler, on_dead_letter)
+
+    async def enqueue(self, kind: str, payload: dict, chat_id: int, message_id: int,
+                      ack_message_id: Optional[int] = None):
+        job_id = await asyncio.to_thread(self.db.enqueue, kind, payload, chat_id, message_id, ack_message_id)
+        self._wakeup.set()
+        return job_id
+
+    async def run(self, client):
+        """
+        Runs QUEUE_WORKERS workers forever. Meant to run as a background task.
+        """
+        try:
+            await asyncio.to_thread(self.db.ensure_indexes)
+            counts = await asyncio.to_thread(self.db.count_by_status)
+            LOGS.info(f"Ingestion queue started with {QUEUE_WORKERS} workers, jobs by status: {counts}")
+        except Exception as e:
+            LOGS.error(f"Failed to prepare the ingestion queue: {e}")
+
+        workers = [asyncio.create_task(self._worker(client)) for _ in range(QUEUE_WORKERS)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    async def _worker(self, client):
+        while True:
+            await self._dead_letter_abandoned(client)
+
+            try:
+                job = await asyncio.to_thread(self.db.claim, QUEUE_LEASE_SECONDS, QUEUE_MAX_ATTEMPTS)
+            except Exception as e:
+                LOGS.error(f"Failed to claim an ingestion job: {e}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=QUEUE_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            try:
+                await self._process(client, job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOGS.error(f"Failed to process ingestion job {job['_id']}: {e}")
+
+    async def _dead_letter_abandoned(self, client):
+        """
+        Dead-letters jobs that used up their attempts without ever reporting back (the worker
+        crashed or hung on each one), which _fail never sees.
+        """
+        while True:
+            try:
+                job = await asyncio.to_thread(self.db.dead_letter_abandoned, QUEUE_MAX_ATTEMPTS)
+            except Exception as e:
+                LOGS.error(f"Failed to dead-letter abandoned ingestion jobs: {e}")
+                return
+            if job is None:
+                return
+
+            LOGS.error(f"Ingestion job {job['_id']} dead-lettered: {job['last_error']}")
+            _, on_dead_letter = self._handlers.get(job['kind'], (None, None))
+            await self._notify_dead_letter(client, job, on_dead_letter, job['last_error'])
+
+    async def _notify_dead_letter(self, client, job: dict, on_dead_letter: Optional[DeadLetterHandler], error: str):
+        if on_dead_letter is None:
+            return
+        try:
+            await on_dead_letter(client, job, error)
+        except Exception as e:
+            LOGS.error(f"Dead-letter handler failed for job {job['_id']}: {e}")
+
+    async def _process(self, client, job: dict):
+        handler, on_dead_letter = self._handlers.get(job['kind'], (None, None))
+        if handler is None:
+            await asyncio.to_thread(self.db.dead_letter, job['_id'], f"No handler for job kind '{job['kind']}'")
+            return
+
+        heartbeat = asyncio.create_task(self._renew_lease(job))
+        try:
+            result = await handler(client, job)
+        except asyncio.CancelledError:
+            # The lease expires and another worker picks the job up again
+            raise
+        except Exception as e:
+            await self._fail(client, job, on_dead_letter, e)
+            return
+        finally:
+            heartbeat.cancel()
+
+        await asyncio.to_thread(self.db.complete, job['_id'], result)
+
+    async def _renew_lease(self, job: dict):
+        """
+        Extends the lease of a running job until cancelled, so a handler that outlives the
+        lease (slow Groq or Firefly responses) does not get its job claimed a second time.
+        """
+        while True:
+            await asyncio.sleep(QUEUE_LEASE_SECONDS * LEASE_RENEWAL_FRACTION)
+            try:
+                renewed = await asyncio.to_thread(self.db.renew_lease, job['_id'], job['attempts'], QUEUE_LEASE_SECONDS)
+            except Exception as e:
+                LOGS.warning(f"Failed to renew the lease of ingestion job {job['_id']}: {e}")
+                continue
+            if not renewed:
+                LOGS.warning(f"Lost the lease of ingestion job {job['_id']}")
+                return
+
+    async def _fail(self, client, job: dict, on_dead_letter: Optional[DeadLetterHandler], error: Exception):
+        error_message = f"{type(error).__name__}: {error}"
+
+        # Only transient failures are worth retrying; anything else fails the same way every time
+        if not isinstance(error, RetryableIngestionError) or job['attempts'] >= QUEUE_MAX_ATTEMPTS:
+            LOGS.error(f"Ingestion job {job['_id']} dead-lettered after {job['attempts']} attempts: {error_message}")
+            await asyncio.to_thread(self.db.dead_letter, job['_id'], error_message)
+            await self._notify_dead_letter(client, job, on_dead_letter, error_message)
+            return
+
+        delay = min(QUEUE_RETRY_BASE_SECONDS * 2 ** (job['attempts'] - 1), QUEUE_RETRY_MAX_SECONDS)
+        LOGS.warning(f"Ingestion job {job['_id']} failed (attempt {job['attempts']}), "
+                     f"retrying in {delay:.0f}s: {error_message}")
+        await asyncio.to_thread(
+            self.db.retry, job['_id'], error_message, datetime.now(timezone.utc) + timedelta(seconds=delay)
+        )
+
+
+ingestion_queue = IngestionQueue()
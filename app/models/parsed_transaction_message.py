@@ -1,14 +1,42 @@
+from collections import Counter
+from dataclasses import dataclass
 from datetime import datetime
 from typing import Union
+import asyncio
 import logging
-import os
 
-from app import FIREFLY_DEFAULT_ACCOUNT_ID
-from app.database.vendorsdb import VendorsDB
-from app.firefly.firefly import FireflyApi
+from app import (
+    FIREFLY_DEFAULT_ACCOUNT_ID,
+    MIRROR_ENABLED,
+    VENDOR_FUZZY_MATCH_ENABLED,
+    VENDOR_FUZZY_AUTO_ACCEPT_SCORE,
+    VENDOR_FUZZY_SUGGEST_SCORE,
+    VENDOR_PROFILE_AUTO_BUDGET,
+)
+from app.database.transactionsdb import TransactionsDB
+from app.database.vendorprofilesdb import VendorProfilesDB
+from app.database.vendor_index import clean_string_for_match
+from app.database.vendors_repository import VendorsRepository
+from app.firefly.async_firefly import AsyncFireflyApi, mirror_transaction_group, update_vendor_profiles
+from app.firefly.cache import transaction_cache
 
 LOGS = logging.getLogger(__name__)
 
+# Marks a memoized lookup that has not been performed yet (None is a valid "no match" result)
+_NOT_LOOKED_UP = object()
+
+# Number of past transactions considered when guessing a description or category
+ACCOUNT_HISTORY_LIMIT = 50
+
+
+@dataclass
+class VendorSuggestion:
+    """
+    A known vendor similar to, but not similar enough to be used for, an unmatched location.
+    """
+    vendor: dict
+    score: float
+
 
 class ParsedTransactionMessage:
     def __init__(
@@ -21,7 +49,8 @@ class ParsedTransactionMessage:
             reference_no: str,
             card: Union[None, str] = None,
             approval_code: Union[None, str] = None,
-            raw_transaction_message: Union[None, str] = None
+            raw_transaction_message: Union[None, str] = None,
+            source: str = 'groq'
     ):
         self.card = card
         self.date = date
@@ -33,6 +62,16 @@ class ParsedTransactionMessage:
         self.reference_no = reference_no
         self.is_receipt = False
         self.raw_transaction_message = raw_transaction_message
+        self.source = source
+        # Set to the idempotency ledger's external ID so an uncertain POST can be looked up later
+        self.external_id: Union[None, str] = None
+
+        # Per-message memoization so one message costs one vendor lookup and one history fetch
+        self._vendor = _NOT_LOOKED_UP
+        self._vendor_profile = _NOT_LOOKED_UP
+        self._account_transactions = None
+        # Set by get_vendor when the location only loosely matches a known vendor
+        self.vendor_suggestion: Union[None, VendorSuggestion] = None
 
     @staticmethod
     def make(data):
@@ -85,7 +124,7 @@ class ParsedTransactionMessage:
             LOGS.error(f"Error parsing date: {e}.  datetime_string: {datetime_string}, format_string: {date_format}")
             return None
 
-    def get_similar_account(self, default_name: bool = False):
+    async def get_similar_account(self, default_name: bool = False):
         """
         Tries to find a matching vendor account for the transaction location.
         
@@ -97,103 +136,200 @@ class ParsedTransactionMessage:
             the title-cased location if default_name is True and no match is found,
             or None if no match is found and default_name is False.
         """
-        # Log the location we're trying to match
-        LOGS.info(f"Looking for vendor match: '{self.location}'")
-        
-        # Try to find a matching vendor
-        vendor_db = VendorsDB()
-        similar_account = vendor_db.find_vendor_by_name_or_alias(self.location)
-        
+        similar_account = await self.get_vendor()
+
         if similar_account is None:
-            # Log that we didn't find a match
-            cleaned = vendor_db.clean_string_for_match(self.location)
-            LOGS.info(f"No vendor match found for: '{self.location}' (cleaned: '{cleaned}')")
-            
             if default_name:
                 return self.location.title()
             else:
                 return None
         else:
-            # Log that we found a match
-            vendor_name = similar_account.get('name')
-            vendor_id = similar_account.get('firefly_account_id')
-            LOGS.info(f"Vendor match found: '{vendor_name}' (ID: {vendor_id}) for '{self.location}'")
-            
-            return int(vendor_id)
+            return int(similar_account.get('firefly_account_id'))
 
-    def get_similar_transaction_descriptions(self):
-        first_similar_account_id = self.get_similar_account()
+    async def get_vendor(self):
+        """
+        Looks up the vendor document for the transaction location, off the event loop.
+        The result (including a miss) is memoized for the lifetime of this message.
 
-        if first_similar_account_id is None:
-            return []
+        Returns:
+            The matching vendor document or None if no match is found.
+        """
+        if self._vendor is not _NOT_LOOKED_UP:
+            return self._vendor
 
-        try:
-            raw_transactions = FireflyApi().get_transactions_from_account(first_similar_account_id)
-        except Exception as e:
-            LOGS.warning(f"Failed to get similar transaction descriptions: {e}")
-            return []
+        # Log the location we're trying to match
+        LOGS.info(f"Looking for vendor match: '{self.location}'")
+
+        # Try to find a matching vendor
+        repository = VendorsRepository()
+        vendor = await repository.find_vendor_by_name_or_alias(self.location)
+        if vendor is None and VENDOR_FUZZY_MATCH_ENABLED:
+            vendor = await self._find_similar_vendor(repository)
+
+        if vendor is None:
+            # Log that we didn't find a match
+            cleaned = clean_string_for_match(self.location)
+            LOGS.info(f"No vendor match found for: '{self.location}' (cleaned: '{cleaned}')")
+        else:
+            # Log that we found a match
+            vendor_name = vendor.get('name')
+            vendor_id = vendor.get('firefly_account_id')
+            LOGS.info(f"Vendor match found: '{vendor_name}' (ID: {vendor_id}) for '{self.location}'")
 
-        transaction_descriptions = []
+        self._vendor = vendor
+        return vendor
 
-        for raw_transaction in raw_transactions['data']:
-            inner_transactions = raw_transaction['attributes']['transactions']
+    async def _find_similar_vendor(self, repository: VendorsRepository):
+        """
+        Falls back to the most similar vendor by name or alias. It is used when its score reaches
+        VENDOR_FUZZY_AUTO_ACCEPT_SCORE, and otherwise kept as vendor_suggestion when it reaches
+        VENDOR_FUZZY_SUGGEST_SCORE.
 
-            for inner_transaction in inner_transactions:
-                transaction_descriptions.append(inner_transaction['description'])
+        Returns:
+            The auto-accepted vendor document or None.
+        """
+        candidates = await repository.find_similar_vendors(self.location, limit=1, min_score=VENDOR_FUZZY_SUGGEST_SCORE)
+        if not candidates:
+            return None
 
-        return transaction_descriptions
+        vendor, score = candidates[0]
+        if not vendor.get('firefly_account_id'):
+            return None
+        if score >= VENDOR_FUZZY_AUTO_ACCEPT_SCORE:
+            LOGS.info(f"Fuzzy vendor match accepted: '{vendor.get('name')}' ({score:.2f}) for '{self.location}'")
+            return vendor
 
-    def get_possible_transaction_description(self):
-        similar_descriptions = self.get_similar_transaction_descriptions()
+        LOGS.info(f"Fuzzy vendor match suggested: '{vendor.get('name')}' ({score:.2f}) for '{self.location}'")
+        self.vendor_suggestion = VendorSuggestion(vendor=vendor, score=score)
+        return None
 
-        unique_descriptions = []
+    async def get_account_transactions(self) -> list:
+        """
+        Fetches the transaction history of the matched vendor account, newest first.
+        Reads from the local transaction mirror when it is available, otherwise from Firefly.
+        A successful fetch is memoized for the lifetime of this message.
 
-        for description in similar_descriptions:
-            if description not in unique_descriptions:
-                unique_descriptions.append(description)
+        Returns:
+            The list of transaction splits (dicts with at least 'description' and 'category_id'),
+            or an empty list if there is no matching vendor.
+        """
+        if self._account_transactions is not None:
+            return self._account_transactions
 
-        if len(unique_descriptions) > 0:
-            return unique_descriptions[0]
-        else:
-            return 'ADD DESCRIPTION TO THIS TRANSACTION'
+        similar_account_id = await self.get_similar_account()
+        if similar_account_id is None:
+            self._account_transactions = []
+            return self._account_transactions
 
-    def get_possible_category(self):
-        transaction_categories = []
+        if MIRROR_ENABLED:
+            try:
+                transactions_db = TransactionsDB()
+                if await asyncio.to_thread(transactions_db.is_ready):
+                    self._account_transactions = await asyncio.to_thread(
+                        transactions_db.find_by_destination, similar_account_id, ACCOUNT_HISTORY_LIMIT
+                    )
+                    return self._account_transactions
+            except Exception as e:
+                LOGS.warning(f"Failed to read account history from the transaction mirror: {e}")
 
-        if self.get_similar_account() is None:
-            return None
+        raw_transactions = await AsyncFireflyApi().get_transactions_from_account(similar_account_id)
+        self._account_transactions = [
+            inner_transaction
+            for raw_transaction in raw_transactions['data']
+            for inner_transaction in raw_transaction['attributes']['transactions']
+        ]
+        return self._account_transactions
 
-        raw_transactions = FireflyApi().get_transactions_from_account(self.get_similar_account())
+    async def get_similar_transaction_descriptions(self):
+        try:
+            raw_transactions = await self.get_account_transactions()
+        except Exception as e:
+            LOGS.warning(f"Failed to get similar transaction descriptions: {e}")
+            return []
 
-        for raw_transaction in raw_transactions['data']:
-            inner_transactions = raw_transaction['attributes']['transactions']
+        return [inner_transaction['description'] for inner_transaction in raw_transactions]
 
-            for inner_transaction in inner_transactions:
-                transaction_categories.append(inner_transaction['category_id'])
+    async def get_vendor_profile(self):
+        """
+        Reads the materialized profile of the matched vendor account (one indexed read).
+        The result (including a miss) is memoized for the lifetime of this message.
 
-        categories = list(set(transaction_categories))
+        Returns:
+            The vendor profile document, or None if there is no matching vendor or no profile yet.
+        """
+        if self._vendor_profile is not _NOT_LOOKED_UP:
+            return self._vendor_profile
 
-        if len(categories) >= 1:
-            return categories[0]
+        self._vendor_profile = None
+        similar_account_id = await self.get_similar_account()
+        if similar_account_id is not None:
+            try:
+                self._vendor_profile = await asyncio.to_thread(VendorProfilesDB().get_profile, similar_account_id)
+            except Exception as e:
+                LOGS.warning(f"Failed to read the vendor profile: {e}")
+
+        return self._vendor_profile
+
+    async def get_possible_transaction_description(self):
+        profile = await self.get_vendor_profile()
+        description = VendorProfilesDB.most_frequent_value(profile.get('descriptions')) if profile else None
+        if description:
+            return description
+
+        # No profile yet: fall back to the most frequent description in the account history
+        similar_descriptions = [
+            description for description in await self.get_similar_transaction_descriptions() if description
+        ]
+        if similar_descriptions:
+            return Counter(similar_descriptions).most_common(1)[0][0]
+
+        return 'ADD DESCRIPTION TO THIS TRANSACTION'
+
+    async def get_possible_category(self):
+        profile = await self.get_vendor_profile()
+        category_id = VendorProfilesDB.most_frequent_id(profile.get('categories')) if profile else None
+        if category_id:
+            return category_id
+
+        # No profile or no categorised transactions in it: fall back to the account history
+        raw_transactions = await self.get_account_transactions()
+        transaction_categories = [
+            str(inner_transaction['category_id'])
+            for inner_transaction in raw_transactions
+            if inner_transaction.get('category_id')
+        ]
+        if transaction_categories:
+            return Counter(transaction_categories).most_common(1)[0][0]
 
         return None
 
-    def create_transaction_on_firefly(self, is_receipt: bool = False, image_path: str = None):
-        destination_account = self.get_similar_account(default_name=True)
+    async def get_possible_budget(self):
+        profile = await self.get_vendor_profile()
+        return VendorProfilesDB.most_frequent_id(profile.get('budgets')) if profile else None
+
+    async def create_transaction_on_firefly(self, is_receipt: bool = False, image_bytes: bytes = None,
+                                            image_filename: str = None):
+        destination_account = await self.get_similar_account(default_name=True)
         # Only use system tags
-        tags = ['powered-by-groq']
+        tags = ['powered-by-groq'] if self.source == 'groq' else ['parsed-locally']
         if is_receipt:
             tags += ['from-receipt', 'ocr']
         transaction_data = {
             'type': 'withdrawal',
             'date': self.getDate(is_receipt).isoformat(),
             'amount': self.get_amount(),
-            'description': self.get_possible_transaction_description(),
+            'description': await self.get_possible_transaction_description(),
             'source_id': FIREFLY_DEFAULT_ACCOUNT_ID,
-            'category_id': self.get_possible_category(),
+            'category_id': await self.get_possible_category(),
             'tags': tags,
             'notes': f'Raw transaction message: {self.raw_transaction_message}' if self.raw_transaction_message else None,
         }
+        if self.external_id:
+            transaction_data['external_id'] = self.external_id
+        if VENDOR_PROFILE_AUTO_BUDGET:
+            budget_id = await self.get_possible_budget()
+            if budget_id:
+                transaction_data['budget_id'] = budget_id
         if type(destination_account) is str:
             transaction_data['destination_name'] = destination_account
         if type(destination_account) is int:
@@ -208,35 +344,38 @@ class ParsedTransactionMessage:
             "fire_webhooks":            False,
             "error_if_duplicate_hash":  False
         }
-        response = FireflyApi().post_json('transactions', payload=payload, debug=True)
+        response = await AsyncFireflyApi().post_json('transactions', payload=payload, debug=True)
         
+        if response.status_code in (200, 201):
+            created = response.json()
+            await mirror_transaction_group(created)
+            await update_vendor_profiles(created)
+            transaction_cache.put(created.get('data', {}).get('id'), created)
+
         # If we have an image and the transaction was created successfully, attach the image
-        if image_path and response.status_code in (200, 201):
+        if image_bytes and response.status_code in (200, 201):
             try:
                 transaction_id = response.json()['data']['id']
-                self._attach_image_to_transaction(transaction_id, image_path)
+                await self._attach_image_bytes_to_transaction(transaction_id, image_bytes, image_filename)
             except Exception as e:
                 LOGS.error(f"Failed to attach image to transaction: {e}")
         
         return response
 
-    def _attach_image_to_transaction(self, transaction_id: str, image_path: str):
+    async def _attach_image_bytes_to_transaction(self, transaction_id: str, image_bytes: bytes,
+                                                 filename: Union[None, str] = None):
         """
-        Attach an image to a transaction in Firefly.
+        Attach an in-memory image to a transaction in Firefly.
         :param transaction_id: The ID of the transaction to attach the image to.
-        :param image_path: The path to the image file to attach.
+        :param image_bytes: The image content.
+        :param filename: The name to give the attachment.
         """
-        if not os.path.exists(image_path):
-            raise FileNotFoundError(f"Image file not found: {image_path}")
-        
-        # Get the filename from the path
-        filename = os.path.basename(image_path)
-        
-        # Create the attachment object
-        attachment_response = FireflyApi().create_attachment(transaction_id, filename)
+        filename = filename or f"receipt-{transaction_id}.jpg"
+
+        firefly_api = AsyncFireflyApi()
+        attachment_response = await firefly_api.create_attachment(transaction_id, filename)
         attachment_id = attachment_response['data']['id']
-        
-        # Upload the actual file
-        FireflyApi().upload_attachment_file(attachment_id, image_path)
-        
+
+        await firefly_api.upload_attachment_content(attachment_id, image_bytes)
+
         LOGS.info(f"Successfully attached image {filename} to transaction {transaction_id}")
@@ -0,0 +1,138 @@
+from io import BytesIO
+from pathlib import Path
+import logging
+import time
+
+from PIL import Image, ImageChops, ImageOps, UnidentifiedImageError
+
+from app import (
+    RECEIPT_PREPROCESSING_ENABLED,
+    RECEIPT_MAX_DIMENSION,
+    RECEIPT_JPEG_QUALITY,
+    RECEIPT_GRAYSCALE,
+    RECEIPT_KEEP_ON_DISK,
+    RECEIPT_DIRECTORY,
+    RECEIPT_RETENTION_DAYS,
+)
+
+LOGS = logging.getLogger(__name__)
+
+# Pixels closer than this to the border colour count as background when cropping
+CROP_THRESHOLD = 24
+
+# Margin kept around the cropped content, so text at the edges is not cut off
+CROP_MARGIN = 16
+
+
+def preprocessing_signature(
+        max_dimension: int = RECEIPT_MAX_DIMENSION,
+        quality: int = RECEIPT_JPEG_QUALITY,
+        grayscale: bool = RECEIPT_GRAYSCALE,
+) -> str:
+    """
+    Describes the preprocessing settings, so cached extractions are not reused after they change.
+    """
+    if not RECEIPT_PREPROCESSING_ENABLED:
+        return 'original'
+    return f'max{max_dimension}-q{quality}-{"gray" if grayscale else "color"}'
+
+
+def crop_to_content(image: Image.Image) -> Image.Image:
+    """
+    Trims the uniform border around a receipt (screenshot bars, the table a photo was taken on).
+    The colour of the top-left pixel is taken as the background.
+    """
+    background = Image.new(image.mode, image.size, image.getpixel((0, 0)))
+    difference = ImageChops.difference(image, background)
+    if difference.mode != 'L':
+        difference = difference.convert('L')
+    bbox = difference.point(lambda value: 255 if value > CROP_THRESHOLD else 0).getbbox()
+    if not bbox:
+        return image
+
+    left, top, right, bottom = bbox
+    return image.crop((
+        max(left - CROP_MARGIN, 0),
+        max(top - CROP_MARGIN, 0),
+        min(right + CROP_MARGIN, image.width),
+        min(bottom + CROP_MARGIN, image.height),
+    ))
+
+
+def transform_receipt(image_bytes: bytes, max_dimension: int, quality: int, grayscale: bool) -> bytes:
+    """
+    Crops the border of a receipt photo, optionally converts it to grayscale, bounds the
+    longest side to max_dimension and re-encodes it as JPEG, regardless of configuration.
+    :raises UnidentifiedImageError, OSError, ValueError: If the image cannot be processed
+    """
+    with Image.open(BytesIO(image_bytes)) as original:
+        image = ImageOps.exif_transpose(original)
+        image = image.convert('L' if grayscale else 'RGB')
+        image = crop_to_content(image)
+        image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+
+        output = BytesIO()
+        image.save(output, format='JPEG', quality=quality, optimize=True)
+        return output.getvalue()
+
+
+def preprocess_receipt(
+        image_bytes: bytes,
+        max_dimension: int = RECEIPT_MAX_DIMENSION,
+        quality: int = RECEIPT_JPEG_QUALITY,
+        grayscale: bool = RECEIPT_GRAYSCALE,
+) -> bytes:
+    """
+    Prepares a receipt photo for the vision model with transform_receipt, when receipt
+    preprocessing is enabled.
+    :param image_bytes: The photo as downloaded from Telegram
+    :return: JPEG bytes, or the original bytes if the image cannot be processed or would not shrink
+    """
+    if not RECEIPT_PREPROCESSING_ENABLED:
+        return image_bytes
+
+    try:
+        processed = transform_receipt(image_bytes, max_dimension, quality, grayscale)
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        LOGS.warning(f"Could not preprocess receipt image, sending it as is: {e}")
+        return image_bytes
+
+    if len(processed) >= len(image_bytes):
+        return image_bytes
+
+    LOGS.info(f"Receipt image preprocessed: {len(image_bytes)} -> {len(processed)} bytes")
+    return processed
+
+
+def save_receipt_copy(image_bytes: bytes, filename: str):
+    """
+    Keeps a copy of a receipt photo on disk when receipt_keep_on_disk is set, and removes
+    copies older than receipt_retention_days. Receipts are otherwise only held in memory.
+    """
+    if not RECEIPT_KEEP_ON_DISK:
+        return
+
+    directory = Path(RECEIPT_DIRECTORY)
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / Path(filename).name).write_bytes(image_bytes)
+
+    prune_receipt_copies(directory)
+
+
+def prune_receipt_copies(directory: Path) -> int:
+    """
+    Deletes receipt copies older than receipt_retention_days.
+
+    Returns:
+        The number of deleted files
+    """
+    cutoff = time.time() - RECEIPT_RETENTION_DAYS * 24 * 60 * 60
+    deleted = 0
+    for path in directory.iterdir():
+        try:
+            if path.is_file() and path.stat().st_mtime < cutoff:
+                path.unlink()
+                deleted += 1
+        except OSError as e:
+            LOGS.warning(f"Failed to prune receipt copy {path}: {e}")
+    return deleted
@@ -0,0 +1,124 @@
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+import logging
+import re
+
+from app import LEARNED_TEMPLATES_ENABLED
+from app.database.parserstatsdb import ParserStatsDB
+
+LOGS = logging.getLogger(__name__)
+
+# Keys ParsedTransactionMessage needs from a text (SMS) transaction
+REQUIRED_KEYS = [
+    'card', 'date', 'time', 'currency', 'amount',
+    'location', 'approval_code', 'reference_no'
+]
+
+# Date and time format of SMS alerts, as expected by ParsedTransactionMessage.getDate
+SMS_DATETIME_FORMAT = '%d/%m/%y %H:%M:%S'
+
+# In-process hit/miss counters, also persisted through ParserStatsDB
+SMS_PARSER_STATS = Counter()
+
+
+@dataclass(frozen=True)
+class SmsTemplate:
+    """
+    A known bank alert format. The pattern's named groups are the transaction keys.
+    """
+    name: str
+    pattern: re.Pattern
+
+
+SMS_TEMPLATES = [
+    # Transaction from 1234 on 16/10/26 at 14:32:11 for MVR123.45 at SHOP NAME was processed.
+    # Reference No:123456789012, Approval Code:123456.
+    SmsTemplate(
+        name='card_transaction',
+        pattern=re.compile(
+            r"Transaction from (?P<card>\d{4}) on (?P<date>\d{2}/\d{2}/\d{2}) at (?P<time>\d{2}:\d{2}:\d{2})"
+            r" for (?P<currency>[A-Z]{3}) ?(?P<amount>[\d,]+(?:\.\d+)?) at (?P<location>.+?)\s+was processed\."
+            r"\s*Reference No\s*:\s*(?P<reference_no>\w+)\s*,\s*Approval Code\s*:\s*(?P<approval_code>\w+)",
+            re.IGNORECASE | re.DOTALL
+        ),
+    ),
+]
+
+
+def normalize_details(details: dict) -> Optional[dict]:
+    """
+    Cleans values captured from an SMS and checks that the result is usable.
+    :param details: Captured values keyed by transaction key
+    :return: Normalized details, or None if a required value is missing or malformed
+    """
+    normalized = {key: (value.strip() if isinstance(value, str) else value) for key, value in details.items()}
+
+    if any(not normalized.get(key) for key in REQUIRED_KEYS):
+        return None
+
+    normalized['currency'] = normalized['currency'].upper()
+    try:
+        normalized['amount'] = float(str(normalized['amount']).replace(',', ''))
+        datetime.strptime(f"{normalized['date']} {normalized['time']}", SMS_DATETIME_FORMAT)
+    except ValueError:
+        return None
+
+    return normalized
+
+
+def match_templates(text: str, templates: list[SmsTemplate]) -> tuple[Optional[SmsTemplate], Optional[dict]]:
+    """
+    Tries the templates in order and returns the first one that yields usable details.
+    """
+    for template in templates:
+        match = template.pattern.search(text)
+        if not match:
+            continue
+
+        details = normalize_details(match.groupdict())
+        if details is not None:
+            return template, details
+
+    return None, None
+
+
+def record_parse(*counters: str):
+    """
+    Counts parser outcomes in memory and in the parser_stats collection.
+    """
+    SMS_PARSER_STATS.update(counters)
+    try:
+        ParserStatsDB().increment(*counters)
+    except Exception as e:
+        LOGS.warning(f"Failed to record SMS parser stats: {e}")
+
+
+def parse_sms(text: str) -> tuple[Optional[str], Optional[dict]]:
+    """
+    Parses a bank SMS locally, against the built-in templates first and then the active
+    templates learned from earlier LLM extractions.
+    :param text: The SMS text
+    :return: (template name, details) on a hit, or (None, None) if no template matches
+    """
+    if not text:
+        return None, None
+
+    template, details = match_templates(text, SMS_TEMPLATES)
+
+    if template is None and LEARNED_TEMPLATES_ENABLED:
+        from app.parsers.template_induction import learned_templates
+        try:
+            template, details = learned_templates.match(text)
+        except Exception as e:
+            LOGS.warning(f"Failed to match learned SMS templates: {e}")
+
+    if template is None:
+        record_parse('misses')
+        LOGS.info("No SMS template matched; falling back to the LLM")
+        return None, None
+
+    record_parse('hits', f"templates.{template.name}")
+    LOGS.info(f"SMS parsed locally with template '{template.name}'")
+    return template.name, details
@@ -0,0 +1,280 @@
+from typing import Optional
+import hashlib
+import logging
+import random
+import re
+import threading
+
+from app import LEARNED_TEMPLATE_PROMOTE_AFTER, LEARNED_TEMPLATE_EVICT_AFTER, LEARNED_TEMPLATE_VERIFY_RATE
+from app.database.smstemplatesdb import SmsTemplatesDB, ACTIVE, CANDIDATE
+from app.parsers.sms_templates import REQUIRED_KEYS, SmsTemplate, normalize_details
+
+LOGS = logging.getLogger(__name__)
+
+# Amounts are matched by value because the LLM returns 1045.0 for "1,045.00"
+AMOUNT_PATTERN = r'[\d,]+(?:\.\d+)?'
+NUMBER_IN_TEXT = re.compile(AMOUNT_PATTERN)
+
+# Free-text fields that may contain anything, including spaces and punctuation
+FREE_TEXT_KEYS = {'location'}
+
+
+def value_shape(value: str) -> str:
+    """
+    Generalizes a captured value into a pattern of the same shape,
+    e.g. "12/06/24" -> r"\\d+/\\d+/\\d+" and "MVR" -> "[A-Za-z]+".
+    """
+    parts = []
+    for token in re.findall(r'\d+|[A-Za-z]+|\s+|.', value):
+        if token.isdigit():
+            parts.append(r'\d+')
+        elif token.isalpha():
+            parts.append('[A-Za-z]+')
+        elif token.isspace():
+            parts.append(r'\s+')
+        else:
+            parts.append(re.escape(token))
+    return ''.join(parts)
+
+
+def literal_shape(text: str) -> str:
+    """
+    Generalizes the fixed text between captured values. Words stay literal, while numbers
+    (balances, counters) and runs of whitespace are allowed to vary.
+    """
+    parts = []
+    for token in re.findall(r'\d+|\s+|[^\d\s]+', text):
+        if token.isdigit():
+            parts.append(r'\d+')
+        elif token.isspace():
+            parts.append(r'\s+')
+        else:
+            parts.append(re.escape(token))
+    return ''.join(parts)
+
+
+def boundary(char: str, before: bool) -> str:
+    """
+    A lookaround that stops a value from matching inside a longer run of the same kind of
+    character, while still allowing "USD1,045.00" to split into a currency and an amount.
+    """
+    if char.isdigit():
+        run = r'\d'
+    elif char.isalpha():
+        run = '[A-Za-z]'
+    else:
+        return ''
+    return f'(?<!{run})' if before else f'(?!{run})'
+
+
+def find_value_span(text: str, key: str, value, taken: list[tuple[int, int]]) -> Optional[tuple[int, int]]:
+    """
+    Finds where an extracted value occurs in the raw text, skipping spans already
+    claimed by another key.
+    """
+    def is_free(start, end):
+        return all(end <= taken_start or start >= taken_end for taken_start, taken_end in taken)
+
+    if key == 'amount':
+        try:
+            amount = float(str(value).replace(',', ''))
+        except ValueError:
+            return None
+        for match in NUMBER_IN_TEXT.finditer(text):
+            try:
+                matched_amount = float(match.group().replace(',', ''))
+            except ValueError:
+                continue
+            if matched_amount == amount and is_free(*match.span()):
+                return match.span()
+        return None
+
+    value = str(value).strip()
+    if not value:
+        return None
+    for match in re.finditer(rf'{boundary(value[0], True)}{re.escape(value)}{boundary(value[-1], False)}',
+                             text, re.IGNORECASE):
+        if is_free(*match.span()):
+            return match.span()
+    return None
+
+
+def induce_pattern(text: str, details: dict) -> Optional[str]:
+    """
+    Derives a template from a raw SMS and the values the LLM extracted from it by aligning
+    each value with the span of text it came from.
+
+    Returns:
+        A regular expression with one named group per required key, or None if any value
+        could not be found verbatim in the text
+    """
+    text = text.strip()
+    spans = []
+    for key in REQUIRED_KEYS:
+        span = find_value_span(text, key, details.get(key), [span[:2] for span in spans])
+        if span is None:
+            return None
+        spans.append((*span, key))
+
+    spans.sort()
+    parts = []
+    position = 0
+    for start, end, key in spans:
+        parts.append(literal_shape(text[position:start]))
+        if key == 'amount':
+            value_pattern = AMOUNT_PATTERN
+        elif key in FREE_TEXT_KEYS:
+            value_pattern = '.+?'
+        else:
+            value_pattern = value_shape(text[start:end])
+        parts.append(f'(?P<{key}>{value_pattern})')
+        position = end
+    parts.append(literal_shape(text[position:]))
+
+    return ''.join(parts)
+
+
+def details_agree(first: dict, second: dict) -> bool:
+    """
+    Compares two extractions on the required keys, after normalization.
+    """
+    first, second = normalize_details(first), normalize_details(second)
+    if first is None or second is None:
+        return False
+    return all(str(first[key]).lower() == str(second[key]).lower() for key in REQUIRED_KEYS)
+
+
+def compile_pattern(pattern: str) -> re.Pattern:
+    return re.compile(pattern, re.IGNORECASE | re.DOTALL)
+
+
+class LearnedTemplates:
+    """
+    Process-wide view of the learned SMS templates.
+
+    Active templates are compiled once and kept in memory so matching never touches the
+    database; the cache is reloaded whenever this process promotes or evicts a template.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active: Optional[list[SmsTemplate]] = None
+
+    @staticmethod
+    def db() -> SmsTemplatesDB:
+        return SmsTemplatesDB()
+
+    def invalidate(self):
+        with self._lock:
+            self._active = None
+
+    def active_templates(self) -> list[SmsTemplate]:
+        with self._lock:
+            if self._active is None:
+                self._active = self._compile(self.db().get_templates(ACTIVE))
+            return self._active
+
+    @staticmethod
+    def _compile(documents: list[dict]) -> list[SmsTemplate]:
+        templates = []
+        for document in documents:
+            try:
+                templates.append(SmsTemplate(name=document['_id'], pattern=compile_pattern(document['pattern'])))
+            except re.error as e:
+                LOGS.warning(f"Skipping learned SMS template {document['_id']}: {e}")
+        return templates
+
+    def match(self, text: str) -> tuple[Optional[SmsTemplate], Optional[dict]]:
+        """
+        Matches the text against the active learned templates.
+        A template that matches but yields unusable values counts a failure.
+        """
+        text = text.strip()
+        for template in self.active_templates():
+            match = template.pattern.fullmatch(text)
+            if not match:
+                continue
+
+            details = normalize_details(match.groupdict())
+            if details is not None:
+                self.db().record_hit(template.name)
+                return template, details
+
+            self._penalize(self.db().record_failure(template.name), 'failures')
+
+        return None, None
+
+    def should_verify(self, template_name: str) -> bool:
+        """
+        Samples hits on active learned templates for a check against the LLM, so a template
+        that drifts from the bank's format after promotion is still caught and evicted.
+        """
+        if LEARNED_TEMPLATE_VERIFY_RATE <= 0 or random.random() >= LEARNED_TEMPLATE_VERIFY_RATE:
+            return False
+        return any(template.name == template_name for template in self.active_templates())
+
+    def verify(self, template_name: str, template_details: dict, llm_details: dict) -> bool:
+        """
+        Compares a learned template's extraction with the LLM's for the same message.
+        A disagreement counts a rejection, which evicts the template once it reaches the limit.
+        :return: Whether the template agreed with the LLM
+        """
+        db = self.db()
+        if details_agree(template_details, llm_details):
+            db.record_confirmation(template_name)
+            return True
+
+        LOGS.warning(f"Learned SMS template {template_name} disagreed with the LLM")
+        self._penalize(db.record_rejection(template_name), 'rejections')
+        return False
+
+    def learn(self, text: str, details: dict):
+        """
+        Learns from a successful LLM extraction: candidates that match the text are confirmed
+        or rejected against the LLM's values, and a new candidate is induced from the text.
+        """
+        text = text.strip()
+        db = self.db()
+
+        for document in db.get_templates(CANDIDATE):
+            try:
+                match = compile_pattern(document['pattern']).fullmatch(text)
+            except re.error:
+                db.evict(document['_id'])
+                continue
+            if not match:
+                continue
+
+            if details_agree(match.groupdict(), details):
+                document = db.record_confirmation(document['_id'])
+                if document and document['confirmations'] >= LEARNED_TEMPLATE_PROMOTE_AFTER:
+                    db.promote(document['_id'])
+                    self.invalidate()
+                    LOGS.info(f"Promoted learned SMS template {document['_id']}")
+            else:
+                self._penalize(db.record_rejection(document['_id']), 'rejections')
+
+        pattern = induce_pattern(text, details)
+        if pattern is None:
+            LOGS.info("Could not align the extracted values with the SMS; no template learned")
+            return
+
+        # Only keep patterns that reproduce the LLM's values for the message they came from
+        match = compile_pattern(pattern).fullmatch(text)
+        if not match or not details_agree(match.groupdict(), details):
+            LOGS.info("Induced SMS template does not reproduce the extraction; discarded")
+            return
+
+        template_id = hashlib.sha256(pattern.encode('utf-8')).hexdigest()[:16]
+        if db.add_candidate(template_id, pattern, text):
+            LOGS.info(f"Learned new candidate SMS template {template_id}")
+
+    def _penalize(self, document: Optional[dict], counter: str):
+        if document and document.get(counter, 0) >= LEARNED_TEMPLATE_EVICT_AFTER:
+            self.db().evict(document['_id'])
+            if document.get('status') == ACTIVE:
+                self.invalidate()
+            LOGS.info(f"Evicted learned SMS template {document['_id']} after {document[counter]} {counter}")
+
+
+learned_templates = LearnedTemplates()
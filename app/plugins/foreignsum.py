@@ -1,15 +1,22 @@
 from pyrogram import filters
 from pyrogram.types import Message
+import asyncio
 import calendar
+import contextlib
 import csv
+import heapq
 import os
 from datetime import datetime, timezone
-from app import FireflyParserBot, TELEGRAM_ADMINS, LOGS
-from app.firefly.firefly import FireflyApi
-from dataclasses import dataclass, asdict
-from typing import List, Optional
+from app import FireflyParserBot, TELEGRAM_ADMINS, LOGS, MIRROR_ENABLED
+from app.database.transactionsdb import TransactionsDB
+from app.firefly.async_firefly import AsyncFireflyApi
+from dataclasses import dataclass, asdict, fields
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 MVR_PER_USD = 15.42
+RECENT_TRANSACTIONS_LIMIT = 10
+# Mirror documents read per worker-thread round trip
+MIRROR_READ_BATCH_SIZE = 500
 
 
 @dataclass
@@ -126,66 +133,134 @@ E.g., `/foreignsum range 2025-01-01 2025-01-31`''',
                            start_date=now, end_date=now, display_period="", export_csv=export_csv)
 
 
-def fetch_and_process_transactions(api: FireflyApi, start_date: datetime, end_date: datetime) -> List[
-    ForeignTransaction]:
-    """Fetches and processes foreign transactions from Firefly III."""
-    params = {
-        'start': start_date.strftime('%Y-%m-%d'),
-        'end': end_date.strftime('%Y-%m-%d')
-    }
-    transactions_response = api.get_json('transactions', params)
+def to_foreign_transaction(tx: dict) -> ForeignTransaction:
+    """
+    Builds a ForeignTransaction from a Firefly split or a mirrored split document.
+    A missing amount (mirrored splits may lack one) counts as 0 rather than failing the summary.
+    """
+    foreign_currency = tx['foreign_currency_code']
+    foreign_amount = float(tx.get('foreign_amount') or 0)
+    local_amount = float(tx.get('amount') or 0)
+
+    usd_equiv = foreign_amount if foreign_currency == 'USD' else local_amount / MVR_PER_USD
+
+    return ForeignTransaction(
+        date=tx['date'],
+        description=tx['description'],
+        foreign_currency=foreign_currency,
+        foreign_amount=foreign_amount,
+        local_amount=local_amount,
+        usd_equivalent=usd_equiv
+    )
+
+
+async def mirror_is_ready() -> bool:
+    """True if /foreignsum can be answered from the local transaction mirror."""
+    if not MIRROR_ENABLED:
+        return False
+    try:
+        return await asyncio.to_thread(TransactionsDB().is_ready)
+    except Exception as e:
+        LOGS.warning(f"Could not read the transaction mirror state: {e}")
+        return False
+
 
-    foreign_transactions = []
-    for transaction_data in transactions_response['data']:
+async def iter_foreign_transactions(api: AsyncFireflyApi, start_date: datetime, end_date: datetime,
+                                    currency: Optional[str] = None) -> AsyncIterator[ForeignTransaction]:
+    """
+    Streams foreign transactions, from the local transaction mirror when it is ready,
+    otherwise from Firefly III across all result pages.
+    """
+    start_day, end_day = start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
+
+    if await mirror_is_ready():
+        cursor = TransactionsDB().find_foreign_transactions(start_day, end_day, currency) \
+            .batch_size(MIRROR_READ_BATCH_SIZE)
+        try:
+            while True:
+                batch = await asyncio.to_thread(TransactionsDB.next_batch, cursor, MIRROR_READ_BATCH_SIZE)
+                for tx in batch:
+                    yield to_foreign_transaction(tx)
+                if len(batch) < MIRROR_READ_BATCH_SIZE:
+                    return
+        finally:
+            cursor.close()
+
+    async for transaction_data in api.iter_transactions(start_day, end_day):
         transaction = transaction_data['attributes']
         for tx in transaction['transactions']:
             if tx.get('foreign_amount') and tx.get('foreign_currency_code'):
-                foreign_currency = tx['foreign_currency_code']
-                foreign_amount = float(tx['foreign_amount'])
-                local_amount = float(tx['amount'])
+                yield to_foreign_transaction(tx)
 
-                usd_equiv = foreign_amount if foreign_currency == 'USD' else local_amount / MVR_PER_USD
 
-                foreign_transactions.append(ForeignTransaction(
-                    date=tx['date'],
-                    description=tx['description'],
-                    foreign_currency=foreign_currency,
-                    foreign_amount=foreign_amount,
-                    local_amount=local_amount,
-                    usd_equivalent=usd_equiv
-                ))
+@dataclass
+class CurrencySubtotal:
+    """Running totals for a single foreign currency."""
+    count: int = 0
+    foreign_amount: float = 0.0
+    local_amount: float = 0.0
+    usd_equivalent: float = 0.0
 
-    foreign_transactions.sort(key=lambda x: x.date, reverse=True)
-    return foreign_transactions
 
+class ForeignSumAggregator:
+    """
+    Aggregates a stream of foreign transactions in constant memory: a running USD total,
+    per-currency subtotals and the most recent transactions (bounded heap).
+    """
+
+    def __init__(self, filter_currency: Optional[str] = None, recent_limit: int = RECENT_TRANSACTIONS_LIMIT):
+        self.filter_currency = filter_currency
+        self.recent_limit = recent_limit
+        self.count = 0
+        self.total_usd = 0.0
+        self.currency_subtotals: Dict[str, CurrencySubtotal] = {}
+        self._recent_heap: List[Tuple[str, int, ForeignTransaction]] = []
+
+    def add(self, tx: ForeignTransaction) -> bool:
+        """Adds a transaction to the totals. Returns False if it was filtered out by currency."""
+        if self.filter_currency and tx.foreign_currency != self.filter_currency:
+            return False
+
+        self.count += 1
+        self.total_usd += tx.usd_equivalent
 
-def filter_transactions_by_currency(transactions: List[ForeignTransaction], currency: Optional[str]) -> List[
-    ForeignTransaction]:
-    """Filters a list of transactions by a given currency."""
-    if not currency:
-        return transactions
-    return [t for t in transactions if t.foreign_currency == currency]
+        subtotal = self.currency_subtotals.setdefault(tx.foreign_currency, CurrencySubtotal())
+        subtotal.count += 1
+        subtotal.foreign_amount += tx.foreign_amount
+        subtotal.local_amount += tx.local_amount
+        subtotal.usd_equivalent += tx.usd_equivalent
 
+        # Min-heap on date keeps only the newest transactions; the counter breaks ties
+        entry = (tx.date, self.count, tx)
+        if len(self._recent_heap) < self.recent_limit:
+            heapq.heappush(self._recent_heap, entry)
+        elif entry[0] > self._recent_heap[0][0]:
+            heapq.heapreplace(self._recent_heap, entry)
 
-def calculate_total_usd(transactions: List[ForeignTransaction]) -> float:
-    """Calculates the total USD equivalent for a list of transactions."""
-    return sum(t.usd_equivalent for t in transactions)
+        return True
 
+    def recent_transactions(self) -> List[ForeignTransaction]:
+        """Returns the most recent transactions, newest first."""
+        return [tx for _, _, tx in sorted(self._recent_heap, reverse=True)]
 
-def format_summary_message(
-        transactions: List[ForeignTransaction],
-        display_period: str,
-        total_usd: float
-) -> str:
+
+def format_summary_message(aggregator: ForeignSumAggregator, display_period: str) -> str:
     """Formats the summary message with transaction details."""
     msg = f"**Foreign Transactions for {display_period}**\n\n"
-    msg += f"**Total in USD:** {total_usd:.2f}\n\n"
+    msg += f"**Total in USD:** {aggregator.total_usd:.2f}\n\n"
 
-    if not transactions:
+    if not aggregator.count:
         return msg + "No transactions found."
 
-    msg += "**Recent Transactions (up to 10):**\n"
-    for tx in transactions[:10]:
+    if len(aggregator.currency_subtotals) > 1:
+        msg += "**By Currency:**\n"
+        for currency, subtotal in sorted(aggregator.currency_subtotals.items()):
+            msg += (f"• {currency}: {subtotal.foreign_amount:.2f} "
+                    f"(USD {subtotal.usd_equivalent:.2f}, {subtotal.count} transactions)\n")
+        msg += "\n"
+
+    msg += f"**Recent Transactions (up to {aggregator.recent_limit}):**\n"
+    for tx in aggregator.recent_transactions():
         if tx.foreign_currency != 'USD':
             msg += (f"• {tx.date[:10]}: {tx.description} - "
                     f"{tx.foreign_amount:.2f} {tx.foreign_currency} "
@@ -193,27 +268,48 @@ def format_summary_message(
         else:
             msg += f"• {tx.date[:10]}: {tx.description} - {tx.foreign_amount:.2f} USD\n"
 
-    if len(transactions) > 10:
-        msg += f"\n...and {len(transactions) - 10} more transactions"
+    if aggregator.count > aggregator.recent_limit:
+        msg += f"\n...and {aggregator.count - aggregator.recent_limit} more transactions"
 
     return msg
 
 
-async def generate_and_send_csv(message: Message, transactions: List[ForeignTransaction], start_date: datetime,
-                                end_date: datetime):
-    """Generates a CSV file and sends it as a document."""
+def csv_export_path(start_date: datetime, end_date: datetime) -> str:
+    """Builds the path of the CSV export for a date range."""
     csv_filename = f"foreign_transactions_{start_date.strftime('%Y-%m-%d')}_to_{end_date.strftime('%Y-%m-%d')}.csv"
     csv_path = os.path.join("downloads", csv_filename)
     os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+    return csv_path
 
-    with open(csv_path, 'w', newline='') as csvfile:
-        fieldnames = ['date', 'description', 'foreign_currency', 'foreign_amount', 'local_amount', 'usd_equivalent']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        for tx in transactions:
-            writer.writerow(asdict(tx))
 
-    await message.reply_document(csv_path, caption="Full transaction data exported to CSV")
+async def aggregate_foreign_transactions(api: AsyncFireflyApi, args: CommandArgs,
+                                         csv_path: Optional[str] = None) -> ForeignSumAggregator:
+    """
+    Streams foreign transactions into an aggregator, writing each included transaction
+    to the CSV file as it arrives when csv_path is given. The file is only created once
+    there is a row to write, and is removed again if the export fails part way.
+    """
+    aggregator = ForeignSumAggregator(args.filter_currency)
+
+    with contextlib.ExitStack() as stack:
+        writer = None
+        try:
+            async for tx in iter_foreign_transactions(api, args.start_date, args.end_date, args.filter_currency):
+                if not aggregator.add(tx) or not csv_path:
+                    continue
+                if writer is None:
+                    csvfile = stack.enter_context(open(csv_path, 'w', newline=''))
+                    writer = csv.DictWriter(csvfile, fieldnames=[field.name for field in fields(ForeignTransaction)])
+                    writer.writeheader()
+                writer.writerow(asdict(tx))
+        except BaseException:
+            if writer is not None:
+                stack.close()
+                with contextlib.suppress(OSError):
+                    os.remove(csv_path)
+            raise
+
+    return aggregator
 
 
 @FireflyParserBot.on_message(filters.private & filters.user(TELEGRAM_ADMINS) & filters.command(["foreignsum"]), group=1)
@@ -247,18 +343,17 @@ async def foreign_sum(_, message: Message):
     status_message = await message.reply(pre_message)
 
     try:
-        api = FireflyApi()
-        all_foreign_transactions = fetch_and_process_transactions(api, args.start_date, args.end_date)
-        filtered_transactions = filter_transactions_by_currency(all_foreign_transactions, args.filter_currency)
-        total_usd = calculate_total_usd(filtered_transactions)
+        api = AsyncFireflyApi()
+        csv_path = csv_export_path(args.start_date, args.end_date) if args.export_csv else None
+        aggregator = await aggregate_foreign_transactions(api, args, csv_path)
 
-        if not filtered_transactions:
+        if not aggregator.count:
             await status_message.edit_text(
                 f"No foreign transactions found for {args.display_period}" +
                 (f" with currency {args.filter_currency}" if args.filter_currency else "."))
             return
 
-        summary_message = format_summary_message(filtered_transactions, args.display_period, total_usd)
+        summary_message = format_summary_message(aggregator, args.display_period)
 
         # We need to check if the message is too long for Telegram
         if len(summary_message) > 4096:
@@ -266,8 +361,8 @@ async def foreign_sum(_, message: Message):
 
         await status_message.edit_text(summary_message)
 
-        if args.export_csv:
-            await generate_and_send_csv(message, filtered_transactions, args.start_date, args.end_date)
+        if csv_path:
+            await message.reply_document(csv_path, caption="Full transaction data exported to CSV")
 
     except Exception as e:
         LOGS.error(f"Error in foreignsum command: {e}")
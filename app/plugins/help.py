@@ -17,8 +17,9 @@ async def help_command(_, message: Message):
         "• `/income` - Record an incoming money transaction.\n"
         "• `/foreignsum` - Show foreign transaction summary.\n"
         "• `/foreignsum_help` - Show usage instructions for `/foreignsum`.\n"
+        "• `/parserstats` - Show how many SMS messages were parsed locally and how many went to the LLM.\n"
         "\n**Vendor Commands:**\n"
-        "• `/vendors [search]` — List all vendors. Optionally, add a search term to filter vendors by name or alias. Results are paginated.\n"
+        "• `/vendors [search]` — List all vendors. Optionally, add a search term to list the vendors whose name or an alias starts with it. Results are paginated.\n"
         "• `/syncvendors` — Synchronize vendors with Firefly III. Adds new vendors, updates aliases, and removes vendors no longer present in Firefly.\n"
         "• `/help` - Show this help message.\n"
         "\nAll results are consolidated in USD using a fixed exchange rate (15.42 MVR per USD)."
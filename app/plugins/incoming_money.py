@@ -7,7 +7,7 @@ from pyrogram.enums import ChatAction
 from pyrogram.types import CallbackQuery, ForceReply, InlineKeyboardButton, InlineKeyboardMarkup, Message
 
 from app import FireflyParserBot, TELEGRAM_ADMINS
-from app.firefly.firefly import FireflyApi
+from app.firefly.async_firefly import AsyncFireflyApi
 from app.models.transaction_models import Account
 
 LOGS = logging.getLogger(__name__)
@@ -150,10 +150,10 @@ def _summary_text(context: dict) -> str:
 
 
 async def _start_income_flow(message: Message, user_id: int, edit_existing: bool = False) -> None:
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
 
     try:
-        revenue_accounts = firefly_api.get_revenue_accounts()
+        revenue_accounts = await firefly_api.get_revenue_accounts()
     except Exception as e:
         LOGS.error(f"Error fetching revenue accounts: {e}")
         error_text = "Failed to fetch revenue accounts from Firefly III. Please try again later."
@@ -251,11 +251,11 @@ async def select_revenue_account(_, callback_query: CallbackQuery) -> None:
         return
 
     revenue_account_id = callback_query.data.replace(INCOME_REVENUE_PREFIX, '', 1)
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
 
     try:
-        revenue_accounts = firefly_api.get_revenue_accounts()
-        asset_accounts = firefly_api.get_asset_accounts()
+        revenue_accounts = await firefly_api.get_revenue_accounts()
+        asset_accounts = await firefly_api.get_asset_accounts()
     except Exception as e:
         LOGS.error(f"Error fetching accounts for incoming transaction: {e}")
         await callback_query.message.edit_text("Failed to fetch accounts from Firefly III. Please try again later.")
@@ -291,10 +291,10 @@ async def select_asset_account(_, callback_query: CallbackQuery) -> None:
         return
 
     asset_account_id = callback_query.data.replace(INCOME_ASSET_PREFIX, '', 1)
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
 
     try:
-        asset_accounts = firefly_api.get_asset_accounts()
+        asset_accounts = await firefly_api.get_asset_accounts()
     except Exception as e:
         LOGS.error(f"Error fetching asset accounts for incoming transaction: {e}")
         await callback_query.message.edit_text("Failed to fetch asset accounts from Firefly III. Please try again later.")
@@ -378,10 +378,10 @@ async def create_income_transaction(_, callback_query: CallbackQuery) -> None:
     if not context:
         return
 
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
 
     try:
-        response = firefly_api.create_incoming_transaction(
+        response = await firefly_api.create_incoming_transaction(
             revenue_account_id=context['revenue_account_id'],
             asset_account_id=context['asset_account_id'],
             amount=context['amount'],
@@ -0,0 +1,51 @@
+from pyrogram import filters
+from pyrogram.types import Message
+import asyncio
+import logging
+
+from app import FireflyParserBot, TELEGRAM_ADMINS
+from app.database.parserstatsdb import ParserStatsDB
+from app.parsers.sms_templates import SMS_PARSER_STATS
+
+LOGS = logging.getLogger(__name__)
+
+
+def format_parser_stats(stats: dict, session: dict) -> str:
+    """
+    Renders the SMS parser counters: totals since the counters were created, then this run.
+    """
+    hits, misses = stats.get('hits', 0), stats.get('misses', 0)
+    total = hits + misses
+    hit_rate = f"{hits / total:.1%}" if total else "n/a"
+
+    lines = [
+        "**SMS Parser Stats**\n",
+        f"Parsed locally: {hits}",
+        f"Sent to the LLM: {misses}",
+        f"Local hit rate: {hit_rate}",
+    ]
+
+    templates = stats.get('templates', {})
+    if templates:
+        lines.append("\n**Hits per template:**")
+        for name, count in sorted(templates.items(), key=lambda item: item[1], reverse=True):
+            lines.append(f"• `{name}`: {count}")
+
+    lines.append(
+        f"\nSince the bot started: {session.get('hits', 0)} local, {session.get('misses', 0)} LLM"
+    )
+    return "\n".join(lines)
+
+
+@FireflyParserBot.on_message(filters.private & filters.user(TELEGRAM_ADMINS) & filters.command(["parserstats"]), group=1)
+async def parser_stats_command(_, message: Message):
+    try:
+        stats = await asyncio.to_thread(ParserStatsDB().get_stats)
+    except Exception as e:
+        LOGS.error(f"Failed to read SMS parser stats: {e}")
+        await message.reply("❌ Could not read the parser stats.")
+        await message.stop_propagation()
+        return
+
+    await message.reply(format_parser_stats(stats, dict(SMS_PARSER_STATS)))
+    await message.stop_propagation()
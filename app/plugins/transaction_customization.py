@@ -1,7 +1,7 @@
 from pyrogram import filters
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, Message, ForceReply
 from app import FireflyParserBot, TELEGRAM_ADMINS
-from app.firefly.firefly import FireflyApi
+from app.firefly.async_firefly import AsyncFireflyApi
 import logging
 
 from app.models.transaction_models import Account, Budget, Category, Bill
@@ -61,14 +61,14 @@ async def get_transaction_details_text(firefly_api, transaction_id: str) -> str:
     Fetches and formats transaction details from Firefly API.
     
     Args:
-        firefly_api: FireflyApi instance
+        firefly_api: AsyncFireflyApi instance
         transaction_id: The transaction ID
         
     Returns:
         Formatted transaction details text
     """
     try:
-        transaction_data = firefly_api.get_json(f"transactions/{transaction_id}")
+        transaction_data = await firefly_api.get_transaction(transaction_id)
         if not transaction_data or 'data' not in transaction_data:
             return "Transaction not found."
             
@@ -125,7 +125,7 @@ async def handle_transaction_customization_callback(client: FireflyParserBot, ca
     parts = data.split("_")
     transaction_id = str(parts[2])  # Expects "trans_id_XXX"
 
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
     
     # Get transaction details
     transaction_details = await get_transaction_details_text(firefly_api, transaction_id)
@@ -144,10 +144,10 @@ async def handle_transaction_customization_callback(client: FireflyParserBot, ca
 async def handle_set_budget_callback(client: FireflyParserBot, callback_query: CallbackQuery):
     await callback_query.answer()
     transaction_id = str(callback_query.data.replace(BUDGET_CALLBACK_PREFIX, ""))
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
 
     try:
-        budgets = firefly_api.get_budgets()
+        budgets = await firefly_api.get_budgets()
         if not budgets:
             await callback_query.edit_message_text("No budgets found in Firefly III.")
             return
@@ -176,10 +176,10 @@ async def handle_set_budget_callback(client: FireflyParserBot, callback_query: C
 async def handle_set_category_callback(client: FireflyParserBot, callback_query: CallbackQuery):
     await callback_query.answer()
     transaction_id = str(callback_query.data.replace(CATEGORY_CALLBACK_PREFIX, ""))
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
 
     try:
-        categories = firefly_api.get_categories()
+        categories = await firefly_api.get_categories()
         if not categories:
             await callback_query.edit_message_text("No categories found in Firefly III.")
             return
@@ -212,10 +212,10 @@ bill_filter = filters.regex(f"^{BILL_CALLBACK_PREFIX}.*") & filters.user(TELEGRA
 async def handle_set_source_account_callback(client: FireflyParserBot, callback_query: CallbackQuery):
     await callback_query.answer()
     transaction_id = str(callback_query.data.replace(SOURCE_ACCOUNT_CALLBACK_PREFIX, ""))
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
 
     try:
-        accounts = firefly_api.get_asset_accounts()
+        accounts = await firefly_api.get_asset_accounts()
         if not accounts:
             await callback_query.edit_message_text("No asset accounts found in Firefly III.")
             return
@@ -244,13 +244,13 @@ async def handle_set_source_account_callback(client: FireflyParserBot, callback_
 async def handle_set_bill_callback(client: FireflyParserBot, callback_query: CallbackQuery):
     await callback_query.answer()
     transaction_id = str(callback_query.data.replace(BILL_CALLBACK_PREFIX, ""))
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
 
     try:
-        bills = firefly_api.get_bills()
+        bills = await firefly_api.get_bills()
 
         # Get transaction details to check current bill
-        transaction_data = firefly_api.get_json(f"transactions/{transaction_id}")
+        transaction_data = await firefly_api.get_transaction(transaction_id)
         if not transaction_data or 'data' not in transaction_data:
             await callback_query.edit_message_text("Failed to fetch transaction details.")
             return
@@ -301,7 +301,7 @@ async def update_transaction_budget(client: FireflyParserBot, callback_query: Ca
     transaction_id = str(parts[3])
     budget_id = parts[4]
 
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
     payload = {
         "transactions": [
             {
@@ -310,7 +310,7 @@ async def update_transaction_budget(client: FireflyParserBot, callback_query: Ca
         ]
     }
     try:
-        firefly_api.update_transaction(transaction_id, payload)
+        await firefly_api.update_transaction(transaction_id, payload)
 
         transaction_details = await get_transaction_details_text(firefly_api, transaction_id)
         link = firefly_api.transaction_show_url(transaction_id)
@@ -331,7 +331,7 @@ async def update_transaction_category(client: FireflyParserBot, callback_query:
     transaction_id = str(parts[3])
     category_id = parts[4]
 
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
     payload = {
         "transactions": [
             {
@@ -340,7 +340,7 @@ async def update_transaction_category(client: FireflyParserBot, callback_query:
         ]
     }
     try:
-        firefly_api.update_transaction(transaction_id, payload)
+        await firefly_api.update_transaction(transaction_id, payload)
 
         transaction_details = await get_transaction_details_text(firefly_api, transaction_id)
         link = firefly_api.transaction_show_url(transaction_id)
@@ -361,7 +361,7 @@ async def update_transaction_source_account(client: FireflyParserBot, callback_q
     transaction_id = str(parts[3])
     account_id = parts[4]
 
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
     payload = {
         "transactions": [
             {
@@ -370,7 +370,7 @@ async def update_transaction_source_account(client: FireflyParserBot, callback_q
         ]
     }
     try:
-        firefly_api.update_transaction(transaction_id, payload)
+        await firefly_api.update_transaction(transaction_id, payload)
 
         transaction_details = await get_transaction_details_text(firefly_api, transaction_id)
         link = firefly_api.transaction_show_url(transaction_id)
@@ -391,7 +391,7 @@ async def update_transaction_bill(client: FireflyParserBot, callback_query: Call
     transaction_id = str(parts[3])
     bill_id = parts[4]
 
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
     payload = {
         "transactions": [
             {
@@ -400,7 +400,7 @@ async def update_transaction_bill(client: FireflyParserBot, callback_query: Call
         ]
     }
     try:
-        firefly_api.update_transaction(transaction_id, payload)
+        await firefly_api.update_transaction(transaction_id, payload)
 
         transaction_details = await get_transaction_details_text(firefly_api, transaction_id)
         link = firefly_api.transaction_show_url(transaction_id)
@@ -420,7 +420,7 @@ async def unlink_transaction_bill(client: FireflyParserBot, callback_query: Call
     parts = callback_query.data.split("_")
     transaction_id = str(parts[3])
 
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
     payload = {
         "transactions": [
             {
@@ -429,7 +429,7 @@ async def unlink_transaction_bill(client: FireflyParserBot, callback_query: Call
         ]
     }
     try:
-        firefly_api.update_transaction(transaction_id, payload)
+        await firefly_api.update_transaction(transaction_id, payload)
 
         transaction_details = await get_transaction_details_text(firefly_api, transaction_id)
         link = firefly_api.transaction_show_url(transaction_id)
@@ -448,7 +448,7 @@ async def back_to_main_menu(client: FireflyParserBot, callback_query: CallbackQu
     await callback_query.answer()
     transaction_id = str(callback_query.data.replace(BACK_BUTTON_PREFIX, ""))
     
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
     
     transaction_details = await get_transaction_details_text(firefly_api, transaction_id)
     link = firefly_api.transaction_show_url(transaction_id)
@@ -468,7 +468,7 @@ async def cancel_customization(client: FireflyParserBot, callback_query: Callbac
     
     # Edit back to original transaction state with just View in Firefly and Customize buttons
     transaction_id = str(callback_query.data.replace(CANCEL_BUTTON_PREFIX, ""))
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
     
     transaction_details = await get_transaction_details_text(firefly_api, transaction_id)
     link = firefly_api.transaction_show_url(transaction_id)
@@ -486,11 +486,11 @@ async def cancel_customization(client: FireflyParserBot, callback_query: Callbac
 async def handle_manage_tags_callback(client: FireflyParserBot, callback_query: CallbackQuery):
     await callback_query.answer()
     transaction_id = str(callback_query.data.replace(TAGS_CALLBACK_PREFIX, ""))
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
 
     try:
         # Get the transaction details to show current tags
-        transaction_data = firefly_api.get_json(f"transactions/{transaction_id}")
+        transaction_data = await firefly_api.get_transaction(transaction_id)
         if not transaction_data or 'data' not in transaction_data:
             await callback_query.edit_message_text("Failed to fetch transaction details.")
             return
@@ -559,11 +559,11 @@ async def quick_add_tag(client: FireflyParserBot, callback_query: CallbackQuery)
     transaction_id = str(parts[3])
     tag = "_".join(parts[4:])  # Handle multi-word tags
 
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
 
     try:
         # Get current transaction to fetch existing tags
-        transaction_data = firefly_api.get_json(f"transactions/{transaction_id}")
+        transaction_data = await firefly_api.get_transaction(transaction_id, fresh=True)
         if not transaction_data or 'data' not in transaction_data:
             await callback_query.edit_message_text("Failed to fetch transaction details.")
             return
@@ -586,7 +586,7 @@ async def quick_add_tag(client: FireflyParserBot, callback_query: CallbackQuery)
                 }
             ]
         }
-        firefly_api.update_transaction(transaction_id, payload)
+        await firefly_api.update_transaction(transaction_id, payload)
 
         # Refresh the tags view by updating callback data
         callback_query.data = f"{TAGS_CALLBACK_PREFIX}{transaction_id}"
@@ -604,11 +604,11 @@ async def remove_tag(client: FireflyParserBot, callback_query: CallbackQuery):
     transaction_id = str(parts[2])
     tag = "_".join(parts[3:])  # Handle multi-word tags
 
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
 
     try:
         # Get current transaction to fetch existing tags
-        transaction_data = firefly_api.get_json(f"transactions/{transaction_id}")
+        transaction_data = await firefly_api.get_transaction(transaction_id, fresh=True)
         if not transaction_data or 'data' not in transaction_data:
             await callback_query.edit_message_text("Failed to fetch transaction details.")
             return
@@ -631,7 +631,7 @@ async def remove_tag(client: FireflyParserBot, callback_query: CallbackQuery):
                 }
             ]
         }
-        firefly_api.update_transaction(transaction_id, payload)
+        await firefly_api.update_transaction(transaction_id, payload)
 
         # Refresh tags view by updating callback data
         callback_query.data = f"{TAGS_CALLBACK_PREFIX}{transaction_id}"
@@ -705,11 +705,11 @@ async def handle_add_tag_reply(client, message: Message):
         await message.stop_propagation()
         return
 
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
 
     try:
         # Get current transaction to fetch existing tags
-        transaction_data = firefly_api.get_json(f"transactions/{transaction_id}")
+        transaction_data = await firefly_api.get_transaction(transaction_id, fresh=True)
         if not transaction_data or 'data' not in transaction_data:
             try:
                 await client.delete_messages(chat_id, reply_msg_id)
@@ -746,7 +746,7 @@ async def handle_add_tag_reply(client, message: Message):
                 }
             ]
         }
-        firefly_api.update_transaction(transaction_id, payload)
+        await firefly_api.update_transaction(transaction_id, payload)
 
         # Delete the ForceReply prompt and user's reply to clean up the chat
         try:
@@ -798,10 +798,10 @@ async def handle_add_tag_reply(client, message: Message):
 async def handle_split_amount_callback(client: FireflyParserBot, callback_query: CallbackQuery):
     await callback_query.answer("Splitting amount in half...")
     transaction_id = str(callback_query.data.replace(SPLIT_AMOUNT_CALLBACK_PREFIX, ""))
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
 
     try:
-        transaction_data = firefly_api.get_json(f"transactions/{transaction_id}")
+        transaction_data = await firefly_api.get_transaction(transaction_id, fresh=True)
         if not transaction_data or 'data' not in transaction_data:
             await callback_query.edit_message_text("Failed to fetch transaction details.")
             return
@@ -817,7 +817,7 @@ async def handle_split_amount_callback(client: FireflyParserBot, callback_query:
             new_foreign = round(float(foreign_amount) / 2, 2)
             update_payload["transactions"][0]["foreign_amount"] = str(new_foreign)
 
-        firefly_api.update_transaction(transaction_id, update_payload)
+        await firefly_api.update_transaction(transaction_id, update_payload)
 
         transaction_details = await get_transaction_details_text(firefly_api, transaction_id)
         link = firefly_api.transaction_show_url(transaction_id)
@@ -836,9 +836,9 @@ async def handle_update_amount_callback(client: FireflyParserBot, callback_query
     await callback_query.answer()
     transaction_id = str(callback_query.data.replace(UPDATE_AMOUNT_CALLBACK_PREFIX, ""))
 
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
     try:
-        transaction_data = firefly_api.get_json(f"transactions/{transaction_id}")
+        transaction_data = await firefly_api.get_transaction(transaction_id)
         if not transaction_data or 'data' not in transaction_data:
             await callback_query.edit_message_text("Failed to fetch transaction details.")
             return
@@ -873,9 +873,9 @@ async def handle_deduct_amount_callback(client: FireflyParserBot, callback_query
     await callback_query.answer()
     transaction_id = str(callback_query.data.replace(DEDUCT_AMOUNT_CALLBACK_PREFIX, ""))
 
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
     try:
-        transaction_data = firefly_api.get_json(f"transactions/{transaction_id}")
+        transaction_data = await firefly_api.get_transaction(transaction_id)
         if not transaction_data or 'data' not in transaction_data:
             await callback_query.edit_message_text("Failed to fetch transaction details.")
             return
@@ -947,10 +947,10 @@ async def handle_update_amount_reply(client, message: Message):
         await message.stop_propagation()
         return
 
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
 
     try:
-        transaction_data = firefly_api.get_json(f"transactions/{transaction_id}")
+        transaction_data = await firefly_api.get_transaction(transaction_id, fresh=True)
         if not transaction_data or 'data' not in transaction_data:
             # Clean up on fetch failure
             try:
@@ -981,7 +981,7 @@ async def handle_update_amount_reply(client, message: Message):
             new_foreign = round(float(foreign_amount) * ratio, 2)
             update_payload["transactions"][0]["foreign_amount"] = str(new_foreign)
 
-        firefly_api.update_transaction(transaction_id, update_payload)
+        await firefly_api.update_transaction(transaction_id, update_payload)
 
         # Delete the ForceReply prompt and user's reply to clean up the chat
         try:
@@ -1074,10 +1074,10 @@ async def handle_deduct_amount_reply(client, message: Message):
         await message.stop_propagation()
         return
 
-    firefly_api = FireflyApi()
+    firefly_api = AsyncFireflyApi()
 
     try:
-        transaction_data = firefly_api.get_json(f"transactions/{transaction_id}")
+        transaction_data = await firefly_api.get_transaction(transaction_id, fresh=True)
         if not transaction_data or 'data' not in transaction_data:
             try:
                 await client.delete_messages(chat_id, reply_msg_id)
@@ -1117,7 +1117,7 @@ async def handle_deduct_amount_reply(client, message: Message):
             new_foreign = round(float(foreign_amount) * ratio, 2)
             update_payload["transactions"][0]["foreign_amount"] = str(new_foreign)
 
-        firefly_api.update_transaction(transaction_id, update_payload)
+        await firefly_api.update_transaction(transaction_id, update_payload)
 
         try:
             await client.delete_messages(chat_id, reply_msg_id)
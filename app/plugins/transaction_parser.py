@@ -1,23 +1,34 @@
 from pyrogram import filters
-from app.firefly.firefly import FireflyApi
+from app.firefly.async_firefly import AsyncFireflyApi, mirror_transaction_group, update_vendor_profiles
 from io import BytesIO
+from typing import Optional
+import asyncio
 import logging
 
+import httpx
+
 from pyrogram.enums import ChatAction
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
-from app import FireflyParserBot, TELEGRAM_ADMINS
-from app.models.parsed_transaction_message import ParsedTransactionMessage
+from app import FireflyParserBot, TELEGRAM_ADMINS, QUEUE_ENABLED
+from app.database.transactionledgerdb import TransactionLedgerDB, CREATED
+from app.ingestion import RetryableIngestionError, ingestion_queue
+from app.models.parsed_transaction_message import ParsedTransactionMessage, VendorSuggestion
+from app.parsers.receipt_images import save_receipt_copy
 
 from app.plugins.transaction_customization import TRANSACTION_ID_PREFIX
+from app.plugins.vendors import VENDOR_SUGGESTION_PREFIX
 from app.plugins.transaction_utils import (
     TransactionExtractionResult,
-    extract_transaction_details_from_image,
-    extract_transaction_details_from_text,
+    extract_transaction_details_from_image_bytes,
+    extract_transaction_details_from_sms,
 )
 
 LOGS = logging.getLogger(__name__)
 
 
+SMS_JOB = "sms"
+
+
 async def reply_with_error_file(message: Message, error_message: str):
     with BytesIO(error_message.encode("utf-8")) as error_file:
         error_file.name = f"transaction-error-{message.id}.txt"
@@ -28,6 +39,210 @@ async def reply_with_error_file(message: Message, error_message: str):
         )
 
 
+async def send_error_file(client, chat_id: int, message_id: int, error_message: str):
+    with BytesIO(error_message.encode("utf-8")) as error_file:
+        error_file.name = f"transaction-error-{message_id}.txt"
+        await client.send_document(
+            chat_id,
+            error_file,
+            caption="Transaction processing error",
+            reply_to_message_id=message_id
+        )
+
+
+async def send_or_edit_ack(client, chat_id: int, message_id: int, ack_message_id, text: str, reply_markup=None):
+    """
+    Edits the acknowledgment message when there is one, otherwise replies to the original message.
+    """
+    if ack_message_id:
+        await client.edit_message_text(chat_id, ack_message_id, text, reply_markup=reply_markup)
+    else:
+        await client.send_message(chat_id, text, reply_to_message_id=message_id, reply_markup=reply_markup)
+
+
+def is_retryable_status(status_code: int) -> bool:
+    """
+    Whether a failed Firefly response may succeed when retried: rate limiting and server errors.
+    """
+    return status_code == 429 or status_code >= 500
+
+
+def transaction_markup(transaction_id, vendor_suggestion: Optional[VendorSuggestion] = None) -> InlineKeyboardMarkup:
+    buttons = [
+        [InlineKeyboardButton("🔗 View in Firefly", url=AsyncFireflyApi().transaction_show_url(transaction_id))],
+        [InlineKeyboardButton("⚙️ Customize Transaction", callback_data=f"{TRANSACTION_ID_PREFIX}{transaction_id}")]
+    ]
+    if vendor_suggestion is not None:
+        buttons.append([InlineKeyboardButton(
+            f"🤔 Did you mean {vendor_suggestion.vendor.get('name')}? ({vendor_suggestion.score:.0%})",
+            callback_data=f"{VENDOR_SUGGESTION_PREFIX}{transaction_id}:{vendor_suggestion.vendor['_id']}"
+        )])
+    return InlineKeyboardMarkup(buttons)
+
+
+# Errors raised before the request was sent, so Firefly cannot have created the transaction
+REQUEST_NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+async def recorded_transaction_exists(entry: dict) -> bool:
+    """
+    Checks that the transaction a created ledger entry points to still exists in Firefly, and
+    drops the entry when it was deleted so the message can be recorded again.
+    Entries that are pending, lack a transaction ID or cannot be checked count as existing.
+    """
+    if entry.get('status') != CREATED or not entry.get('transaction_id'):
+        return True
+
+    try:
+        exists = await AsyncFireflyApi().transaction_exists(entry['transaction_id'])
+    except Exception as e:
+        LOGS.warning(f"Could not check transaction {entry['transaction_id']} in Firefly: {e}")
+        return True
+
+    if not exists:
+        LOGS.info(f"Transaction {entry['transaction_id']} was deleted in Firefly; dropping its ledger entry")
+        await asyncio.to_thread(TransactionLedgerDB().drop_created, entry['_id'])
+    return exists
+
+
+async def find_recorded_transaction(raw_hash: str) -> Optional[dict]:
+    """
+    Looks up a previously forwarded message in the idempotency ledger, before any Groq or Firefly work.
+    A reservation that can be taken over is not a duplicate; reserving takes it over later.
+    """
+    recorded = await asyncio.to_thread(TransactionLedgerDB().find_by_raw_hash, raw_hash)
+    if recorded is None or TransactionLedgerDB.can_take_over(recorded):
+        return None
+    if not await recorded_transaction_exists(recorded):
+        return None
+    return recorded
+
+
+async def reserve_transaction(details: dict, raw_hash: str) -> tuple[bool, Optional[dict]]:
+    """
+    Reserves the extracted transaction in the idempotency ledger before it is posted.
+    :return: (True, reservation or None if the details cannot form a key) to go ahead,
+        or (False, existing ledger entry) for a duplicate
+    """
+    try:
+        key = TransactionLedgerDB.key_fields(
+            details.get('reference_no'), details.get('approval_code'), details.get('amount'), details.get('date')
+        )
+    except (TypeError, ValueError):
+        LOGS.warning(f"Cannot build an idempotency key from {details}; creating without one")
+        return True, None
+
+    ledger = TransactionLedgerDB()
+    reserved, entry = await asyncio.to_thread(ledger.reserve, key, raw_hash)
+    if not reserved and not await recorded_transaction_exists(entry):
+        reserved, entry = await asyncio.to_thread(ledger.reserve, key, raw_hash)
+    return reserved, entry
+
+
+async def release_reservation(reservation: Optional[dict]):
+    if reservation is not None:
+        await asyncio.to_thread(TransactionLedgerDB().release, reservation['_id'])
+
+
+async def mark_reservation_uncertain(reservation: Optional[dict]):
+    if reservation is not None:
+        await asyncio.to_thread(TransactionLedgerDB().mark_uncertain, reservation['_id'])
+
+
+async def complete_reservation(reservation: Optional[dict], response):
+    if reservation is None:
+        return
+    try:
+        transaction_id = response.json()['data']['id']
+    except Exception:
+        # The transaction was created, so the entry must still block another attempt
+        LOGS.error(f"Could not read the transaction ID for ledger entry {reservation['_id']}")
+        transaction_id = None
+    await asyncio.to_thread(TransactionLedgerDB().complete, reservation['_id'], transaction_id)
+
+
+async def recover_transaction(reservation: Optional[dict]) -> Optional[dict]:
+    """
+    Looks up the transaction an earlier attempt may have created before this one took its
+    reservation over, so it is not posted a second time.
+    :return: Firefly response JSON with the found group under 'data', or None to go ahead and post
+    """
+    if reservation is None or not reservation.get('taken_over'):
+        return None
+
+    try:
+        group = await AsyncFireflyApi().find_transaction_by_external_id(
+            TransactionLedgerDB.external_id(reservation['_id'])
+        )
+    except Exception:
+        # Still unknown whether the transaction exists, so the next attempt must look again
+        await mark_reservation_uncertain(reservation)
+        raise
+    if group is None:
+        return None
+
+    LOGS.info(f"Found transaction {group['id']} created by an earlier attempt for ledger entry {reservation['_id']}")
+    await asyncio.to_thread(TransactionLedgerDB().complete, reservation['_id'], group['id'])
+    recovered = {"data": group}
+    await mirror_transaction_group(recovered)
+    await update_vendor_profiles(recovered)
+    return recovered
+
+
+async def post_reserved_transaction(parsed_transaction_message: ParsedTransactionMessage,
+                                    reservation: Optional[dict], **kwargs):
+    """
+    Posts a reserved transaction to Firefly under the reservation's external ID. A failure
+    that proves the request never left releases the reservation; any other failure may have
+    come after Firefly saved the transaction, so the reservation is kept and marked uncertain.
+    :return: The Firefly response
+    """
+    if reservation is not None:
+        parsed_transaction_message.external_id = TransactionLedgerDB.external_id(reservation['_id'])
+
+    try:
+        return await parsed_transaction_message.create_transaction_on_firefly(**kwargs)
+    except REQUEST_NOT_SENT_ERRORS:
+        await release_reservation(reservation)
+        raise
+    except Exception:
+        await mark_reservation_uncertain(reservation)
+        raise
+
+
+def created_transaction_reply(created: dict) -> tuple[str, str]:
+    """
+    Summarizes a created transaction group for the chat.
+    :return: (reply text, transaction ID)
+    """
+    transaction = created['data']['attributes']['transactions'][0]
+    return (
+        f"**Transaction created!**\n"
+        f"**Description:** {transaction.get('description')}\n"
+        f"**Amount:** {float(transaction.get('amount')):.2f} {transaction.get('currency_code')}\n"
+        f"**Date & Time:** {transaction.get('date')}\n"
+        f"**Destination:** {transaction.get('destination_name')}"
+    ), created['data']['id']
+
+
+async def reply_already_recorded(client, chat_id: int, message_id: int, ack_message_id, entry: dict):
+    """
+    Answers a duplicate forward with the transaction that was already created for it.
+    """
+    if entry.get('status') == CREATED and entry.get('transaction_id'):
+        await send_or_edit_ack(
+            client, chat_id, message_id, ack_message_id,
+            "ℹ️ **This transaction was already recorded.**",
+            reply_markup=transaction_markup(entry['transaction_id'])
+        )
+    elif entry.get('status') == CREATED:
+        await send_or_edit_ack(client, chat_id, message_id, ack_message_id,
+                               "ℹ️ **This transaction was already recorded.**")
+    else:
+        await send_or_edit_ack(client, chat_id, message_id, ack_message_id,
+                               "⏳ This transaction is already being created.")
+
+
 def build_error_report(
     error_message: str,
     extraction_result: TransactionExtractionResult
@@ -52,26 +267,37 @@ def clear_reply_contexts():
         FireflyParserBot._incoming_money_contexts = {}
 
 
-@FireflyParserBot.on_message(filters.private & filters.text & filters.user(TELEGRAM_ADMINS), group=100)
-async def incoming_transaction_message(_, message: Message):
-    # Clear any vendor management reply contexts
-    clear_reply_contexts()
-    
-    await message.reply_chat_action(ChatAction.TYPING)
-
-    extraction_result = extract_transaction_details_from_text(message.text)
+async def process_text_transaction(client, chat_id: int, message_id: int, user_id: int, text: str,
+                                   ack_message_id=None) -> dict:
+    """
+    Extracts a transaction from an SMS, creates it on Firefly and reports back in the chat.
+    Raises RetryableIngestionError for failures worth retrying; permanent failures are
+    reported to the user and return normally.
+    :return: Job result, e.g. the created transaction ID
+    """
+    raw_hash = TransactionLedgerDB.raw_hash(text)
+    recorded = await find_recorded_transaction(raw_hash)
+    if recorded is not None:
+        await reply_already_recorded(client, chat_id, message_id, ack_message_id, recorded)
+        return {"duplicate_of": recorded.get('transaction_id')}
+
+    extraction_result = await extract_transaction_details_from_sms(text, batch_key=user_id)
     json_decoded = extraction_result.details
-    LOGS.info("json_decoded for text message %s: %s", message.id, json_decoded)
+    LOGS.info("json_decoded for text message %s: %s", message_id, json_decoded)
 
     if json_decoded is None:
-        await reply_with_error_file(
-            message,
+        if extraction_result.retryable:
+            raise RetryableIngestionError(extraction_result.error)
+
+        await send_or_edit_ack(client, chat_id, message_id, ack_message_id, "❌ I could not parse the transaction.")
+        await send_error_file(
+            client, chat_id, message_id,
             build_error_report(
                 "I could not parse the transaction. Please try again.",
                 extraction_result
             )
         )
-        return
+        return {"error": extraction_result.error}
 
     parsed_transaction_message = ParsedTransactionMessage(
         date=json_decoded['date'],
@@ -82,57 +308,136 @@ async def incoming_transaction_message(_, message: Message):
         reference_no=json_decoded['reference_no'],
         card=json_decoded['card'],
         approval_code=json_decoded['approval_code'],
-        raw_transaction_message=message.text
+        raw_transaction_message=text,
+        source=extraction_result.source
     )
 
-    response = parsed_transaction_message.create_transaction_on_firefly()
+    reserved, reservation = await reserve_transaction(json_decoded, raw_hash)
+    if not reserved:
+        await reply_already_recorded(client, chat_id, message_id, ack_message_id, reservation)
+        return {"duplicate_of": reservation.get('transaction_id')}
+
+    response = None
+    try:
+        created = await recover_transaction(reservation)
+        if created is None:
+            response = await post_reserved_transaction(parsed_transaction_message, reservation)
+    except httpx.TransportError as e:
+        # Network errors and timeouts
+        raise RetryableIngestionError(f"Could not reach Firefly: {type(e).__name__}: {e}") from e
+    if response is not None and response.status_code not in (200, 201):
+        await release_reservation(reservation)
+        error = f"Firefly returned {response.status_code}: {response.text[:500]}"
+        if is_retryable_status(response.status_code):
+            raise RetryableIngestionError(error)
+
+        # A rejected payload (e.g. a 422 validation error) fails the same way on every retry
+        await send_or_edit_ack(client, chat_id, message_id, ack_message_id, "❌ Firefly rejected the transaction.")
+        await send_error_file(client, chat_id, message_id, build_error_report(error, extraction_result))
+        return {"error": error}
+    if response is not None:
+        await complete_reservation(reservation, response)
 
     # Prepare a concise reply with transaction details and a button link using Pyrogram's InlineKeyboardMarkup
+    transaction_id = None
     try:
-        transaction = response.json()['data']['attributes']['transactions'][0]
-        transaction_id = response.json()['data']['id']
-        
-        link = FireflyApi().transaction_show_url(transaction_id)
-        
-        details = (
-            f"**Transaction created!**\n"
-            f"**Description:** {transaction.get('description')}\n"
-            f"**Amount:** {float(transaction.get('amount')):.2f} {transaction.get('currency_code')}\n"
-            f"**Date & Time:** {transaction.get('date')}\n"
-            f"**Destination:** {transaction.get('destination_name')}"
-        )
-        
-        markup = InlineKeyboardMarkup([
-            [InlineKeyboardButton("🔗 View in Firefly", url=link)],
-            [InlineKeyboardButton("⚙️ Customize Transaction", callback_data=f"{TRANSACTION_ID_PREFIX}{transaction_id}")]
-        ])
-        
-        await message.reply(
-            details,
-            reply_markup=markup,
-            reply_to_message_id=message.id
-        )
-        return
+        details, transaction_id = created_transaction_reply(created if response is None else response.json())
+        markup = transaction_markup(transaction_id, parsed_transaction_message.vendor_suggestion)
+
+        await send_or_edit_ack(client, chat_id, message_id, ack_message_id, details, reply_markup=markup)
     except Exception as e:
+        # The transaction exists at this point, so this must not be retried
         details = f"Transaction created, but could not parse details. Error: {e}"
         LOGS.exception("Could not parse the created text transaction response")
-        await reply_with_error_file(
-            message,
+        await send_error_file(
+            client, chat_id, message_id,
             build_error_report(details, extraction_result)
         )
-        return
+
+    return {"transaction_id": transaction_id}
+
+
+async def process_sms_job(client, job: dict) -> dict:
+    return await process_text_transaction(
+        client,
+        job['chat_id'],
+        job['message_id'],
+        job['payload']['user_id'],
+        job['payload']['text'],
+        ack_message_id=job.get('ack_message_id')
+    )
+
+
+async def dead_letter_sms_job(client, job: dict, error: str):
+    await send_or_edit_ack(
+        client, job['chat_id'], job['message_id'], job.get('ack_message_id'),
+        f"❌ Giving up on this transaction after {job['attempts']} attempt(s)."
+    )
+    await send_error_file(client, job['chat_id'], job['message_id'], error)
+
+
+ingestion_queue.register(SMS_JOB, process_sms_job, on_dead_letter=dead_letter_sms_job)
+
+
+@FireflyParserBot.on_message(filters.private & filters.text & filters.user(TELEGRAM_ADMINS), group=100)
+async def incoming_transaction_message(client, message: Message):
+    # Clear any vendor management reply contexts
+    clear_reply_contexts()
+
+    if QUEUE_ENABLED:
+        ack = await message.reply("⏳ Transaction queued...", reply_to_message_id=message.id)
+        try:
+            await ingestion_queue.enqueue(
+                SMS_JOB,
+                {"text": message.text, "user_id": message.from_user.id},
+                chat_id=message.chat.id,
+                message_id=message.id,
+                ack_message_id=ack.id
+            )
+            return
+        except Exception as e:
+            LOGS.error(f"Failed to enqueue message {message.id}, processing it inline: {e}")
+            ack_message_id = ack.id
+    else:
+        ack_message_id = None
+        await message.reply_chat_action(ChatAction.TYPING)
+
+    try:
+        await process_text_transaction(
+            client, message.chat.id, message.id, message.from_user.id, message.text,
+            ack_message_id=ack_message_id
+        )
+    except Exception as e:
+        LOGS.exception(f"Failed to process message {message.id}")
+        await send_or_edit_ack(client, message.chat.id, message.id, ack_message_id,
+                               "❌ Could not create the transaction.")
+        await reply_with_error_file(message, f"{type(e).__name__}: {e}")
 
 
 @FireflyParserBot.on_message(filters.private & filters.photo & filters.user(TELEGRAM_ADMINS), group=100)
-async def incoming_transfer_receipt(_, message: Message):
+async def incoming_transfer_receipt(client, message: Message):
     # Clear any vendor management reply contexts
     clear_reply_contexts()
     
     await message.reply_chat_action(ChatAction.TYPING)
     
-    path = await message.download()
+    # Download once into memory and reuse the same bytes for Groq and the Firefly attachment
+    photo = await message.download(in_memory=True)
+    image_bytes = photo.getvalue()
+    image_filename = getattr(photo, 'name', None) or f"receipt-{message.id}.jpg"
+
+    try:
+        await asyncio.to_thread(save_receipt_copy, image_bytes, image_filename)
+    except OSError as e:
+        LOGS.warning(f"Failed to keep a copy of receipt {image_filename}: {e}")
+
+    raw_hash = TransactionLedgerDB.raw_hash(image_bytes)
+    recorded = await find_recorded_transaction(raw_hash)
+    if recorded is not None:
+        await reply_already_recorded(client, message.chat.id, message.id, None, recorded)
+        return
 
-    extraction_result = extract_transaction_details_from_image(path)
+    extraction_result = await extract_transaction_details_from_image_bytes(image_bytes)
     json_decoded = extraction_result.details
     LOGS.info("json_decoded for photo message %s: %s", message.id, json_decoded)
 
@@ -155,29 +460,30 @@ async def incoming_transfer_receipt(_, message: Message):
         reference_no=json_decoded['reference_no']
     )
 
-    response = parsed_transaction_message.create_transaction_on_firefly(is_receipt=True, image_path=path)
+    reserved, reservation = await reserve_transaction(json_decoded, raw_hash)
+    if not reserved:
+        await reply_already_recorded(client, message.chat.id, message.id, None, reservation)
+        return
 
+    response = None
+    created = await recover_transaction(reservation)
+    if created is None:
+        response = await post_reserved_transaction(
+            parsed_transaction_message, reservation,
+            is_receipt=True,
+            image_bytes=image_bytes,
+            image_filename=image_filename
+        )
+        if response.status_code in (200, 201):
+            await complete_reservation(reservation, response)
+        else:
+            await release_reservation(reservation)
 
     # Prepare a concise reply with transaction details and a button link using Pyrogram's InlineKeyboardMarkup
     try:
-        transaction = response.json()['data']['attributes']['transactions'][0]
-        transaction_id = response.json()['data']['id']
-        
-        link = FireflyApi().transaction_show_url(transaction_id)
-        
-        details = (
-            f"**Transaction created!**\n"
-            f"**Description:** {transaction.get('description')}\n"
-            f"**Amount:** {float(transaction.get('amount')):.2f} {transaction.get('currency_code')}\n"
-            f"**Date & Time:** {transaction.get('date')}\n"
-            f"**Destination:** {transaction.get('destination_name')}"
-        )
-        
-        markup = InlineKeyboardMarkup([
-            [InlineKeyboardButton("🔗 View in Firefly", url=link)],
-            [InlineKeyboardButton("⚙️ Customize Transaction", callback_data=f"{TRANSACTION_ID_PREFIX}{transaction_id}")]
-        ])
-        
+        details, transaction_id = created_transaction_reply(created if response is None else response.json())
+        markup = transaction_markup(transaction_id, parsed_transaction_message.vendor_suggestion)
+
         await message.reply(
             details,
             reply_markup=markup,
@@ -1,23 +1,105 @@
+import asyncio
 import json
 import base64
+import hashlib
 import logging
 from dataclasses import dataclass
 from typing import Optional
 
-from groq import APIError, Groq
+import httpx
+from groq import APIError, AsyncGroq
 from groq.types.chat.chat_completion_content_part_image_param import ChatCompletionContentPartImageParam, ImageURL
 from groq.types.chat import ChatCompletionSystemMessageParam, ChatCompletionUserMessageParam, ChatCompletionContentPartTextParam
 from groq.types.chat.completion_create_params import ResponseFormatResponseFormatJsonObject
-from app import GROQ_API_KEY
+from app import (
+    GROQ_API_KEY,
+    GROQ_POOL_SIZE,
+    GROQ_MAX_CONCURRENCY,
+    GROQ_CONNECT_TIMEOUT,
+    GROQ_READ_TIMEOUT,
+    GROQ_MAX_RETRIES,
+    LEARNED_TEMPLATES_ENABLED,
+    EXTRACTION_CACHE_ENABLED,
+    RECEIPT_IMAGE_DETAIL,
+    SMS_BATCH_ENABLED,
+    SMS_BATCH_WINDOW_SECONDS,
+    SMS_BATCH_MAX_SIZE,
+)
+from app.database.extractioncachedb import ExtractionCacheDB
+from app.parsers.receipt_images import preprocess_receipt, preprocessing_signature
+from app.parsers.sms_templates import REQUIRED_KEYS, parse_sms
+from app.parsers.template_induction import learned_templates
 
 LOGS = logging.getLogger(__name__)
 
+EXTRACTION_MODEL = "qwen/qwen3.6-27b"
+
+_groq_client: Optional[AsyncGroq] = None
+_groq_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def get_groq_client() -> AsyncGroq:
+    """
+    Get the process-wide async Groq client.
+    The client is created lazily on top of a pooled httpx client, so completions reuse
+    keep-alive connections instead of opening a new transport per call.
+    :return: Shared AsyncGroq client
+    """
+    global _groq_client
+
+    if _groq_client is None or _groq_client.is_closed():
+        timeout = httpx.Timeout(GROQ_READ_TIMEOUT, connect=GROQ_CONNECT_TIMEOUT)
+        _groq_client = AsyncGroq(
+            api_key=GROQ_API_KEY,
+            timeout=timeout,
+            max_retries=GROQ_MAX_RETRIES,
+            http_client=httpx.AsyncClient(
+                timeout=timeout,
+                limits=httpx.Limits(
+                    max_connections=GROQ_POOL_SIZE,
+                    max_keepalive_connections=GROQ_POOL_SIZE,
+                ),
+            ),
+        )
+
+    return _groq_client
+
+
+def get_groq_semaphore() -> asyncio.Semaphore:
+    """
+    Bounds how many completions run at once, so a burst of forwarded messages queues up
+    instead of tripping Groq rate limits.
+    """
+    global _groq_semaphore
+
+    if _groq_semaphore is None:
+        _groq_semaphore = asyncio.Semaphore(GROQ_MAX_CONCURRENCY)
+
+    return _groq_semaphore
+
+
+async def close_groq_client():
+    """
+    Close the shared Groq client and its connection pool.
+    """
+    global _groq_client
+
+    if _groq_client is not None:
+        await _groq_client.close()
+        _groq_client = None
+
 
 @dataclass
 class TransactionExtractionResult:
     details: Optional[dict]
     completion_data: Optional[str]
     error: Optional[str] = None
+    # 'groq' for LLM extractions, 'template:<name>' for local SMS template matches
+    source: str = 'groq'
+    # True when the result was served from the extraction cache instead of a new completion
+    cached: bool = False
+    # True when the extraction failed for a transient reason (e.g. a Groq API error) and may be retried
+    retryable: bool = False
 
 
 def serialize_completion(completion) -> str:
@@ -27,44 +109,113 @@ def serialize_completion(completion) -> str:
         return repr(completion)
 
 
-def encode_image(image_path: str) -> str:
+def prompt_version(system_message: str) -> str:
+    """
+    Identifies the model and prompt an extraction was made with, so cached results are
+    not reused after either changes.
+    """
+    return hashlib.sha256(f"{EXTRACTION_MODEL}\n{system_message}".encode('utf-8')).hexdigest()[:12]
+
+
+def extraction_cache_key(kind: str, payload: bytes, system_message: str, variant: str = '') -> str:
+    """
+    Content address of an extraction: the input kind, the prompt version and a hash of the input.
+    :param variant: Anything else that changes what is sent for the same input, e.g. image preprocessing
+    """
+    return f"{kind}:{prompt_version(system_message + variant)}:{hashlib.sha256(payload).hexdigest()}"
+
+
+def normalize_text_for_cache(text: str) -> str:
+    return ' '.join(text.split())
+
+
+async def get_cached_extraction(key: str) -> Optional[TransactionExtractionResult]:
     """
-    Encodes an image to base64 format.
-    :param image_path: Path to the image file.
-    :return: Base64 encoded string of the image.
+    Returns a previously stored extraction for the key, if there is one.
     """
-    with open(image_path, 'rb') as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+    if not EXTRACTION_CACHE_ENABLED:
+        return None
+
+    try:
+        cached = await asyncio.to_thread(ExtractionCacheDB().get, key)
+    except Exception as e:
+        LOGS.warning(f"Failed to read the extraction cache: {e}")
+        return None
+
+    if cached is None:
+        return None
+
+    LOGS.info(f"Extraction cache hit for {key}")
+    return TransactionExtractionResult(
+        details=cached['details'],
+        completion_data=cached.get('completion_data'),
+        cached=True
+    )
+
 
-def extract_transaction_details_from_image(path) -> TransactionExtractionResult:
-    base_64_image = encode_image(path)
+async def cache_extraction(key: str, kind: str, result: TransactionExtractionResult):
+    """
+    Stores a successful extraction. Failed extractions are never cached so they can be retried.
+    """
+    if not EXTRACTION_CACHE_ENABLED or result.details is None:
+        return
+
+    try:
+        await asyncio.to_thread(ExtractionCacheDB().put, key, kind, result.details, result.completion_data)
+    except Exception as e:
+        LOGS.warning(f"Failed to write the extraction cache: {e}")
+
+
+async def extract_transaction_details_from_image_bytes(image_bytes: bytes) -> TransactionExtractionResult:
+    """
+    Uses Groq AI to extract transaction details from a receipt image held in memory.
+    """
+    cache_key = extraction_cache_key('image', image_bytes, get_system_message_for_image(),
+                                     f"{preprocessing_signature()}-{RECEIPT_IMAGE_DETAIL}")
+    cached = await get_cached_extraction(cache_key)
+    if cached is not None:
+        return cached
+
+    prepared_image = await asyncio.to_thread(preprocess_receipt, image_bytes)
+    result = await request_image_extraction(prepared_image)
+    await cache_extraction(cache_key, 'image', result)
+    return result
+
+
+async def request_image_extraction(image_bytes: bytes, detail: str = RECEIPT_IMAGE_DETAIL) -> TransactionExtractionResult:
+    """
+    Sends a (preprocessed) receipt image to Groq and validates the extracted details.
+    Bypasses the extraction cache.
+    """
+    base_64_image = base64.b64encode(image_bytes).decode('utf-8')
     
     image_for_ai = f"data:image/jpeg;base64,{base_64_image}"
         
-    client = Groq(api_key=GROQ_API_KEY)
     try:
-        completion = client.chat.completions.create(
-            model="qwen/qwen3.6-27b",
-            messages=[
-                ChatCompletionUserMessageParam(role='user', content=[
-                    ChatCompletionContentPartTextParam(type='text', text=get_system_message_for_image()),
-                    ChatCompletionContentPartImageParam(type='image_url', image_url=ImageURL(detail='high', url=image_for_ai))
-                    ]),
-            ],
-            temperature=0.6,
-            max_completion_tokens=2048,
-            top_p=0.95,
-            stream=False,
-            reasoning_effort="none",
-            response_format=ResponseFormatResponseFormatJsonObject(type='json_object'),
-            stop=None,
-        )
+        async with get_groq_semaphore():
+            completion = await get_groq_client().chat.completions.create(
+                model=EXTRACTION_MODEL,
+                messages=[
+                    ChatCompletionUserMessageParam(role='user', content=[
+                        ChatCompletionContentPartTextParam(type='text', text=get_system_message_for_image()),
+                        ChatCompletionContentPartImageParam(type='image_url', image_url=ImageURL(detail=detail, url=image_for_ai))
+                        ]),
+                ],
+                temperature=0.6,
+                max_completion_tokens=2048,
+                top_p=0.95,
+                stream=False,
+                reasoning_effort="none",
+                response_format=ResponseFormatResponseFormatJsonObject(type='json_object'),
+                stop=None,
+            )
     except APIError as error:
         LOGS.warning("Groq could not generate valid JSON for receipt extraction: %s", error)
         return TransactionExtractionResult(
             details=None,
             completion_data=None,
-            error=f"Groq API error: {error}"
+            error=f"Groq API error: {error}",
+            retryable=True
         )
 
     completion_data = serialize_completion(completion)
@@ -114,34 +265,41 @@ def extract_transaction_details_from_image(path) -> TransactionExtractionResult:
     )
 
 
-def extract_transaction_details_from_text(text: str) -> TransactionExtractionResult:
+async def extract_transaction_details_from_text(text: str) -> TransactionExtractionResult:
     """
     Uses Groq AI to extract transaction details from the given text.
     Returns parsed details together with the serialized Groq completion and any
     extraction error.
     """
-    client = Groq(api_key=GROQ_API_KEY)
+    cache_key = extraction_cache_key('text', normalize_text_for_cache(text).encode('utf-8'),
+                                     get_system_message_for_text())
+    cached = await get_cached_extraction(cache_key)
+    if cached is not None:
+        return cached
+
     try:
-        completion = client.chat.completions.create(
-            model="qwen/qwen3.6-27b",
-            messages=[
-                ChatCompletionSystemMessageParam(role='system', content=get_system_message_for_text()),
-                ChatCompletionUserMessageParam(role='user', content=text),
-            ],
-            temperature=0.6,
-            max_completion_tokens=2048,
-            top_p=0.95,
-            reasoning_effort="none",
-            stream=False,
-            response_format=ResponseFormatResponseFormatJsonObject(type='json_object'),
-            stop=None,
-        )
+        async with get_groq_semaphore():
+            completion = await get_groq_client().chat.completions.create(
+                model=EXTRACTION_MODEL,
+                messages=[
+                    ChatCompletionSystemMessageParam(role='system', content=get_system_message_for_text()),
+                    ChatCompletionUserMessageParam(role='user', content=text),
+                ],
+                temperature=0.6,
+                max_completion_tokens=2048,
+                top_p=0.95,
+                reasoning_effort="none",
+                stream=False,
+                response_format=ResponseFormatResponseFormatJsonObject(type='json_object'),
+                stop=None,
+            )
     except APIError as error:
         LOGS.warning("Groq could not generate valid JSON for transaction extraction: %s", error)
         return TransactionExtractionResult(
             details=None,
             completion_data=None,
-            error=f"Groq API error: {error}"
+            error=f"Groq API error: {error}",
+            retryable=True
         )
 
     completion_data = serialize_completion(completion)
@@ -185,10 +343,230 @@ def extract_transaction_details_from_text(text: str) -> TransactionExtractionRes
             error=f"Missing required values: {', '.join(missing_keys)}"
         )
 
-    return TransactionExtractionResult(
+    result = TransactionExtractionResult(
         details=json_decoded,
         completion_data=completion_data
     )
+    await cache_extraction(cache_key, 'text', result)
+    return result
+
+
+async def extract_transaction_details_from_texts(texts: list[str]) -> list[TransactionExtractionResult]:
+    """
+    Uses a single Groq completion to extract transaction details from several texts.
+    Cached texts are answered from the cache and only the rest are sent. Results are
+    returned in the order of the given texts, each with its own error if it failed.
+    """
+    if len(texts) == 1:
+        return [await extract_transaction_details_from_text(texts[0])]
+
+    results: list[Optional[TransactionExtractionResult]] = [None] * len(texts)
+    cache_keys = [
+        extraction_cache_key('text', normalize_text_for_cache(text).encode('utf-8'), get_system_message_for_text())
+        for text in texts
+    ]
+    for position, cache_key in enumerate(cache_keys):
+        results[position] = await get_cached_extraction(cache_key)
+
+    pending = [position for position, result in enumerate(results) if result is None]
+    if len(pending) == 1:
+        results[pending[0]] = await extract_transaction_details_from_text(texts[pending[0]])
+    elif pending:
+        for position, result in zip(pending, await request_batch_extraction([texts[i] for i in pending])):
+            results[position] = result
+            await cache_extraction(cache_keys[position], 'text', result)
+
+    return results
+
+
+async def request_batch_extraction(texts: list[str]) -> list[TransactionExtractionResult]:
+    """
+    Sends several texts to Groq in one prompt, numbered from 1, and maps the returned
+    transactions back to the texts by their index. Bypasses the extraction cache.
+    """
+    def failed(error: str, completion_data: Optional[str] = None,
+               retryable: bool = False) -> list[TransactionExtractionResult]:
+        return [TransactionExtractionResult(details=None, completion_data=completion_data, error=error,
+                                            retryable=retryable)
+                for _ in texts]
+
+    prompt = "\n\n".join(f"### Message {index}\n{text}" for index, text in enumerate(texts, start=1))
+
+    try:
+        async with get_groq_semaphore():
+            completion = await get_groq_client().chat.completions.create(
+                model=EXTRACTION_MODEL,
+                messages=[
+                    ChatCompletionSystemMessageParam(role='system', content=get_system_message_for_text_batch()),
+                    ChatCompletionUserMessageParam(role='user', content=prompt),
+                ],
+                temperature=0.6,
+                max_completion_tokens=min(512 * len(texts) + 512, 8192),
+                top_p=0.95,
+                reasoning_effort="none",
+                stream=False,
+                response_format=ResponseFormatResponseFormatJsonObject(type='json_object'),
+                stop=None,
+            )
+    except APIError as error:
+        LOGS.warning("Groq could not generate valid JSON for batch transaction extraction: %s", error)
+        return failed(f"Groq API error: {error}", retryable=True)
+
+    completion_data = serialize_completion(completion)
+
+    try:
+        json_decoded = json.loads(completion.choices[0].message.content)
+    except Exception as error:
+        return failed(f"Could not decode the completion content as JSON: {error}", completion_data)
+
+    transactions = json_decoded.get('transactions') if isinstance(json_decoded, dict) else None
+    if not isinstance(transactions, list):
+        return failed("Expected a JSON object with a 'transactions' array.", completion_data)
+
+    by_index = {}
+    for position, transaction in enumerate(transactions, start=1):
+        if not isinstance(transaction, dict):
+            continue
+        try:
+            index = int(transaction.get('index', position))
+        except (TypeError, ValueError):
+            index = position
+        by_index.setdefault(index, transaction)
+
+    results = []
+    for index in range(1, len(texts) + 1):
+        transaction = by_index.get(index)
+        if transaction is None:
+            results.append(TransactionExtractionResult(
+                details=None,
+                completion_data=completion_data,
+                error=f"No transaction was returned for message {index}."
+            ))
+            continue
+
+        details = {key: value for key, value in transaction.items() if key != 'index'}
+        missing_keys = [key for key in REQUIRED_KEYS if details.get(key) is None]
+        if missing_keys:
+            results.append(TransactionExtractionResult(
+                details=None,
+                completion_data=completion_data,
+                error=f"Missing required values: {', '.join(missing_keys)}"
+            ))
+            continue
+
+        results.append(TransactionExtractionResult(details=details, completion_data=completion_data))
+
+    return results
+
+
+class SmsBatcher:
+    """
+    Coalesces SMS that arrive close together into one Groq completion.
+
+    The first message for a key opens a window of SMS_BATCH_WINDOW_SECONDS; every message
+    submitted for the same key before it closes, up to SMS_BATCH_MAX_SIZE, is extracted in
+    the same completion. Each caller awaits a future that resolves to its own result.
+    """
+
+    def __init__(self, window_seconds: float = SMS_BATCH_WINDOW_SECONDS, max_size: int = SMS_BATCH_MAX_SIZE):
+        self.window_seconds = window_seconds
+        self.max_size = max_size
+        self._pending: dict[object, list[tuple[str, asyncio.Future]]] = {}
+        self._timers: dict[object, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, key, text: str) -> TransactionExtractionResult:
+        future = asyncio.get_running_loop().create_future()
+        batch = self._pending.setdefault(key, [])
+        batch.append((text, future))
+
+        if len(batch) >= self.max_size:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = asyncio.get_running_loop().call_later(self.window_seconds, self._flush, key)
+
+        return await future
+
+    def _flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+
+        batch = self._pending.pop(key, [])
+        if batch:
+            task = asyncio.create_task(self._extract(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    async def _extract(batch: list[tuple[str, asyncio.Future]]):
+        LOGS.info(f"Extracting a batch of {len(batch)} SMS in one completion")
+        try:
+            results = await extract_transaction_details_from_texts([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+sms_batcher = SmsBatcher()
+
+
+async def extract_transaction_details_from_sms(text: str, batch_key=None) -> TransactionExtractionResult:
+    """
+    Extracts transaction details from a bank SMS, trying the local SMS templates first
+    and only calling Groq for messages no template recognizes.
+    :param batch_key: When given (e.g. the sender's user ID), messages with the same key that arrive
+        within the batching window share one Groq completion
+    """
+    template_name, details = await asyncio.to_thread(parse_sms, text)
+    if details is not None:
+        template_result = TransactionExtractionResult(
+            details=details,
+            completion_data=None,
+            source=f'template:{template_name}'
+        )
+        if not LEARNED_TEMPLATES_ENABLED or not await asyncio.to_thread(learned_templates.should_verify, template_name):
+            return template_result
+        return await verify_learned_template(text, template_name, template_result)
+
+    if batch_key is not None and SMS_BATCH_ENABLED:
+        result = await sms_batcher.submit(batch_key, text)
+    else:
+        result = await extract_transaction_details_from_text(text)
+
+    if result.details is not None and not result.cached and LEARNED_TEMPLATES_ENABLED:
+        try:
+            await asyncio.to_thread(learned_templates.learn, text, result.details)
+        except Exception as e:
+            LOGS.warning(f"Failed to learn an SMS template from the extraction: {e}")
+
+    return result
+
+
+async def verify_learned_template(text: str, template_name: str,
+                                  template_result: TransactionExtractionResult) -> TransactionExtractionResult:
+    """
+    Re-extracts an SMS that an active learned template parsed with Groq, and prefers Groq's
+    details when the two disagree. The template's result is kept if Groq is unavailable.
+    """
+    result = await extract_transaction_details_from_text(text)
+    if result.details is None:
+        return template_result
+
+    try:
+        agreed = await asyncio.to_thread(learned_templates.verify, template_name, template_result.details, result.details)
+    except Exception as e:
+        LOGS.warning(f"Failed to verify learned SMS template {template_name}: {e}")
+        return template_result
+
+    return template_result if agreed else result
+
 
 def get_system_message_for_text():
     return """
@@ -204,6 +582,13 @@ When stripping whitespace from the values, please make sure to ONLY strip the wh
 The system that uses you will parse it into json and go on from there. Please do not do any markdown formatting.
 """
 
+def get_system_message_for_text_batch():
+    return get_system_message_for_text() + """
+You may receive several Transaction Alert Messages at once, each starting with a line "### Message <n>".
+In that case output exactly one JSON object with a single key: transactions.
+transactions MUST be an array with one object per message, in the same order, and each object MUST have the key index set to <n> in addition to the keys above.
+"""
+
 def get_system_message_for_image():
     return """
 You are part of a system designed to extract specific details from transaction receipts.
@@ -1,12 +1,13 @@
-from bson import ObjectId
 from pyrogram import filters
 from pyrogram.enums import ChatAction
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, ForceReply
+import asyncio
+import hashlib
 import logging
 
 from app import FireflyParserBot, TELEGRAM_ADMINS
-from app.database.vendorsdb import VendorsDB
-from app.firefly.firefly import FireflyApi
+from app.database.vendors_repository import VendorsRepository
+from app.firefly.async_firefly import AsyncFireflyApi
 
 LOGS = logging.getLogger(__name__)
 
@@ -14,6 +15,16 @@ LOGS = logging.getLogger(__name__)
 VENDORS_PER_PAGE = 9  # Maximum vendors per page (3x3 grid)
 VENDORS_PER_ROW = 3    # Number of vendors per row
 
+# Callback data of the buttons offered for a loosely matched vendor after a transaction is created
+VENDOR_SUGGESTION_PREFIX = "vendor_suggest:"
+DELETE_ORPHAN_ACCOUNT_PREFIX = "delete_orphan_account:"
+
+# Telegram rejects callback data longer than this many bytes
+CALLBACK_DATA_MAX_BYTES = 64
+# Search queries too long to fit the page callback data, by short token
+long_vendor_queries: dict[str, str] = {}
+LONG_VENDOR_QUERIES_MAX_ENTRIES = 256
+
 
 async def clear_vendor_contexts(message: Message):
     """
@@ -43,22 +54,58 @@ async def list_vendors(_, message: Message):
     await message.stop_propagation()
 
 
-async def send_vendors_list(message_or_callback, page: int, query: str):
-    db = VendorsDB()
-    filter_ = {}
-    
-    if query:
-        # Case-insensitive search in name or aliases
-        filter_ = {
-            "$or": [
-                {"name": {"$regex": query, "$options": "i"}},
-                {"aliases": {"$regex": query, "$options": "i"}}
-            ]
-        }
-        
-    total_vendors = db.vendors.count_documents(filter_)
-    vendors_cursor = db.vendors.find(filter_).sort("name", 1).skip((page - 1) * VENDORS_PER_PAGE).limit(VENDORS_PER_PAGE)
-    vendors = list(vendors_cursor)
+def vendors_page_data(page: int, backward: bool, cursor_id, query: str) -> str:
+    """
+    Builds the callback data of a vendors page button: vendors_page:<page>:<direction>:<cursor>:<query>.
+
+    The direction is 'n' (the page after the cursor vendor) or 'p' (the page before it). When the
+    query does not fit Telegram's callback data limit, it is replaced by a short token and the
+    direction is upper-cased to mark that.
+    """
+    direction = "p" if backward else "n"
+    data = f"vendors_page:{page}:{direction}:{cursor_id}:{query}"
+    if len(data.encode("utf-8")) <= CALLBACK_DATA_MAX_BYTES:
+        return data
+
+    token = hashlib.sha1(query.encode("utf-8")).hexdigest()[:10]
+    if token not in long_vendor_queries and len(long_vendor_queries) >= LONG_VENDOR_QUERIES_MAX_ENTRIES:
+        long_vendor_queries.pop(next(iter(long_vendor_queries)))
+    long_vendor_queries[token] = query
+    return f"vendors_page:{page}:{direction.upper()}:{cursor_id}:{token}"
+
+
+def parse_vendors_page_data(data: str) -> tuple[int, bool, str, str]:
+    """
+    Reverses vendors_page_data.
+
+    Returns:
+        (page, backward, cursor ID, query). Buttons from before keyset pagination, or with a
+        query token that is no longer known, restart at the first page.
+    """
+    parts = data.split(":", 4)
+    if len(parts) < 5 or parts[2] not in ("n", "p", "N", "P"):
+        # Legacy vendors_page:<page>:<query> button
+        return 1, False, "", data.split(":", 2)[2] if len(parts) > 2 else ""
+
+    _, page, direction, cursor_id, query = parts
+    if direction.isupper():
+        if query not in long_vendor_queries:
+            return 1, False, "", ""
+        query = long_vendor_queries[query]
+    return int(page), direction.lower() == "p", cursor_id, query
+
+
+async def send_vendors_list(message_or_callback, page: int, query: str, cursor_id: str = "",
+                            backward: bool = False):
+    repository = VendorsRepository()
+    # Case-insensitive search in name or aliases, answered from the normalized field indexes.
+    # The page is fetched by keyset from the cursor vendor, and the total is cached per query.
+    total_vendors, (vendors, has_previous, has_next) = await asyncio.gather(
+        repository.count_search(query),
+        repository.page_vendors(query, VENDORS_PER_PAGE, cursor_id or None, backward),
+    )
+    if not has_previous:
+        page = 1
 
     if not vendors:
         text = f"No vendors found for query: '{query}'" if query else "No vendors found."
@@ -69,7 +116,7 @@ async def send_vendors_list(message_or_callback, page: int, query: str):
         return
 
     # Calculate total pages
-    total_pages = (total_vendors + VENDORS_PER_PAGE - 1) // VENDORS_PER_PAGE
+    total_pages = max((total_vendors + VENDORS_PER_PAGE - 1) // VENDORS_PER_PAGE, page)
     
     text = f"📋 <b>Vendors</b> (Page {page}/{total_pages})"
     if query:
@@ -113,22 +160,25 @@ async def send_vendors_list(message_or_callback, page: int, query: str):
         buttons.append(current_row)
     
     # Pagination row with consistent UI
-    max_page = (total_vendors + VENDORS_PER_PAGE - 1) // VENDORS_PER_PAGE
     nav_buttons = []
     
     # Previous button (disabled if on first page)
-    if page > 1:
-        nav_buttons.append(InlineKeyboardButton("⬅️ Prev", callback_data=f"vendors_page:{page - 1}:{query}"))
+    if has_previous:
+        nav_buttons.append(InlineKeyboardButton(
+            "⬅️ Prev", callback_data=vendors_page_data(page - 1, True, vendors[0]['_id'], query)
+        ))
     else:
         nav_buttons.append(InlineKeyboardButton("•", callback_data="noop"))
     
     # Page indicator as a separator
-    page_indicator = f"{page}/{max_page}"
+    page_indicator = f"{page}/{total_pages}"
     nav_buttons.append(InlineKeyboardButton(page_indicator, callback_data="noop"))
     
     # Next button (disabled if on last page)
-    if page < max_page:
-        nav_buttons.append(InlineKeyboardButton("Next ➡️", callback_data=f"vendors_page:{page + 1}:{query}"))
+    if has_next:
+        nav_buttons.append(InlineKeyboardButton(
+            "Next ➡️", callback_data=vendors_page_data(page + 1, False, vendors[-1]['_id'], query)
+        ))
     else:
         nav_buttons.append(InlineKeyboardButton("•", callback_data="noop"))
     
@@ -156,12 +206,8 @@ async def noop_callback(_, callback_query: CallbackQuery):
 
 @FireflyParserBot.on_callback_query(filters.regex(r"^vendors_page:(\d+):(.*)$"))
 async def vendors_page_callback(_, callback_query: CallbackQuery):
-    # The query may be empty, so use maxsplit=2 and join back if needed
-    parts = callback_query.data.split(":", 2)
-    page = int(parts[1])
-    query = parts[2] if len(parts) > 2 else ""
-    # Ensure proper handling of the query parameter
-    await send_vendors_list(callback_query, page, query)
+    page, backward, cursor_id, query = parse_vendors_page_data(callback_query.data)
+    await send_vendors_list(callback_query, page, query, cursor_id, backward)
     await callback_query.answer()
 
 
@@ -174,73 +220,45 @@ async def sync_vendors(_, message: Message):
     await message.reply("Syncing vendors. Please wait...")
     await message.reply_chat_action(ChatAction.TYPING)
 
+    skipped = 0
+    firefly_account_ids = set()
+    firefly_vendors = []
+
+    # Accounts are streamed while the remaining pages are still being fetched
     try:
-        accounts = FireflyApi().accounts('expense', True)
+        async for account in AsyncFireflyApi().iter_accounts('expense'):
+            account_id = account['id']
+            firefly_account_ids.add(account_id)
+            attributes = account['attributes']
+            notes: str = attributes.get('notes', '')
+
+            if (notes is not None) and ('***NOT A VENDOR***' in notes):
+                LOGS.info(f"Skipping vendor {attributes.get('name', account_id)}")
+                skipped += 1
+                continue
+
+            firefly_vendors.append({
+                'firefly_account_id': account_id,
+                'name': attributes.get('name', ''),
+                'description': attributes.get('description', ''),
+                'aliases': extract_aliases(notes),
+            })
     except Exception as e:
         await message.reply(f"Failed to fetch accounts from Firefly: {e}")
         return
 
-    new_vendors = 0
-    new_aliases = 0
-    skipped = 0
-    deleted_vendors = 0
-    
-    # Get all Firefly account IDs from the database
-    db = VendorsDB()
-    db_account_ids = set(db.get_all_firefly_account_ids())
-    firefly_account_ids = set()
-
-    for account in accounts:
-        account_id = account['id']
-        firefly_account_ids.add(account_id)
-        attributes = account['attributes']
-        notes: str = attributes.get('notes', '')
-
-        if (notes is not None) and ('***NOT A VENDOR***' in notes):
-            LOGS.info(f"Skipping vendor {attributes.get('name', account_id)}")
-            skipped += 1
-            continue
-
-        vendor = db.find_vendor_by_firefly_account_id(account_id)
-        if not vendor:
-            vendor = db.add_vendor(
-                name=attributes.get('name', ''),
-                description=attributes.get('description', ''),
-                firefly_account_id=account_id
-            )
-            LOGS.info(f"New vendor added: {attributes.get('name', '')}")
-            new_vendors += 1
-
-        aliases = extract_aliases(notes)
-        for alias in aliases:
-            # Avoid duplicate aliases
-            if not db.vendor_has_alias(attributes.get('name', ''), alias):
-                db.add_alias_to_vendor(
-                    vendor_name=attributes.get('name', ''),
-                    alias=alias
-                )
-                LOGS.info(f"New alias added: {alias} to vendor {attributes.get('name', '')}")
-                new_aliases += 1
-    
-    # Delete vendors that are in the database but not in Firefly
-    vendors_to_delete = db_account_ids - firefly_account_ids
-    for account_id in vendors_to_delete:
-        vendor = db.find_vendor_by_firefly_account_id(account_id)
-        if vendor:
-            vendor_name = vendor.get('name', 'Unknown')
-            LOGS.info(f"Deleting vendor no longer in Firefly: {vendor_name}")
-            db.delete_vendor_by_firefly_account_id(account_id)
-            deleted_vendors += 1
+    # Diff against the database and apply all changes in a single bulk write
+    repository = VendorsRepository()
+    result = await repository.sync_vendors(firefly_vendors, firefly_account_ids)
 
     # Get total vendors and aliases in the DB
-    total_vendors = db.count_vendors()
-    total_aliases = db.count_aliases()
+    total_vendors, total_aliases = await asyncio.gather(repository.count_vendors(), repository.count_aliases())
 
     await message.reply(
         f"Sync complete!\n"
-        f"New vendors added: {new_vendors}\n"
-        f"New aliases added: {new_aliases}\n"
-        f"Vendors deleted: {deleted_vendors}\n"
+        f"New vendors added: {result.new_vendors}\n"
+        f"New aliases added: {result.new_aliases}\n"
+        f"Vendors deleted: {result.deleted_vendors}\n"
         f"Vendors skipped: {skipped}\n\n"
         f"Total vendors in DB: {total_vendors}\n"
         f"Total aliases in DB: {total_aliases}"
@@ -280,8 +298,7 @@ def extract_aliases(notes: str) -> list[str]:
 @FireflyParserBot.on_callback_query(filters.regex(r"^view_vendor:(.+)$"))
 async def view_vendor_callback(_, callback_query: CallbackQuery):
     vendor_id = callback_query.data.split(":", 1)[1]
-    db = VendorsDB()
-    vendor = db.vendors.find_one({"_id": ObjectId(vendor_id)})
+    vendor = await VendorsRepository().get_vendor(vendor_id)
 
     if not vendor:
         await callback_query.answer("Vendor not found.", show_alert=True)
@@ -333,8 +350,8 @@ async def view_vendor_callback(_, callback_query: CallbackQuery):
 @FireflyParserBot.on_callback_query(filters.regex(r"^delete_alias:(.+?):(.+)$"))
 async def delete_alias_callback(_, callback_query: CallbackQuery):
     vendor_id, alias_index_str = callback_query.data.split(":", 2)[1:]
-    db = VendorsDB()
-    vendor = db.vendors.find_one({"_id": ObjectId(vendor_id)})
+    repository = VendorsRepository()
+    vendor = await repository.get_vendor(vendor_id)
 
     if not vendor:
         await callback_query.answer("Vendor not found.", show_alert=True)
@@ -352,7 +369,7 @@ async def delete_alias_callback(_, callback_query: CallbackQuery):
         await callback_query.answer("Invalid alias index.", show_alert=True)
         return
 
-    db.vendors.update_one({"_id": ObjectId(vendor_id)}, {"$pull": {"aliases": alias}})
+    await repository.remove_alias_from_vendor(vendor_id, alias)
     firefly_id = vendor.get("firefly_account_id")
 
     # Sync aliases with Firefly
@@ -360,7 +377,7 @@ async def delete_alias_callback(_, callback_query: CallbackQuery):
         updated_aliases = aliases.copy()
         updated_aliases.remove(alias)
         try:
-            FireflyApi().update_account_aliases(firefly_id, updated_aliases)
+            await AsyncFireflyApi().update_account_aliases(firefly_id, updated_aliases)
         except Exception as e:
             await callback_query.answer(f"Alias deleted locally, but failed to sync with Firefly: {e}", show_alert=True)
             return
@@ -368,14 +385,18 @@ async def delete_alias_callback(_, callback_query: CallbackQuery):
     await callback_query.answer(f"Alias '{alias}' deleted.")
 
     # Refresh the aliases display in the same message
-    vendor = db.vendors.find_one({"_id": ObjectId(vendor_id)})  # Refresh vendor data
+    vendor = await repository.get_vendor(vendor_id)  # Refresh vendor data
     await update_aliases_view(callback_query, vendor)
 
 
 @FireflyParserBot.on_callback_query(filters.regex(r"^add_alias:(.+)$"))
 async def add_alias_callback(_, callback_query: CallbackQuery):
     vendor_id = callback_query.data.split(":", 1)[1]
-    vendor = VendorsDB().vendors.find_one({"_id": ObjectId(vendor_id)})
+    vendor = await VendorsRepository().get_vendor(vendor_id)
+
+    if not vendor:
+        await callback_query.answer("Vendor not found.", show_alert=True)
+        return
 
     text = (
         f"Send the new alias for <b>{vendor.get('name')}</b> as a reply to this message."
@@ -425,8 +446,13 @@ async def handle_add_alias_reply(_, message: Message):
         ctx = getattr(FireflyParserBot, "_add_alias_context", None)
         if ctx and ctx["user_id"] == message.from_user.id:
             # Handle the alias addition as before
-            db = VendorsDB()
-            vendor = db.vendors.find_one({"_id": ObjectId(ctx["vendor_id"])})
+            repository = VendorsRepository()
+            vendor = await repository.get_vendor(ctx["vendor_id"])
+            if not vendor:
+                await message.reply("Vendor not found.")
+                FireflyParserBot._add_alias_context = None
+                await message.stop_propagation()
+                return
             vendor_name = vendor.get('name')
             alias = message.text.strip()
             
@@ -437,8 +463,8 @@ async def handle_add_alias_reply(_, message: Message):
             except Exception:
                 pass  # Ignore if we can't delete it
                 
-            if alias and not db.vendor_has_alias(vendor_name, alias):
-                db.add_alias_to_vendor(vendor_name, alias)
+            if alias and not await repository.vendor_has_alias(vendor_name, alias):
+                await repository.add_alias_to_vendor(vendor_name, alias)
                 firefly_id = vendor.get("firefly_account_id")
 
                 # Sync aliases with Firefly
@@ -446,7 +472,7 @@ async def handle_add_alias_reply(_, message: Message):
                     updated_aliases = vendor.get("aliases", [])
                     updated_aliases.append(alias)
                     try:
-                        FireflyApi().update_account_aliases(firefly_id, updated_aliases)
+                        await AsyncFireflyApi().update_account_aliases(firefly_id, updated_aliases)
                     except Exception as e:
                         await message.reply(f"Alias added locally, but failed to sync with Firefly: {e}")
                         FireflyParserBot._add_alias_context = None
@@ -456,7 +482,7 @@ async def handle_add_alias_reply(_, message: Message):
                 status_msg = await message.reply(f"✅ Alias '<code>{alias}</code>' added to <b>{vendor_name}</b>.")
                 
                 # Refresh the vendor view after a short delay
-                vendor = db.vendors.find_one({"_id": ObjectId(ctx["vendor_id"])}) # Refresh vendor data
+                vendor = await repository.get_vendor(ctx["vendor_id"])  # Refresh vendor data
                 
                 # Update the original message with the new aliases list
                 try:
@@ -464,7 +490,6 @@ async def handle_add_alias_reply(_, message: Message):
                     await update_aliases_view(original_message, vendor)
                     
                     # Delete the status message after a short delay to clean up the chat
-                    import asyncio
                     await asyncio.sleep(2)
                     await status_msg.delete()
                 except Exception:
@@ -486,8 +511,7 @@ async def handle_add_alias_reply(_, message: Message):
 @FireflyParserBot.on_callback_query(filters.regex(r"^manage_aliases:(.+)$"))
 async def manage_aliases_callback(_, callback_query: CallbackQuery):
     vendor_id = callback_query.data.split(":", 1)[1]
-    db = VendorsDB()
-    vendor = db.vendors.find_one({"_id": ObjectId(vendor_id)})
+    vendor = await VendorsRepository().get_vendor(vendor_id)
 
     if not vendor:
         await callback_query.answer("Vendor not found.", show_alert=True)
@@ -500,8 +524,7 @@ async def manage_aliases_callback(_, callback_query: CallbackQuery):
 @FireflyParserBot.on_callback_query(filters.regex(r"^edit_vendor_name:(.+)$"))
 async def edit_vendor_name_callback(_, callback_query: CallbackQuery):
     vendor_id = callback_query.data.split(":", 1)[1]
-    db = VendorsDB()
-    vendor = db.vendors.find_one({"_id": ObjectId(vendor_id)})
+    vendor = await VendorsRepository().get_vendor(vendor_id)
 
     if not vendor:
         await callback_query.answer("Vendor not found.", show_alert=True)
@@ -530,8 +553,13 @@ async def handle_edit_vendor_name_reply(_, message: Message):
         ctx = getattr(FireflyParserBot, "_edit_vendor_name_context", None)
         if ctx and ctx["user_id"] == message.from_user.id:
             # Handle the vendor name edit as before
-            db = VendorsDB()
-            vendor = db.vendors.find_one({"_id": ObjectId(ctx["vendor_id"])})
+            repository = VendorsRepository()
+            vendor = await repository.get_vendor(ctx["vendor_id"])
+            if not vendor:
+                await message.reply("Vendor not found.")
+                FireflyParserBot._edit_vendor_name_context = None
+                await message.stop_propagation()
+                return
 
             old_vendor_name = vendor.get('name')
             new_vendor_name = message.text.strip()
@@ -543,8 +571,8 @@ async def handle_edit_vendor_name_reply(_, message: Message):
             except Exception:
                 pass  # Ignore if we can't delete it
 
-            if new_vendor_name and not db.exists(new_vendor_name):
-                db.vendors.update_one({"name": old_vendor_name}, {"$set": {"name": new_vendor_name}})
+            if new_vendor_name and not await repository.exists(new_vendor_name):
+                await repository.rename_vendor(old_vendor_name, new_vendor_name)
 
                 # Update the name in Firefly
                 firefly_id = vendor.get("firefly_account_id")
@@ -552,7 +580,7 @@ async def handle_edit_vendor_name_reply(_, message: Message):
                 
                 if firefly_id:
                     try:
-                        FireflyApi().update_account_name(firefly_id, new_vendor_name)
+                        await AsyncFireflyApi().update_account_name(firefly_id, new_vendor_name)
                         status_message = await message.reply(
                             f"✅ Vendor name updated in the database and Firefly from '<code>{old_vendor_name}</code>' "
                             f"to '<code>{new_vendor_name}</code>'."
@@ -575,7 +603,7 @@ async def handle_edit_vendor_name_reply(_, message: Message):
             # Refresh the vendor in the original message
             try:
                 # Get updated vendor data
-                updated_vendor = db.vendors.find_one({"_id": ObjectId(ctx["vendor_id"])})
+                updated_vendor = await repository.get_vendor(ctx["vendor_id"])
                 if updated_vendor:
                     # Get the original message
                     original_message = await message.chat.get_messages(ctx["message_id"])
@@ -622,7 +650,6 @@ async def handle_edit_vendor_name_reply(_, message: Message):
                     
                     # Delete the status message after a short delay to clean up the chat
                     if status_message:
-                        import asyncio
                         await asyncio.sleep(2)
                         await status_message.delete()
             except Exception as e:
@@ -695,6 +722,111 @@ async def back_to_vendors_callback(_, callback_query: CallbackQuery):
     await callback_query.answer()
 
 
+def without_buttons(markup: InlineKeyboardMarkup, prefix: str) -> list[list[InlineKeyboardButton]]:
+    """
+    Returns the rows of an inline keyboard, minus the rows with a button whose callback data starts with prefix.
+    """
+    if not markup:
+        return []
+    return [
+        row for row in markup.inline_keyboard
+        if not any((button.callback_data or "").startswith(prefix) for button in row)
+    ]
+
+
+@FireflyParserBot.on_callback_query(filters.regex(f"^{VENDOR_SUGGESTION_PREFIX}") & filters.user(TELEGRAM_ADMINS))
+async def accept_vendor_suggestion_callback(_, callback_query: CallbackQuery):
+    """
+    Moves a transaction whose location only loosely matched a vendor to that vendor, and adds the
+    location as an alias so the next transaction matches exactly. The account Firefly created for
+    the location is offered for deletion once nothing uses it anymore.
+    """
+    transaction_id, vendor_id = callback_query.data[len(VENDOR_SUGGESTION_PREFIX):].split(":", 1)
+    repository = VendorsRepository()
+    vendor = await repository.get_vendor(vendor_id)
+    if not vendor or not vendor.get("firefly_account_id"):
+        await callback_query.answer("Vendor not found.", show_alert=True)
+        return
+
+    firefly_api = AsyncFireflyApi()
+    vendor_account_id = str(vendor["firefly_account_id"])
+    try:
+        transaction = (await firefly_api.get_transaction(transaction_id, fresh=True))['data']['attributes']['transactions'][0]
+    except Exception as e:
+        LOGS.error(f"Error fetching transaction {transaction_id}: {e}")
+        await callback_query.answer("Failed to fetch the transaction. Please try again.", show_alert=True)
+        return
+
+    old_account_id = str(transaction.get("destination_id") or "")
+    old_account_name = transaction.get("destination_name")
+    buttons = without_buttons(callback_query.message.reply_markup, VENDOR_SUGGESTION_PREFIX)
+    if old_account_id == vendor_account_id:
+        await callback_query.message.edit_reply_markup(InlineKeyboardMarkup(buttons))
+        await callback_query.answer(f"Already assigned to {vendor.get('name')}.")
+        return
+
+    await callback_query.answer(f"Moving to {vendor.get('name')}...")
+    try:
+        await firefly_api.update_transaction(
+            transaction_id, {"transactions": [{"destination_id": vendor_account_id}]}
+        )
+    except Exception as e:
+        LOGS.error(f"Error reassigning the destination of transaction {transaction_id}: {e}")
+        await callback_query.message.reply("❌ Failed to change the destination. Please try again.")
+        return
+
+    # Remember the location so the next transaction from it matches the vendor directly
+    status = f"✅ Destination changed to <b>{vendor.get('name')}</b>."
+    if old_account_name and not await repository.vendor_has_alias(vendor["name"], old_account_name):
+        updated_vendor = await repository.add_alias_to_vendor(vendor["name"], old_account_name)
+        if updated_vendor:
+            status += f"\nAlias '<code>{old_account_name}</code>' added."
+            try:
+                await firefly_api.update_account_aliases(vendor_account_id, updated_vendor.get("aliases", []))
+            except Exception as e:
+                status += f"\n⚠️ Failed to sync the alias with Firefly: {e}"
+
+    # Offer to delete the account created for the location when nothing else uses it
+    if old_account_id and not await repository.find_vendor_by_firefly_account_id(old_account_id):
+        try:
+            remaining = await firefly_api.get_transactions_from_account(old_account_id)
+            if not remaining.get('data'):
+                buttons.append([InlineKeyboardButton(
+                    f"🗑 Delete unused account '{old_account_name}'",
+                    callback_data=f"{DELETE_ORPHAN_ACCOUNT_PREFIX}{transaction_id}:{old_account_id}"
+                )])
+        except Exception as e:
+            LOGS.warning(f"Could not check whether account {old_account_id} is still used: {e}")
+
+    await callback_query.message.edit_reply_markup(InlineKeyboardMarkup(buttons))
+    await callback_query.message.reply(status)
+
+
+@FireflyParserBot.on_callback_query(filters.regex(f"^{DELETE_ORPHAN_ACCOUNT_PREFIX}") & filters.user(TELEGRAM_ADMINS))
+async def delete_orphan_account_callback(_, callback_query: CallbackQuery):
+    _, account_id = callback_query.data[len(DELETE_ORPHAN_ACCOUNT_PREFIX):].split(":", 1)
+    buttons = without_buttons(callback_query.message.reply_markup, DELETE_ORPHAN_ACCOUNT_PREFIX)
+    firefly_api = AsyncFireflyApi()
+
+    try:
+        # Transactions may have been moved to the account since the button was offered
+        remaining = await firefly_api.get_transactions_from_account(account_id)
+        if remaining.get('data'):
+            await callback_query.message.edit_reply_markup(InlineKeyboardMarkup(buttons))
+            await callback_query.answer("The account has transactions again, so it was kept.", show_alert=True)
+            return
+
+        await firefly_api.delete_account(account_id)
+    except Exception as e:
+        LOGS.error(f"Error deleting account {account_id}: {e}")
+        await callback_query.answer("Failed to delete the account. Please try again.", show_alert=True)
+        return
+
+    await VendorsRepository().delete_vendor_by_firefly_account_id(account_id)
+    await callback_query.message.edit_reply_markup(InlineKeyboardMarkup(buttons))
+    await callback_query.answer("Unused account deleted.")
+
+
 def get_firefly_account_edit_url(account_id):
     """
     Generates a URL for editing an account in Firefly III
@@ -0,0 +1,127 @@
+"""
+Benchmark receipt image preprocessing against extraction accuracy, payload size and latency.
+
+Usage:
+    python -m benchmarks.receipt_preprocessing <receipts_dir>
+
+The directory holds receipt photos plus an expected.json mapping each file name to the
+values the extraction should produce, e.g.:
+
+    {"receipt-1.jpg": {"date": "12/06/24", "time": "18:21", "currency": "MVR",
+                       "amount": 150.0, "reference_no": "BLAZ123456789"}}
+
+Every image is sent once per variant, bypassing the extraction cache, so running this
+costs real Groq completions. Variants are transformed directly, so the results do not
+depend on receipt_preprocessing_enabled.
+"""
+from dataclasses import dataclass, field
+from pathlib import Path
+import asyncio
+import base64
+import json
+import statistics
+import sys
+import time
+
+from app.parsers.receipt_images import transform_receipt
+from app.plugins.transaction_utils import close_groq_client, request_image_extraction
+
+# (name, preprocessing options or None for the original photo, image detail)
+VARIANTS = [
+    ('original-high', None, 'high'),
+    ('gray-1600-q80-high', dict(max_dimension=1600, quality=80, grayscale=True), 'high'),
+    ('gray-1600-q80-auto', dict(max_dimension=1600, quality=80, grayscale=True), 'auto'),
+    ('gray-1200-q70-high', dict(max_dimension=1200, quality=70, grayscale=True), 'high'),
+    ('color-1600-q80-high', dict(max_dimension=1600, quality=80, grayscale=False), 'high'),
+]
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.webp'}
+
+
+@dataclass
+class VariantResult:
+    name: str
+    payload_sizes: list[int] = field(default_factory=list)
+    latencies: list[float] = field(default_factory=list)
+    correct_fields: int = 0
+    total_fields: int = 0
+    failures: int = 0
+
+    @property
+    def accuracy(self) -> float:
+        return self.correct_fields / self.total_fields if self.total_fields else 0.0
+
+
+def values_match(expected, actual) -> bool:
+    try:
+        return float(expected) == float(actual)
+    except (TypeError, ValueError):
+        return str(expected).strip().lower() == str(actual).strip().lower()
+
+
+async def run_variant(name: str, options, detail: str, receipts: list[tuple[Path, dict]]) -> VariantResult:
+    result = VariantResult(name=name)
+
+    for path, expected in receipts:
+        image_bytes = path.read_bytes()
+        if options is not None:
+            image_bytes = transform_receipt(image_bytes, **options)
+
+        # Size of what is actually uploaded: the base64 data URL
+        result.payload_sizes.append(len(base64.b64encode(image_bytes)))
+
+        started = time.perf_counter()
+        extraction = await request_image_extraction(image_bytes, detail=detail)
+        result.latencies.append(time.perf_counter() - started)
+
+        result.total_fields += len(expected)
+        if extraction.details is None:
+            result.failures += 1
+            continue
+
+        result.correct_fields += sum(
+            values_match(value, extraction.details.get(key)) for key, value in expected.items()
+        )
+
+    return result
+
+
+def load_receipts(directory: Path) -> list[tuple[Path, dict]]:
+    expected = json.loads((directory / 'expected.json').read_text())
+    return [
+        (directory / file_name, values)
+        for file_name, values in sorted(expected.items())
+        if (directory / file_name).suffix.lower() in IMAGE_SUFFIXES
+    ]
+
+
+def print_report(results: list[VariantResult]):
+    print(f"{'variant':<24}{'accuracy':>10}{'failures':>10}{'avg KB':>10}{'p50 s':>8}{'max s':>8}")
+    for result in results:
+        print(
+            f"{result.name:<24}"
+            f"{result.accuracy:>10.1%}"
+            f"{result.failures:>10}"
+            f"{statistics.mean(result.payload_sizes) / 1024:>10.1f}"
+            f"{statistics.median(result.latencies):>8.2f}"
+            f"{max(result.latencies):>8.2f}"
+        )
+
+
+async def main(directory: Path):
+    receipts = load_receipts(directory)
+    if not receipts:
+        sys.exit(f"No receipts listed in {directory / 'expected.json'}")
+
+    try:
+        results = [await run_variant(name, options, detail, receipts) for name, options, detail in VARIANTS]
+    finally:
+        await close_groq_client()
+
+    print_report(results)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.exit(__doc__)
+    asyncio.run(main(Path(sys.argv[1])))
@@ -0,0 +1,44 @@
+"""
+The app package reads config.ini and opens logs/app.log relative to the working directory
+when it is imported, so it is imported from a scratch directory holding a config.ini built
+from config.ini.example. MongoDB is served by mongomock through the `mongo` fixture.
+"""
+from configparser import ConfigParser
+from pathlib import Path
+import os
+import sys
+import tempfile
+
+import mongomock
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+WORKDIR = Path(tempfile.mkdtemp(prefix="firefly-parser-tests-"))
+(WORKDIR / "logs").mkdir()
+
+config = ConfigParser()
+config.read(ROOT / "config.ini.example")
+config["pyrogram"].update({"api_id": "1", "api_hash": "test", "bot_token": "1:test", "admins": "1"})
+with open(WORKDIR / "config.ini", "w") as config_file:
+    config.write(config_file)
+
+previous_cwd = os.getcwd()
+os.chdir(WORKDIR)
+try:
+    import app  # noqa: F401
+finally:
+    os.chdir(previous_cwd)
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """
+    Points app.database at a fresh in-memory mongomock database.
+    """
+    import app.database
+
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(app.database, "_client", client)
+    return client[app.database.MONGO_DB_NAME]
@@ -0,0 +1,107 @@
+from datetime import datetime, timezone
+import asyncio
+
+from app.database.transactionsdb import TransactionsDB
+from app.plugins.foreignsum import (
+    MVR_PER_USD,
+    CommandArgs,
+    ForeignSumAggregator,
+    ForeignTransaction,
+    aggregate_foreign_transactions,
+    to_foreign_transaction,
+)
+
+
+def foreign(date, currency='EUR', foreign_amount=10.0, local_amount=154.2):
+    usd = foreign_amount if currency == 'USD' else local_amount / MVR_PER_USD
+    return ForeignTransaction(date=date, description=f"tx {date}", foreign_currency=currency,
+                              foreign_amount=foreign_amount, local_amount=local_amount, usd_equivalent=usd)
+
+
+def mirrored_group(group_id, splits):
+    return {"id": group_id, "attributes": {"transactions": [
+        {"transaction_journal_id": str(index), "type": "withdrawal", **split} for index, split in enumerate(splits)
+    ]}}
+
+
+def args(currency=None):
+    return CommandArgs(start_date=datetime(2025, 6, 1), end_date=datetime(2025, 6, 30),
+                       display_period="June 2025", export_csv=True, filter_currency=currency)
+
+
+def test_to_foreign_transaction_converts_local_amount_to_usd():
+    tx = to_foreign_transaction({"date": "2025-06-02", "description": "Hotel", "foreign_currency_code": "EUR",
+                                 "foreign_amount": "10", "amount": "154.20"})
+    assert tx.foreign_amount == 10.0
+    assert tx.usd_equivalent == 154.2 / MVR_PER_USD
+
+
+def test_to_foreign_transaction_uses_the_foreign_amount_for_usd():
+    tx = to_foreign_transaction({"date": "2025-06-02", "description": "App", "foreign_currency_code": "USD",
+                                 "foreign_amount": 5, "amount": 77.1})
+    assert tx.usd_equivalent == 5
+
+
+def test_to_foreign_transaction_counts_a_missing_amount_as_zero():
+    tx = to_foreign_transaction({"date": "2025-06-02", "description": "Hotel", "foreign_currency_code": "EUR",
+                                 "foreign_amount": 10, "amount": None})
+    assert tx.local_amount == 0
+    assert tx.usd_equivalent == 0
+
+
+def test_aggregator_totals_by_currency_and_filters():
+    aggregator = ForeignSumAggregator(filter_currency='EUR')
+    assert aggregator.add(foreign('2025-06-01', 'EUR', 10, 154.2))
+    assert aggregator.add(foreign('2025-06-02', 'EUR', 20, 308.4))
+    assert not aggregator.add(foreign('2025-06-03', 'USD', 5, 77.1))
+
+    assert aggregator.count == 2
+    assert list(aggregator.currency_subtotals) == ['EUR']
+    subtotal = aggregator.currency_subtotals['EUR']
+    assert (subtotal.count, subtotal.foreign_amount, subtotal.local_amount) == (2, 30, 154.2 + 308.4)
+    assert aggregator.total_usd == subtotal.usd_equivalent
+
+
+def test_aggregator_keeps_only_the_newest_transactions():
+    aggregator = ForeignSumAggregator(recent_limit=3)
+    for day in (5, 1, 9, 3, 7, 2):
+        aggregator.add(foreign(f'2025-06-0{day}'))
+
+    assert aggregator.count == 6
+    assert [tx.date for tx in aggregator.recent_transactions()] == ['2025-06-09', '2025-06-07', '2025-06-05']
+
+
+def test_aggregate_reads_the_mirror_and_writes_the_csv(mongo, tmp_path):
+    db = TransactionsDB()
+    db.upsert_groups([
+        mirrored_group("1", [{"date": "2025-06-02T10:00:00+05:00", "description": "Hotel", "amount": "154.20",
+                              "foreign_amount": "10", "foreign_currency_code": "EUR"}]),
+        mirrored_group("2", [{"date": "2025-06-03T10:00:00+05:00", "description": "Taxi", "amount": None,
+                              "foreign_amount": "4", "foreign_currency_code": "EUR"}]),
+        mirrored_group("3", [{"date": "2025-06-04T10:00:00+05:00", "description": "Groceries", "amount": "50"}]),
+    ])
+    db.set_state(last_full_sync_at=datetime.now(timezone.utc))
+    csv_path = tmp_path / "export.csv"
+
+    aggregator = asyncio.run(aggregate_foreign_transactions(None, args(), str(csv_path)))
+
+    assert aggregator.count == 2
+    assert aggregator.currency_subtotals['EUR'].foreign_amount == 14
+    lines = csv_path.read_text().splitlines()
+    assert len(lines) == 3
+    assert lines[1].startswith("2025-06-03")
+
+
+def test_aggregate_creates_no_csv_without_rows(mongo, tmp_path):
+    db = TransactionsDB()
+    db.upsert_groups([
+        mirrored_group("1", [{"date": "2025-06-02T10:00:00+05:00", "description": "Hotel", "amount": "154.20",
+                              "foreign_amount": "10", "foreign_currency_code": "EUR"}]),
+    ])
+    db.set_state(last_full_sync_at=datetime.now(timezone.utc))
+    csv_path = tmp_path / "export.csv"
+
+    aggregator = asyncio.run(aggregate_foreign_transactions(None, args(currency='USD'), str(csv_path)))
+
+    assert aggregator.count == 0
+    assert not csv_path.exists()
@@ -0,0 +1,176 @@
+from datetime import datetime, timedelta, timezone
+import asyncio
+
+import pytest
+
+from app import ingestion
+from app.database.ingestionjobsdb import DEAD, DONE, QUEUED, RUNNING, IngestionJobsDB
+from app.ingestion import IngestionQueue, RetryableIngestionError
+
+MAX_ATTEMPTS = 3
+
+
+@pytest.fixture
+def jobs(mongo, monkeypatch):
+    monkeypatch.setattr(ingestion, "QUEUE_MAX_ATTEMPTS", MAX_ATTEMPTS)
+    monkeypatch.setattr(ingestion, "QUEUE_RETRY_BASE_SECONDS", 10)
+    monkeypatch.setattr(ingestion, "QUEUE_RETRY_MAX_SECONDS", 60)
+    jobs = IngestionJobsDB()
+    jobs.ensure_indexes()
+    return jobs
+
+
+def expire_lease(jobs, job_id):
+    """Lets a running job's lease run out, as if its worker died."""
+    jobs.jobs.update_one({"_id": job_id}, {"$set": {"locked_until": datetime.now(timezone.utc) - timedelta(seconds=1)}})
+
+
+def job(jobs, job_id) -> dict:
+    return jobs.jobs.find_one({"_id": job_id})
+
+
+class Recorder:
+    """A job handler that raises the given errors in turn and records the dead letters."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.dead_letters = []
+
+    async def handle(self, client, job):
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"ok": True}
+
+    async def on_dead_letter(self, client, job, error):
+        self.dead_letters.append((job["_id"], error))
+
+
+def queue_with(recorder: Recorder) -> IngestionQueue:
+    queue = IngestionQueue()
+    queue.register("sms", recorder.handle, on_dead_letter=recorder.on_dead_letter)
+    return queue
+
+
+def run_claimed(queue, jobs):
+    claimed = jobs.claim(60, MAX_ATTEMPTS)
+    asyncio.run(queue._process(None, claimed))
+    return claimed
+
+
+def test_claim_leases_the_oldest_due_job_once(jobs):
+    first = jobs.enqueue("sms", {"text": "a"}, 1, 10)
+    jobs.enqueue("sms", {"text": "b"}, 1, 11)
+
+    claimed = jobs.claim(60, MAX_ATTEMPTS)
+    assert claimed["_id"] == first
+    assert (claimed["status"], claimed["attempts"]) == (RUNNING, 1)
+    assert jobs.claim(60, MAX_ATTEMPTS)["_id"] != first
+    assert jobs.claim(60, MAX_ATTEMPTS) is None
+
+
+def test_an_expired_lease_is_claimed_again_until_the_attempts_run_out(jobs):
+    job_id = jobs.enqueue("sms", {}, 1, 10)
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        claimed = jobs.claim(60, MAX_ATTEMPTS)
+        assert (claimed["_id"], claimed["attempts"]) == (job_id, attempt)
+        expire_lease(jobs, job_id)
+
+    # A job that keeps killing its worker is left for dead-lettering instead
+    assert jobs.claim(60, MAX_ATTEMPTS) is None
+    dead = jobs.dead_letter_abandoned(MAX_ATTEMPTS)
+    assert (dead["_id"], dead["status"]) == (job_id, DEAD)
+    assert "Lease expired" in dead["last_error"]
+    assert jobs.dead_letter_abandoned(MAX_ATTEMPTS) is None
+
+
+def test_dead_letter_abandoned_leaves_jobs_with_a_live_lease_or_attempts_left(jobs):
+    live = jobs.enqueue("sms", {}, 1, 10)
+    jobs.jobs.update_one({"_id": live}, {"$set": {"attempts": MAX_ATTEMPTS - 1}})
+    jobs.claim(60, MAX_ATTEMPTS)
+    assert jobs.dead_letter_abandoned(MAX_ATTEMPTS) is None
+
+    retryable = jobs.enqueue("sms", {}, 1, 11)
+    jobs.claim(60, MAX_ATTEMPTS)
+    expire_lease(jobs, retryable)
+    assert jobs.dead_letter_abandoned(MAX_ATTEMPTS) is None
+    assert job(jobs, live)["status"] == RUNNING
+
+
+def test_renew_lease_only_extends_the_attempt_that_holds_the_job(jobs):
+    job_id = jobs.enqueue("sms", {}, 1, 10)
+    first = jobs.claim(60, MAX_ATTEMPTS)
+    expire_lease(jobs, job_id)
+    second = jobs.claim(60, MAX_ATTEMPTS)
+
+    assert not jobs.renew_lease(job_id, first["attempts"], 60)
+    assert jobs.renew_lease(job_id, second["attempts"], 60)
+    jobs.complete(job_id)
+    assert not jobs.renew_lease(job_id, second["attempts"], 60)
+
+
+def test_a_successful_job_is_completed_with_its_result(jobs):
+    recorder = Recorder()
+    job_id = jobs.enqueue("sms", {}, 1, 10)
+
+    run_claimed(queue_with(recorder), jobs)
+
+    assert (job(jobs, job_id)["status"], job(jobs, job_id)["result"]) == (DONE, {"ok": True})
+    assert "expires_at" in job(jobs, job_id)
+
+
+def test_a_retryable_error_is_retried_with_backoff(jobs):
+    recorder = Recorder(RetryableIngestionError("Firefly unavailable"))
+    job_id = jobs.enqueue("sms", {}, 1, 10)
+
+    before = datetime.now(timezone.utc)
+    run_claimed(queue_with(recorder), jobs)
+
+    retried = job(jobs, job_id)
+    assert retried["status"] == QUEUED
+    assert "Firefly unavailable" in retried["last_error"]
+    assert retried["next_attempt_at"].replace(tzinfo=timezone.utc) >= before + timedelta(seconds=10)
+    assert recorder.dead_letters == []
+
+
+def test_a_retryable_error_on_the_last_attempt_is_dead_lettered(jobs):
+    recorder = Recorder(*[RetryableIngestionError("Firefly unavailable")] * MAX_ATTEMPTS)
+    queue = queue_with(recorder)
+    job_id = jobs.enqueue("sms", {}, 1, 10)
+
+    for _ in range(MAX_ATTEMPTS):
+        jobs.jobs.update_one({"_id": job_id}, {"$set": {"next_attempt_at": datetime.now(timezone.utc)}})
+        run_claimed(queue, jobs)
+
+    assert job(jobs, job_id)["status"] == DEAD
+    assert [job_id for job_id, _ in recorder.dead_letters] == [job_id]
+
+
+def test_any_other_error_is_dead_lettered_at_once(jobs):
+    recorder = Recorder(KeyError("amount"))
+    job_id = jobs.enqueue("sms", {}, 1, 10)
+
+    run_claimed(queue_with(recorder), jobs)
+
+    assert job(jobs, job_id)["status"] == DEAD
+    assert recorder.dead_letters == [(job_id, "KeyError: 'amount'")]
+
+
+def test_a_job_without_a_handler_is_dead_lettered(jobs):
+    job_id = jobs.enqueue("unknown", {}, 1, 10)
+
+    run_claimed(IngestionQueue(), jobs)
+
+    assert job(jobs, job_id)["status"] == DEAD
+
+
+def test_abandoned_jobs_are_dead_lettered_and_reported_by_the_workers(jobs):
+    recorder = Recorder()
+    job_id = jobs.enqueue("sms", {}, 1, 10)
+    jobs.jobs.update_one({"_id": job_id}, {"$set": {"attempts": MAX_ATTEMPTS - 1}})
+    jobs.claim(60, MAX_ATTEMPTS)
+    expire_lease(jobs, job_id)
+
+    asyncio.run(queue_with(recorder)._dead_letter_abandoned(None))
+
+    assert job(jobs, job_id)["status"] == DEAD
+    assert recorder.dead_letters == [(job_id, job(jobs, job_id)["last_error"])]
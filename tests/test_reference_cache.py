@@ -0,0 +1,146 @@
+import asyncio
+
+import pytest
+
+from app.firefly import cache
+from app.firefly.cache import ReferenceDataCache
+
+TTL = 60
+STALE = 600
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Loader:
+    def __init__(self, *values):
+        self.values = list(values)
+        self.calls = 0
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        value = self.values.pop(0)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    monkeypatch.setattr(cache, "REFERENCE_CACHE_ENABLED", True)
+    return clock
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_fresh_entries_are_served_without_reloading(clock):
+    async def scenario():
+        reference_cache, loader = ReferenceDataCache(STALE), Loader(["a"], ["b"])
+        assert await reference_cache.get("budgets", loader, TTL) == ["a"]
+        clock.now += TTL - 1
+        assert await reference_cache.get("budgets", loader, TTL) == ["a"]
+        assert loader.calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_stale_entries_are_served_while_one_refresh_runs(clock):
+    async def scenario():
+        reference_cache, loader = ReferenceDataCache(STALE), Loader(["a"], ["b"])
+        await reference_cache.get("budgets", loader, TTL)
+        clock.now += TTL + 1
+        loader.release.clear()
+
+        assert await reference_cache.get("budgets", loader, TTL) == ["a"]
+        assert await reference_cache.get("budgets", loader, TTL) == ["a"]
+        loader.release.set()
+        await settle()
+
+        assert loader.calls == 2
+        assert await reference_cache.get("budgets", loader, TTL) == ["b"]
+
+    asyncio.run(scenario())
+
+
+def test_entries_past_the_stale_window_are_reloaded_before_returning(clock):
+    async def scenario():
+        reference_cache, loader = ReferenceDataCache(STALE), Loader(["a"], ["b"])
+        await reference_cache.get("budgets", loader, TTL)
+        clock.now += TTL + STALE + 1
+        assert await reference_cache.get("budgets", loader, TTL) == ["b"]
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_misses_share_one_load(clock):
+    async def scenario():
+        reference_cache, loader = ReferenceDataCache(STALE), Loader(["a"])
+        loader.release.clear()
+        waiters = [asyncio.create_task(reference_cache.get("budgets", loader, TTL)) for _ in range(3)]
+        await settle()
+        loader.release.set()
+
+        assert await asyncio.gather(*waiters) == [["a"]] * 3
+        assert loader.calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_a_failed_background_refresh_keeps_the_stale_value(clock):
+    async def scenario():
+        reference_cache, loader = ReferenceDataCache(STALE), Loader(["a"], RuntimeError("down"), ["b"])
+        await reference_cache.get("budgets", loader, TTL)
+        clock.now += TTL + 1
+
+        assert await reference_cache.get("budgets", loader, TTL) == ["a"]
+        await settle()
+        assert await reference_cache.get("budgets", loader, TTL) == ["a"]
+        await settle()
+        assert await reference_cache.get("budgets", loader, TTL) == ["b"]
+
+    asyncio.run(scenario())
+
+
+def test_a_failed_load_without_a_cached_value_raises(clock):
+    async def scenario():
+        reference_cache = ReferenceDataCache(STALE)
+        with pytest.raises(RuntimeError):
+            await reference_cache.get("budgets", Loader(RuntimeError("down")), TTL)
+
+    asyncio.run(scenario())
+
+
+def test_invalidate_drops_matching_keys_and_discards_inflight_loads(clock):
+    async def scenario():
+        reference_cache = ReferenceDataCache(STALE)
+        await reference_cache.get("accounts:asset", Loader(["asset"]), TTL)
+        await reference_cache.get("budgets", Loader(["budget"]), TTL)
+
+        reference_cache.invalidate("accounts")
+        assert await reference_cache.get("budgets", Loader(["new budget"]), TTL) == ["budget"]
+
+        loader = Loader(["before write"], ["after write"])
+        loader.release.clear()
+        load = asyncio.create_task(reference_cache.get("accounts:asset", loader, TTL))
+        await settle()
+        reference_cache.invalidate("accounts")
+        loader.release.set()
+        assert await load == ["before write"]
+
+        # The value loaded across the invalidation was not cached
+        assert await reference_cache.get("accounts:asset", loader, TTL) == ["after write"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,63 @@
+import pytest
+
+from app.database.parserstatsdb import ParserStatsDB
+from app.parsers import sms_templates
+from app.parsers.sms_templates import normalize_details, parse_sms
+from app.plugins.parser_stats import format_parser_stats
+
+CARD_SMS = (
+    "Transaction from 4321 on 16/10/26 at 14:32:11 for MVR1,234.50 at CAFE NOVA MALE was processed. "
+    "Reference No:123456789012, Approval Code:654321."
+)
+
+DETAILS = {
+    "card": "4321", "date": "16/10/26", "time": "14:32:11", "currency": "mvr", "amount": "1,234.50",
+    "location": " CAFE NOVA MALE ", "approval_code": "654321", "reference_no": "123456789012",
+}
+
+
+@pytest.fixture(autouse=True)
+def parser_stats(mongo, monkeypatch):
+    monkeypatch.setattr(sms_templates, "SMS_PARSER_STATS", sms_templates.Counter())
+    monkeypatch.setattr(sms_templates, "LEARNED_TEMPLATES_ENABLED", False)
+
+
+def test_normalize_details_cleans_values():
+    normalized = normalize_details(DETAILS)
+    assert normalized["currency"] == "MVR"
+    assert normalized["amount"] == 1234.5
+    assert normalized["location"] == "CAFE NOVA MALE"
+
+
+@pytest.mark.parametrize("change", [{"reference_no": None}, {"amount": "1.2.3"}, {"date": "31/02/26"}])
+def test_normalize_details_rejects_missing_or_malformed_values(change):
+    assert normalize_details({**DETAILS, **change}) is None
+
+
+def test_parse_sms_matches_the_card_template_and_counts_the_hit():
+    template_name, details = parse_sms(CARD_SMS)
+
+    assert template_name == "card_transaction"
+    assert details == normalize_details(DETAILS)
+    assert sms_templates.SMS_PARSER_STATS["hits"] == 1
+    assert ParserStatsDB().get_stats() == {"hits": 1, "templates": {"card_transaction": 1}}
+
+
+def test_parse_sms_counts_a_miss_for_unknown_messages():
+    assert parse_sms("Your OTP is 123456") == (None, None)
+    assert parse_sms("") == (None, None)
+
+    assert sms_templates.SMS_PARSER_STATS["misses"] == 1
+    assert ParserStatsDB().get_stats() == {"misses": 1}
+
+
+def test_format_parser_stats_reports_the_hit_rate_per_template():
+    text = format_parser_stats({"hits": 3, "misses": 1, "templates": {"a": 1, "b": 2}}, {"hits": 1})
+
+    assert "Local hit rate: 75.0%" in text
+    assert text.index("`b`: 2") < text.index("`a`: 1")
+    assert "Since the bot started: 1 local, 0 LLM" in text
+
+
+def test_format_parser_stats_without_any_parses():
+    assert "Local hit rate: n/a" in format_parser_stats({}, {})
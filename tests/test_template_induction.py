@@ -0,0 +1,118 @@
+import re
+
+import pytest
+
+from app.database.smstemplatesdb import ACTIVE, CANDIDATE, SmsTemplatesDB
+from app.parsers import template_induction
+from app.parsers.template_induction import (
+    LearnedTemplates,
+    compile_pattern,
+    details_agree,
+    induce_pattern,
+    literal_shape,
+    value_shape,
+)
+
+
+def bank_sms(card="1234", amount="1,045.00", location="AMAZON MKTPLACE", reference_no="998877",
+             approval_code="A1B2C3", date="12/06/24", time="18:21:05"):
+    return (f"Your card ending {card} was charged USD{amount} at {location} on {date} {time}. "
+            f"Ref {reference_no} Auth {approval_code}. Avl bal 5,000.00")
+
+
+def bank_details(card="1234", amount=1045.0, location="AMAZON MKTPLACE", reference_no="998877",
+                 approval_code="A1B2C3", date="12/06/24", time="18:21:05"):
+    return {"card": card, "date": date, "time": time, "currency": "USD", "amount": amount,
+            "location": location, "approval_code": approval_code, "reference_no": reference_no}
+
+
+@pytest.fixture
+def learned(mongo):
+    return LearnedTemplates()
+
+
+def test_value_shape_generalizes_digits_and_letters():
+    assert re.fullmatch(value_shape("12/06/24"), "01/12/25")
+    assert re.fullmatch(value_shape("A1B2"), "Z9Y8")
+    assert not re.fullmatch(value_shape("A1B2"), "A1B2C")
+
+
+def test_literal_shape_lets_numbers_and_whitespace_vary():
+    assert re.fullmatch(literal_shape(". Avl bal 5"), ".  Avl bal 120")
+
+
+def test_induce_pattern_reproduces_the_values_of_other_messages():
+    pattern = compile_pattern(induce_pattern(bank_sms(), bank_details()))
+
+    match = pattern.fullmatch(bank_sms(card="9876", amount="12.50", location="NOVA CAFE", reference_no="112233",
+                                       approval_code="Z9Y8X7", date="01/07/24", time="09:00:00"))
+    assert match is not None
+    assert details_agree(match.groupdict(), bank_details(card="9876", amount=12.5, location="NOVA CAFE",
+                                                         reference_no="112233", approval_code="Z9Y8X7",
+                                                         date="01/07/24", time="09:00:00"))
+
+
+def test_induce_pattern_gives_up_when_a_value_is_not_in_the_text():
+    assert induce_pattern(bank_sms(), bank_details(reference_no="000000")) is None
+
+
+def test_details_agree_compares_normalized_values():
+    assert details_agree({**bank_details(), "amount": "1,045.00", "currency": "usd"}, bank_details())
+    assert not details_agree(bank_details(), bank_details(approval_code="OTHER1"))
+    assert not details_agree(bank_details(), {**bank_details(), "card": None})
+
+
+def learn_until_active(learned, messages=3):
+    for index in range(messages):
+        reference_no = f"99887{index}"
+        learned.learn(bank_sms(reference_no=reference_no), bank_details(reference_no=reference_no))
+
+
+def test_a_candidate_is_promoted_after_enough_confirmations(learned):
+    learned.learn(bank_sms(), bank_details())
+    [candidate] = SmsTemplatesDB().get_templates()
+    assert candidate["status"] == CANDIDATE
+    assert learned.match(bank_sms()) == (None, None)
+
+    learn_until_active(learned)
+
+    [template] = SmsTemplatesDB().get_templates()
+    assert template["status"] == ACTIVE
+    matched, details = learned.match(bank_sms(reference_no="554433"))
+    assert matched.name == template["_id"]
+    assert details["reference_no"] == "554433"
+
+
+def test_a_candidate_that_disagrees_with_the_llm_is_evicted(learned):
+    learned.learn(bank_sms(), bank_details())
+    for _ in range(template_induction.LEARNED_TEMPLATE_EVICT_AFTER):
+        # The LLM reads a different location than the candidate would capture
+        learned.learn(bank_sms(location="NOVA CAFE"), bank_details(location="NOVA"))
+
+    assert all(template["pattern"] != induce_pattern(bank_sms(), bank_details())
+               for template in SmsTemplatesDB().get_templates())
+
+
+def test_should_verify_samples_only_active_learned_templates(learned, monkeypatch):
+    learn_until_active(learned)
+    [template] = SmsTemplatesDB().get_templates(ACTIVE)
+
+    monkeypatch.setattr(template_induction, "LEARNED_TEMPLATE_VERIFY_RATE", 1.0)
+    assert learned.should_verify(template["_id"])
+    assert not learned.should_verify("card_transaction")
+
+    monkeypatch.setattr(template_induction, "LEARNED_TEMPLATE_VERIFY_RATE", 0.0)
+    assert not learned.should_verify(template["_id"])
+
+
+def test_verify_evicts_an_active_template_the_llm_keeps_disagreeing_with(learned):
+    learn_until_active(learned)
+    [template] = SmsTemplatesDB().get_templates(ACTIVE)
+    template_details = bank_details()
+
+    assert learned.verify(template["_id"], template_details, bank_details())
+    for _ in range(template_induction.LEARNED_TEMPLATE_EVICT_AFTER):
+        assert not learned.verify(template["_id"], template_details, bank_details(location="AMAZON"))
+
+    assert SmsTemplatesDB().get_templates() == []
+    assert learned.match(bank_sms()) == (None, None)
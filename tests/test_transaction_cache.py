@@ -0,0 +1,101 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.firefly import async_firefly, cache
+from app.firefly.async_firefly import AsyncFireflyApi
+from app.firefly.cache import TransactionCache
+
+
+def group(transaction_id, tags):
+    return {"data": {"id": str(transaction_id), "attributes": {"transactions": [{"tags": tags}]}}}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_entries_expire_after_the_ttl(clock):
+    transaction_cache = TransactionCache(ttl=120, max_entries=10)
+    transaction_cache.put(1, group(1, ["a"]))
+
+    clock[0] += 119
+    assert transaction_cache.get("1") == group(1, ["a"])
+    clock[0] += 1
+    assert transaction_cache.get(1) is None
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    transaction_cache = TransactionCache(ttl=120, max_entries=2)
+    transaction_cache.put(1, group(1, []))
+    transaction_cache.put(2, group(2, []))
+    transaction_cache.get(1)
+    transaction_cache.put(3, group(3, []))
+
+    assert transaction_cache.get(2) is None
+    assert transaction_cache.get(1) is not None
+    assert transaction_cache.get(3) is not None
+
+
+def test_values_are_copied_in_and_out(clock):
+    transaction_cache = TransactionCache(ttl=120, max_entries=10)
+    response = group(1, ["a"])
+    transaction_cache.put(1, response)
+    response["data"]["attributes"]["transactions"][0]["tags"].append("b")
+
+    cached = transaction_cache.get(1)
+    cached["data"]["attributes"]["transactions"][0]["tags"].append("c")
+    assert transaction_cache.get(1) == group(1, ["a"])
+
+
+def test_responses_without_data_are_not_cached(clock):
+    transaction_cache = TransactionCache(ttl=120, max_entries=10)
+    transaction_cache.put(1, {"message": "Request successful"})
+    transaction_cache.put(None, group(1, []))
+    assert transaction_cache.get(1) is None
+
+
+@pytest.fixture
+def firefly(monkeypatch):
+    """
+    Serves GET transactions/<id> with the tags currently stored "in Firefly".
+    """
+    stored = {"tags": ["from-firefly"], "requests": 0}
+
+    def handler(request: httpx.Request):
+        stored["requests"] += 1
+        return httpx.Response(200, json=group(7, stored["tags"]))
+
+    monkeypatch.setattr(async_firefly, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(async_firefly, "transaction_cache", TransactionCache(ttl=120, max_entries=10))
+    return stored
+
+
+def test_get_transaction_serves_display_reads_from_the_cache(firefly):
+    async def scenario():
+        api = AsyncFireflyApi()
+        await api.get_transaction("7")
+        firefly["tags"] = ["edited-in-firefly"]
+        return await api.get_transaction("7")
+
+    assert asyncio.run(scenario()) == group(7, ["from-firefly"])
+    assert firefly["requests"] == 1
+
+
+def test_get_transaction_fresh_sees_edits_made_in_firefly(firefly):
+    async def scenario():
+        api = AsyncFireflyApi()
+        await api.get_transaction("7")
+        firefly["tags"] = ["edited-in-firefly"]
+        fresh = await api.get_transaction("7", fresh=True)
+        return fresh, await api.get_transaction("7")
+
+    fresh, cached = asyncio.run(scenario())
+    assert fresh == group(7, ["edited-in-firefly"])
+    # The fresh read also refreshes the cached copy
+    assert cached == fresh
+    assert firefly["requests"] == 2
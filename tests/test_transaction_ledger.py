@@ -0,0 +1,145 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.database.transactionledgerdb import CREATED, PENDING, PENDING_TIMEOUT, TransactionLedgerDB
+
+KEY = TransactionLedgerDB.key_fields("ref123", "abc", "1,045.50", "16/10/26")
+
+
+@pytest.fixture
+def ledger(mongo):
+    ledger = TransactionLedgerDB()
+    ledger.ensure_indexes()
+    return ledger
+
+
+def age(ledger, entry, delta):
+    """Moves an entry's last update into the past."""
+    ledger.ledger.update_one({"_id": entry["_id"]}, {"$set": {"updated_at": datetime.now(timezone.utc) - delta}})
+
+
+def test_key_fields_normalize_the_idempotency_key():
+    assert KEY == {"reference_no": "REF123", "approval_code": "ABC", "amount": 1045.5, "date": "16/10/26"}
+    assert TransactionLedgerDB.key_fields(" REF123 ", "Abc", 1045.5, "16/10/26") == KEY
+
+
+def test_raw_hash_ignores_whitespace_differences():
+    assert TransactionLedgerDB.raw_hash("Paid  MVR 10\n at Cafe") == TransactionLedgerDB.raw_hash("Paid MVR 10 at Cafe")
+    assert TransactionLedgerDB.raw_hash("Paid MVR 10 at Cafe") != TransactionLedgerDB.raw_hash("Paid MVR 11 at Cafe")
+
+
+def test_a_key_can_only_be_reserved_once(ledger):
+    reserved, reservation = ledger.reserve(KEY, "hash-1")
+    assert reserved and reservation["status"] == PENDING
+
+    reserved, existing = ledger.reserve(KEY, "hash-2")
+    assert not reserved and existing["_id"] == reservation["_id"]
+
+
+def test_the_same_raw_message_is_a_duplicate_even_with_another_key(ledger):
+    _, reservation = ledger.reserve(KEY, "hash-1")
+    reserved, existing = ledger.reserve({**KEY, "reference_no": "OTHER"}, "hash-1")
+    assert not reserved and existing["_id"] == reservation["_id"]
+
+
+def test_a_released_reservation_can_be_reserved_again(ledger):
+    _, reservation = ledger.reserve(KEY, "hash-1")
+    ledger.release(reservation["_id"])
+
+    reserved, _ = ledger.reserve(KEY, "hash-1")
+    assert reserved
+
+
+def test_a_created_entry_blocks_new_reservations_and_cannot_be_released(ledger):
+    _, reservation = ledger.reserve(KEY, "hash-1")
+    ledger.complete(reservation["_id"], 42)
+    ledger.release(reservation["_id"])
+
+    reserved, existing = ledger.reserve(KEY, "hash-1")
+    assert not reserved
+    assert (existing["status"], existing["transaction_id"]) == (CREATED, "42")
+    assert ledger.find_by_raw_hash("hash-1")["_id"] == reservation["_id"]
+
+
+def test_a_created_entry_without_a_transaction_id_still_blocks(ledger):
+    _, reservation = ledger.reserve(KEY, "hash-1")
+    ledger.complete(reservation["_id"], None)
+    age(ledger, reservation, PENDING_TIMEOUT * 2)
+
+    reserved, existing = ledger.reserve(KEY, "hash-1")
+    assert not reserved
+    assert (existing["status"], existing["transaction_id"]) == (CREATED, None)
+
+
+def test_a_dropped_created_entry_can_be_reserved_again(ledger):
+    _, reservation = ledger.reserve(KEY, "hash-1")
+    assert not ledger.drop_created(reservation["_id"])
+
+    ledger.complete(reservation["_id"], 42)
+    assert ledger.drop_created(reservation["_id"])
+    reserved, _ = ledger.reserve(KEY, "hash-1")
+    assert reserved
+
+
+def test_a_recent_pending_reservation_is_not_taken_over(ledger):
+    ledger.reserve(KEY, "hash-1")
+    reserved, existing = ledger.reserve(KEY, "hash-1")
+    assert not reserved and not existing.get("taken_over")
+
+
+def test_an_abandoned_pending_reservation_is_taken_over_once(ledger):
+    _, reservation = ledger.reserve(KEY, "hash-1")
+    age(ledger, reservation, PENDING_TIMEOUT * 2)
+
+    reserved, taken_over = ledger.reserve(KEY, "hash-1")
+    assert reserved and taken_over["_id"] == reservation["_id"] and taken_over["taken_over"]
+
+    reserved, _ = ledger.reserve(KEY, "hash-1")
+    assert not reserved
+
+
+def test_an_uncertain_reservation_is_taken_over_at_once_and_only_once(ledger):
+    _, reservation = ledger.reserve(KEY, "hash-1")
+    ledger.mark_uncertain(reservation["_id"])
+
+    reserved, taken_over = ledger.reserve(KEY, "hash-1")
+    assert reserved and taken_over["_id"] == reservation["_id"] and taken_over["taken_over"]
+
+    reserved, existing = ledger.reserve(KEY, "hash-1")
+    assert not reserved and existing["status"] == PENDING
+
+
+def test_mark_uncertain_leaves_created_entries_alone(ledger):
+    _, reservation = ledger.reserve(KEY, "hash-1")
+    ledger.complete(reservation["_id"], 42)
+    ledger.mark_uncertain(reservation["_id"])
+
+    reserved, existing = ledger.reserve(KEY, "hash-1")
+    assert not reserved and existing["status"] == CREATED
+
+
+def test_reservations_without_a_raw_hash_are_keyed_only(ledger):
+    reserved, _ = ledger.reserve(KEY)
+    assert reserved
+    reserved, _ = ledger.reserve({**KEY, "reference_no": "OTHER"})
+    assert reserved
+    reserved, _ = ledger.reserve(KEY)
+    assert not reserved
+
+
+def test_external_id_is_stable_per_reservation(ledger):
+    _, reservation = ledger.reserve(KEY, "hash-1")
+    assert TransactionLedgerDB.external_id(reservation["_id"]) == f"ledger-{reservation['_id']}"
+
+
+def test_can_take_over_only_uncertain_or_abandoned_reservations(ledger):
+    _, reservation = ledger.reserve(KEY, "hash-1")
+    assert not TransactionLedgerDB.can_take_over(ledger.find_by_raw_hash("hash-1"))
+
+    ledger.mark_uncertain(reservation["_id"])
+    assert TransactionLedgerDB.can_take_over(ledger.find_by_raw_hash("hash-1"))
+
+    ledger.complete(reservation["_id"], 42)
+    age(ledger, reservation, PENDING_TIMEOUT * 2)
+    assert not TransactionLedgerDB.can_take_over(ledger.find_by_raw_hash("hash-1"))
@@ -0,0 +1,192 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.database.transactionledgerdb import CREATED, PENDING, TransactionLedgerDB
+from app.firefly import async_firefly
+from app.firefly.cache import TransactionCache
+from app.ingestion import RetryableIngestionError
+from app.models.parsed_transaction_message import ParsedTransactionMessage
+from app.plugins import transaction_parser
+from app.plugins.transaction_utils import TransactionExtractionResult
+
+SMS = (
+    "Transaction from 4321 on 16/10/26 at 14:32:11 for MVR123.45 at CAFE NOVA was processed. "
+    "Reference No:123456789012, Approval Code:654321."
+)
+DETAILS = {
+    "card": "4321", "date": "16/10/26", "time": "14:32:11", "currency": "MVR", "amount": 123.45,
+    "location": "CAFE NOVA", "approval_code": "654321", "reference_no": "123456789012",
+}
+
+
+class FakeFirefly:
+    """
+    Holds the transactions "in Firefly" and answers the lookups the ledger recovery makes.
+    """
+
+    def __init__(self):
+        self.groups: dict[str, dict] = {}
+        self.search_fails = False
+
+    def create(self, external_id) -> dict:
+        group_id = str(len(self.groups) + 1)
+        self.groups[group_id] = {"id": group_id, "attributes": {"transactions": [{
+            "transaction_journal_id": group_id, "type": "withdrawal", "description": "Cafe Nova",
+            "amount": "123.45", "currency_code": "MVR", "date": "2026-10-16T14:32:11+05:00",
+            "destination_name": "Cafe Nova", "external_id": external_id,
+        }]}}
+        return {"data": self.groups[group_id]}
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path.split('/api/v1/')[-1]
+        if path == 'search/transactions':
+            if self.search_fails:
+                return httpx.Response(500, text="down")
+            external_id = request.url.params['query'].split(':', 1)[1].strip('"')
+            return httpx.Response(200, json={"data": [
+                group for group in self.groups.values()
+                if group["attributes"]["transactions"][0]["external_id"] == external_id
+            ]})
+        group_id = path.split('/')[-1]
+        if group_id in self.groups:
+            return httpx.Response(200, json={"data": self.groups[group_id]})
+        return httpx.Response(404, json={"message": "Resource not found"})
+
+
+class FakeClient:
+    """Records what the bot would send to the chat."""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(text)
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        self.sent.append(text)
+
+    async def send_document(self, chat_id, document, **kwargs):
+        self.sent.append(document.name)
+
+
+@pytest.fixture
+def firefly(mongo, monkeypatch):
+    firefly = FakeFirefly()
+    monkeypatch.setattr(async_firefly, "_client", httpx.AsyncClient(transport=httpx.MockTransport(firefly.handle)))
+    monkeypatch.setattr(async_firefly, "transaction_cache", TransactionCache(ttl=0))
+    TransactionLedgerDB().ensure_indexes()
+
+    async def extract(text, batch_key=None):
+        return TransactionExtractionResult(details=dict(DETAILS), completion_data=None, source='template:test')
+
+    monkeypatch.setattr(transaction_parser, "extract_transaction_details_from_sms", extract)
+    return firefly
+
+
+def post_outcomes(monkeypatch, firefly, *outcomes):
+    """
+    Replaces the Firefly POST: each call saves the transaction, then raises the next outcome
+    if it is an exception (as a timeout after Firefly saved it would), or returns a response.
+    Connect errors are raised before anything is saved.
+    """
+    outcomes = list(outcomes)
+
+    async def create_transaction_on_firefly(self, **kwargs):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, httpx.ConnectError):
+            raise outcome
+        created = firefly.create(self.external_id)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return httpx.Response(outcome, content=json.dumps(created).encode())
+
+    monkeypatch.setattr(ParsedTransactionMessage, "create_transaction_on_firefly", create_transaction_on_firefly)
+
+
+def process(client):
+    return asyncio.run(transaction_parser.process_text_transaction(client, 1, 10, 1, SMS))
+
+
+def ledger_entry():
+    return TransactionLedgerDB().find_by_raw_hash(TransactionLedgerDB.raw_hash(SMS))
+
+
+def test_a_created_transaction_is_recorded_and_a_second_forward_is_a_duplicate(firefly, monkeypatch):
+    post_outcomes(monkeypatch, firefly, 200)
+
+    assert process(FakeClient()) == {"transaction_id": "1"}
+    client = FakeClient()
+    assert process(client) == {"duplicate_of": "1"}
+    assert "already recorded" in client.sent[0]
+    assert len(firefly.groups) == 1
+
+
+def test_a_timeout_after_firefly_saved_the_post_is_recovered_not_posted_again(firefly, monkeypatch):
+    post_outcomes(monkeypatch, firefly, httpx.ReadTimeout("timed out"), 200)
+
+    with pytest.raises(RetryableIngestionError):
+        process(FakeClient())
+    entry = ledger_entry()
+    assert (entry["status"], entry["uncertain"]) == (PENDING, True)
+
+    # The queue's retry finds the transaction by its external ID instead of posting it again
+    assert process(FakeClient()) == {"transaction_id": "1"}
+    assert len(firefly.groups) == 1
+    assert (ledger_entry()["status"], ledger_entry()["transaction_id"]) == (CREATED, "1")
+
+
+def test_a_timeout_before_firefly_saved_the_post_is_posted_on_retry(firefly, monkeypatch):
+    post_outcomes(monkeypatch, firefly, httpx.ConnectError("refused"), 200)
+
+    with pytest.raises(RetryableIngestionError):
+        process(FakeClient())
+    assert ledger_entry() is None
+
+    assert process(FakeClient()) == {"transaction_id": "1"}
+    assert len(firefly.groups) == 1
+
+
+def test_a_failed_lookup_keeps_the_reservation_uncertain(firefly, monkeypatch):
+    post_outcomes(monkeypatch, firefly, httpx.ReadTimeout("timed out"), 200)
+    with pytest.raises(RetryableIngestionError):
+        process(FakeClient())
+
+    firefly.search_fails = True
+    with pytest.raises(Exception):
+        process(FakeClient())
+    assert ledger_entry()["uncertain"]
+
+    firefly.search_fails = False
+    assert process(FakeClient()) == {"transaction_id": "1"}
+    assert len(firefly.groups) == 1
+
+
+def test_a_transaction_deleted_in_firefly_can_be_recorded_again(firefly, monkeypatch):
+    post_outcomes(monkeypatch, firefly, 200, 200)
+    process(FakeClient())
+
+    del firefly.groups["1"]
+    assert process(FakeClient()) == {"transaction_id": "1"}
+    assert ledger_entry()["transaction_id"] == "1"
+    assert list(firefly.groups) == ["1"]
+
+
+def test_an_unreadable_created_response_still_marks_the_entry_created(firefly):
+    _, reservation = TransactionLedgerDB().reserve(TransactionLedgerDB.key_fields("r", "a", 1, "d"), "hash")
+
+    asyncio.run(transaction_parser.complete_reservation(reservation, httpx.Response(200, text="not json")))
+
+    entry = TransactionLedgerDB().find_by_raw_hash("hash")
+    assert (entry["status"], entry["transaction_id"]) == (CREATED, None)
+
+
+def test_a_rejected_transaction_releases_the_reservation(firefly, monkeypatch):
+    post_outcomes(monkeypatch, firefly, 422)
+    client = FakeClient()
+
+    assert "error" in process(client)
+    assert "rejected" in client.sent[0]
+    assert ledger_entry() is None
@@ -0,0 +1,99 @@
+from bson import ObjectId
+
+from app.database.vendor_index import VendorIndex, clean_string_for_match, trigrams
+
+
+def vendor(name, aliases=()):
+    return {"_id": ObjectId(), "name": name, "aliases": list(aliases)}
+
+
+def test_clean_string_for_match_keeps_lowercase_alphanumerics():
+    assert clean_string_for_match("Cafe' Nova - 24/7") == "cafenova247"
+    assert clean_string_for_match(None) == ""
+
+
+def test_trigrams_pad_each_word():
+    assert trigrams("Ab") == {"  a", " ab", "ab "}
+    assert trigrams("ab ab") == trigrams("AB")
+    assert trigrams("") == frozenset()
+    assert trigrams(None) == frozenset()
+
+
+def test_find_prefers_exact_case_insensitive_match_over_cleaned_match():
+    exact, cleaned = vendor("Cafe-Nova"), vendor("Cafe Nova")
+    index = VendorIndex()
+    index.load([cleaned, exact])
+
+    assert index.find("cafe-nova")["_id"] == exact["_id"]
+    assert index.find("CAFENOVA")["_id"] == cleaned["_id"]
+    assert index.find("&&") is None
+
+
+def test_find_matches_aliases_and_returns_copies():
+    cafe = vendor("Cafe Nova", aliases=["NOVA CAFE MALE"])
+    index = VendorIndex()
+    index.load([cafe])
+
+    found = index.find("nova cafe male")
+    assert found["_id"] == cafe["_id"]
+    found["name"] = "changed"
+    assert index.find("Cafe Nova")["name"] == "Cafe Nova"
+
+
+def test_upsert_replaces_the_old_keys_and_remove_drops_them():
+    cafe = vendor("Cafe Nova")
+    index = VendorIndex()
+    index.load([cafe])
+
+    index.upsert({**cafe, "name": "Nova Coffee"})
+    assert index.find("Cafe Nova") is None
+    assert index.find("Nova Coffee")["_id"] == cafe["_id"]
+    assert len(index) == 1
+
+    index.remove(cafe["_id"])
+    assert index.find("Nova Coffee") is None
+    assert index.similar("Nova Coffee") == []
+
+
+def test_similar_ranks_by_jaccard_score_of_the_best_key():
+    cafe = vendor("Cafe Nova", aliases=["NOVA CAFE MALE"])
+    bakery = vendor("Nova Bakery")
+    unrelated = vendor("Fuel Station")
+    index = VendorIndex()
+    index.load([cafe, bakery, unrelated])
+
+    results = index.similar("NOVA CAFE MALE MV")
+    assert [found["_id"] for found, _ in results] == [cafe["_id"], bakery["_id"]]
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+    assert 0 < scores[1] < scores[0] < 1
+
+
+def test_similar_is_one_for_identical_trigram_sets():
+    cafe = vendor("Cafe Nova")
+    index = VendorIndex()
+    index.load([cafe])
+
+    [(found, score)] = index.similar("cafe nova")
+    assert found["_id"] == cafe["_id"]
+    assert score == 1.0
+
+
+def test_similar_applies_limit_and_min_score():
+    vendors = [vendor(f"Nova Store {number}") for number in range(5)]
+    index = VendorIndex()
+    index.load(vendors)
+
+    assert len(index.similar("Nova Store", limit=2)) == 2
+    assert index.similar("Nova Store", min_score=0.99) == []
+    assert index.similar("") == []
+
+
+def test_similar_keeps_a_key_shared_by_two_vendors_until_both_are_removed():
+    first, second = vendor("Nova Store"), vendor("Nova Store")
+    index = VendorIndex()
+    index.load([first, second])
+
+    index.remove(first["_id"])
+    [(found, _)] = index.similar("Nova Store")
+    assert found["_id"] == second["_id"]
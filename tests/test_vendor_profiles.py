@@ -0,0 +1,95 @@
+import pytest
+
+from app.database.vendorprofilesdb import VendorProfilesDB
+
+
+@pytest.fixture
+def profiles(mongo):
+    return VendorProfilesDB()
+
+
+def split(journal_id, destination_id="7", description="Coffee", category_id="3", budget_id=None, tags=None,
+          type_="withdrawal"):
+    return {
+        "transaction_journal_id": journal_id, "type": type_, "destination_id": destination_id,
+        "description": description, "category_id": category_id, "budget_id": budget_id, "tags": tags or [],
+    }
+
+
+def group(group_id, *splits):
+    return {"id": group_id, "attributes": {"transactions": list(splits)}}
+
+
+def counts(profiles, account_id="7"):
+    profile = profiles.get_profile(account_id) or {}
+    return {
+        "transactions": profile.get("transactions", 0),
+        "descriptions": {entry["value"]: entry["count"] for entry in profile.get("descriptions", {}).values()
+                         if entry["count"]},
+        "categories": {key: count for key, count in profile.get("categories", {}).items() if count},
+        "tags": {entry["value"]: entry["count"] for entry in profile.get("tags", {}).values() if entry["count"]},
+    }
+
+
+def test_applying_the_same_group_twice_counts_it_once(profiles):
+    created = group("1", split("11", tags=["food"]))
+
+    assert profiles.apply_groups([created]) == 1
+    assert profiles.apply_groups([created]) == 0
+
+    assert counts(profiles) == {
+        "transactions": 1, "descriptions": {"Coffee": 1}, "categories": {"3": 1}, "tags": {"food": 1},
+    }
+
+
+def test_an_edit_moves_only_the_counts_that_changed(profiles):
+    profiles.apply_groups([group("1", split("11")), group("2", split("21"))])
+
+    assert profiles.apply_groups([group("1", split("11", description="Latte", category_id="4"))]) == 1
+
+    assert counts(profiles) == {
+        "transactions": 2, "descriptions": {"Coffee": 1, "Latte": 1}, "categories": {"3": 1, "4": 1}, "tags": {},
+    }
+
+
+def test_only_withdrawals_to_a_vendor_count(profiles):
+    assert profiles.apply_groups([group("1", split("11", type_="deposit"), split("12", destination_id=None))]) == 0
+    assert profiles.get_profile("7") is None
+
+
+def test_a_split_removed_from_a_group_takes_its_contribution_back(profiles):
+    profiles.apply_groups([group("1", split("11"), split("12", description="Cake"))])
+
+    assert profiles.apply_groups([group("1", split("11"))]) == 1
+
+    assert counts(profiles)["descriptions"] == {"Coffee": 1}
+
+
+def test_removing_deleted_groups_takes_their_contributions_back(profiles):
+    profiles.apply_groups([group("1", split("11")), group("10", split("101")), group("2", split("21"))])
+
+    # Group 1 must not match the splits of group 10
+    assert profiles.remove_groups(["1", "2"]) == 2
+    assert profiles.remove_groups(["1", "2"]) == 0
+
+    assert counts(profiles)["transactions"] == 1
+
+
+def test_removing_pruned_splits_takes_their_contributions_back(profiles):
+    profiles.apply_groups([group("1", split("11"), split("12", description="Cake"))])
+
+    assert profiles.remove_splits(["1:12", "9:99"]) == 1
+
+    assert counts(profiles) == {
+        "transactions": 1, "descriptions": {"Coffee": 1}, "categories": {"3": 1}, "tags": {},
+    }
+
+
+def test_most_frequent_values_ignore_zero_counts(profiles):
+    profiles.apply_groups([group("1", split("11")), group("2", split("21")), group("3", split("31", description="Tea"))])
+    profiles.remove_groups(["1", "2"])
+
+    profile = profiles.get_profile("7")
+    assert VendorProfilesDB.most_frequent_value(profile["descriptions"]) == "Tea"
+    assert VendorProfilesDB.most_frequent_id(profile["categories"]) == "3"
+    assert VendorProfilesDB.most_frequent_id(profile.get("budgets")) is None